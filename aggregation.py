@@ -0,0 +1,143 @@
+# aggregation.py - merge repeated alerts into one per (detection, entity) and time window
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from ingest import parse_ts
+
+MAX_SAMPLES = 5  # distinct pieces of evidence kept per aggregate
+
+
+class Aggregate:
+    """One open window of alerts sharing a key"""
+    __slots__ = ('key', 'bucket', 'alert', 'count', 'first_ts', 'last_ts', 'samples', 'seq', 'table')
+
+    def __init__(self, key, bucket, alert, ts, seq):
+        self.key = key
+        self.bucket = bucket
+        self.alert = alert
+        self.count = 0
+        self.first_ts = ts
+        self.last_ts = ts
+        self.samples = []
+        self.seq = seq
+        self.table = None  # partition the aggregate was stored in, for the database engine
+
+    def to_alert(self):
+        """The first alert with count, first_seen/last_seen (ISO-8601 UTC) and sampled evidence added"""
+        alert = dict(self.alert)
+        alert['count'] = self.count
+        alert['first_seen'] = iso_time(self.first_ts)
+        alert['last_seen'] = iso_time(self.last_ts)
+        alert['samples'] = list(self.samples)
+        return alert
+
+
+class AlertAggregator:
+    """Collapses alerts with the same key into one per tumbling event-time window.
+
+    add() returns the window's Aggregate and whether this alert opened it;
+    callers store new aggregates and update the ones they already stored.
+    An aggregate closes once an alert from a later window arrives for its key
+    or the whole aggregator has moved `window` seconds past it; expire()
+    returns and forgets the closed ones. At most max_open aggregates stay
+    open, the least recently updated are closed first. Every aggregate gets
+    a sequence number unique within this aggregator, so one that is closed
+    early and opened again never merges into the old one.
+    """
+
+    def __init__(self, window=300, max_samples=MAX_SAMPLES, max_open=100000):
+        self.window = window
+        self.max_samples = max_samples
+        self.max_open = max_open
+        self.latest = None
+        self._horizon = None
+        self._open = OrderedDict()
+        self._closed = []
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._open)
+
+    def add(self, key, ts, alert, evidence=None):
+        bucket = int(ts // self.window)
+        agg = self._open.get(key)
+        created = agg is None or agg.bucket != bucket
+        if created:
+            if agg is not None:
+                self._closed.append(agg)
+            self._seq += 1
+            agg = Aggregate(key, bucket, alert, ts, self._seq)
+            self._open[key] = agg
+            while len(self._open) > self.max_open:
+                self._closed.append(self._open.popitem(last=False)[1])
+        self._open.move_to_end(key)
+        agg.count += 1
+        agg.first_ts = min(agg.first_ts, ts)
+        agg.last_ts = max(agg.last_ts, ts)
+        if evidence is not None and len(agg.samples) < self.max_samples and evidence not in agg.samples:
+            agg.samples.append(evidence)
+        if self.latest is None or ts > self.latest:
+            self.latest = ts
+        return agg, created
+
+    def expire(self):
+        """Close and return the aggregates whose window ended a full window before the latest alert"""
+        if self.latest is not None:
+            horizon = int(self.latest // self.window) - 1
+            if self._horizon is None or horizon > self._horizon:  # only scan when a window has ended
+                self._horizon = horizon
+                for key in [k for k, agg in self._open.items() if agg.bucket < horizon]:
+                    self._closed.append(self._open.pop(key))
+        closed, self._closed = self._closed, []
+        return closed
+
+    def discard(self, predicate):
+        """Forget the open aggregates predicate(agg) is true for, without returning them"""
+        for key in [k for k, agg in self._open.items() if predicate(agg)]:
+            del self._open[key]
+
+    def flush(self):
+        """Close and return every aggregate"""
+        closed = self._closed + list(self._open.values())
+        self._open.clear()
+        self._closed = []
+        return closed
+
+    def clear(self):
+        self._open.clear()
+        self._closed = []
+        self.latest = self._horizon = None
+
+
+def iso_time(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def alert_time(alert, default):
+    """Epoch seconds of an alert's ts, or default when it has none that parses"""
+    try:
+        return parse_ts(alert['ts']).timestamp()
+    except Exception:
+        return default
+
+
+def aggregate_alerts(alerts, aggregator, clock=None, flush=True):
+    """Merge a stream of detector alerts per (detection, entity) and window.
+
+    Yields one alert per aggregate (see Aggregate.to_alert) once its window has
+    closed, and with flush the rest at the end of the stream; without it they
+    stay open in aggregator. Alerts without a usable ts are placed at clock()
+    (the time they are seen) when given, else at the latest time seen so far.
+    """
+    for alert in alerts:
+        default = clock() if clock else (aggregator.latest or 0)
+        aggregator.add((alert.get('detection'), alert.get('entity')), alert_time(alert, default), alert,
+                       alert.get('evidence'))
+        yield from closed_alerts(aggregator.expire())
+    if flush:
+        yield from closed_alerts(aggregator.flush())
+
+
+def closed_alerts(aggregates):
+    """Aggregates as alerts, in the order they were opened"""
+    return [agg.to_alert() for agg in sorted(aggregates, key=lambda a: a.seq)]
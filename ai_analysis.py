@@ -0,0 +1,380 @@
+# ai_analysis.py - LLM review of alerts, deduplicated, cached and batched
+import hashlib
+import http.client
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Parts of a log line that differ between otherwise identical alerts
+VOLATILE = re.compile(r'''
+    [0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}   # uuids
+  | \b\d{1,3}(?:\.\d{1,3}){3}\b                                      # IPv4 addresses
+  | \b0x[0-9a-f]+\b | \b[0-9a-f]{16,}\b                              # hex ids and hashes
+  | \d+
+''', re.I | re.X)
+
+SYSTEM_PROMPT = (
+    'You are a SOC analyst reviewing alerts from a threat detection system. For each numbered '
+    'alert give a one or two sentence verdict: whether it is likely a true positive, what the '
+    'attacker is attempting and the first response step. Reply with only a JSON array of '
+    'objects {"n": <alert number>, "verdict": "<text>"}, one per alert.'
+)
+
+
+class ModelError(Exception):
+    pass
+
+
+def normalize_evidence(text):
+    """Lowercase text with numbers, addresses and ids masked and whitespace collapsed"""
+    return ' '.join(VOLATILE.sub('#', (text or '').lower()).split())
+
+
+def fingerprint(alert):
+    """Content hash shared by alerts that only differ in volatile details"""
+    key = f"{alert.get('detection') or ''}\x00{normalize_evidence(alert.get('log_data'))}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+class ChatModel:
+    """An OpenAI-compatible chat completions endpoint; many alerts go in one request"""
+    path = '/v1/chat/completions'
+
+    def __init__(self, url, model, api_key=None, temperature=0.0):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        path = parts.path.rstrip('/')
+        self.request_path = path if path.endswith('/chat/completions') else path + self.path
+        self.model = model
+        self.temperature = temperature
+        self.headers = {'Content-Type': 'application/json'}
+        if api_key:
+            self.headers['Authorization'] = f'Bearer {api_key}'
+
+    def connect(self, timeout):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=timeout)
+
+    def encode(self, alerts):
+        lines = [f"{n}. [{a.get('severity') or ''}] {a.get('detection') or ''} from "
+                 f"{a.get('source_ip') or 'unknown'}: {(a.get('log_data') or '')[:1000]}"
+                 for n, a in enumerate(alerts, 1)]
+        return json.dumps({
+            'model': self.model,
+            'temperature': self.temperature,
+            'messages': [{'role': 'system', 'content': SYSTEM_PROMPT},
+                         {'role': 'user', 'content': '\n'.join(lines)}],
+        }).encode()
+
+    def verdicts(self, status, body, count):
+        """count verdicts in alert order (None where the model gave none)"""
+        if status == 429 or status >= 500:
+            return None  # retryable
+        if not 200 <= status < 300:
+            raise ModelError(f'model request failed: HTTP {status} {body[:200]!r}')
+        content = json.loads(body)['choices'][0]['message']['content']
+        start, end = content.find('['), content.rfind(']')
+        if start < 0 or end < start:
+            raise ModelError(f'model reply is not a JSON array: {content[:200]!r}')
+        verdicts = [None] * count
+        for item in json.loads(content[start:end + 1]):
+            n = item.get('n') if isinstance(item, dict) else None
+            if isinstance(n, int) and 1 <= n <= count and item.get('verdict'):
+                verdicts[n - 1] = str(item['verdict']).strip()
+        return verdicts
+
+
+def model_from_env(environ=os.environ):
+    """ChatModel configured through ZOCK_AI_URL, ZOCK_AI_MODEL and ZOCK_AI_API_KEY, or None"""
+    if not environ.get('ZOCK_AI_URL'):
+        return None
+    return ChatModel(environ['ZOCK_AI_URL'], environ.get('ZOCK_AI_MODEL', 'gpt-4o-mini'),
+                     api_key=environ.get('ZOCK_AI_API_KEY'))
+
+
+class VerdictCache:
+    """Model verdicts by alert fingerprint in SQLite, with a TTL and LRU eviction.
+
+    Entries expire ttl seconds after they were written. Once the table grows
+    10% past max_entries, the least recently used entries are dropped back
+    down to max_entries.
+    """
+
+    def __init__(self, pool, ttl=7 * 86400, max_entries=100000):
+        self.pool = pool
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._size = None  # counted on the first put_many(), so opening the cache reads nothing
+
+    def init_db(self):
+        with self.pool.write() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ai_verdicts (
+                    fingerprint TEXT PRIMARY KEY,
+                    verdict TEXT NOT NULL,
+                    created INTEGER NOT NULL,
+                    last_used INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ai_verdicts_last_used ON ai_verdicts(last_used)')
+
+    def get_many(self, fingerprints):
+        """{fingerprint: verdict} for the fingerprints with a live entry"""
+        now = int(time.time())
+        keys = json.dumps(list(fingerprints))
+        with self.pool.reader() as conn:
+            found = dict(conn.execute('''
+                SELECT fingerprint, verdict FROM ai_verdicts
+                WHERE fingerprint IN (SELECT value FROM json_each(?)) AND created > ?
+            ''', (keys, now - self.ttl)).fetchall())
+        if found:
+            with self.pool.write() as conn:
+                conn.execute('UPDATE ai_verdicts SET last_used = ? WHERE fingerprint IN (SELECT value FROM json_each(?))',
+                             (now, json.dumps(list(found))))
+        return found
+
+    def put_many(self, verdicts):
+        now = int(time.time())
+        with self.pool.write() as conn:
+            conn.executemany('''
+                INSERT INTO ai_verdicts (fingerprint, verdict, created, last_used) VALUES (?, ?, ?, ?)
+                ON CONFLICT(fingerprint) DO UPDATE SET verdict = excluded.verdict,
+                    created = excluded.created, last_used = excluded.last_used
+            ''', [(fp, verdict, now, now) for fp, verdict in verdicts.items()])
+            if self._size is None:
+                self._size = conn.execute('SELECT COUNT(*) FROM ai_verdicts').fetchone()[0]
+            else:
+                self._size += len(verdicts)
+            if self._size > self.max_entries * 1.1:
+                self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute('DELETE FROM ai_verdicts WHERE created <= ?', (now - self.ttl,))
+        conn.execute('''
+            DELETE FROM ai_verdicts WHERE fingerprint IN (
+                SELECT fingerprint FROM ai_verdicts ORDER BY last_used DESC LIMIT -1 OFFSET ?)
+        ''', (self.max_entries,))
+        self._size = conn.execute('SELECT COUNT(*) FROM ai_verdicts').fetchone()[0]
+
+
+class AIAnalyzer:
+    """Background model review of alerts whose ai_analysis is still empty.
+
+    A dispatcher thread pages pending alerts with fetch(after_id, limit) and
+    groups them by fingerprint. Verdicts already in the cache are recorded
+    straight away. Fingerprints already waiting for the model absorb the new
+    alert ids, so a flood of near-identical alerts costs one model call. The
+    other fingerprints are queued once each. `concurrency` worker threads send
+    up to batch_size of them per model request and retry transient failures
+    with backoff. Each verdict is cached and written to every alert that shares
+    the fingerprint through record(ids, text). Alerts whose request failed, or
+    whose verdict record() could not store, are kept and offered again after retry_interval seconds; the cursor never goes
+    back, so a retry neither rescans the table nor queues alerts in flight.
+    """
+
+    def __init__(self, model, cache, fetch, record, notifier=None, batch_size=20, concurrency=2,
+                 queue_size=10000, page_size=1000, max_retries=3, backoff=1.0, max_backoff=30.0,
+                 timeout=60.0, poll_interval=5.0, retry_interval=300.0):
+        self.model = model
+        self.cache = cache
+        self.fetch = fetch
+        self.record = record
+        self.notifier = notifier
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.analyzed = 0
+        self.cache_hits = 0
+        self.deduplicated = 0
+        self.model_calls = 0
+        self.failed = 0
+        self.last_error = None
+        self._cursor = 0
+        self._retry_at = None
+        self._pending = {}  # fingerprint -> (sample alert, [alert ids])
+        self._failed = {}  # fingerprint -> (sample alert, [alert ids]), offered again at _retry_at
+        self._queue = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._dispatch, name='ai-dispatch', daemon=True)]
+        self._threads += [threading.Thread(target=self._work_loop, name=f'ai-{i}', daemon=True)
+                          for i in range(concurrency)]
+        for t in self._threads:
+            t.start()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'model': self.model.model,
+                'queue_depth': self._queue.qsize(),
+                'in_flight': len(self._pending),
+                'analyzed': self.analyzed,
+                'cache_hits': self.cache_hits,
+                'deduplicated': self.deduplicated,
+                'model_calls': self.model_calls,
+                'failed': self.failed,
+                'last_error': self.last_error,
+            }
+
+    def close(self, timeout=5.0):
+        self._stop.set()
+        if self.notifier is not None:
+            self.notifier.publish('ai-stop')
+        for t in self._threads:
+            t.join(timeout)
+
+    def _dispatch(self):
+        seq = self.notifier.seq if self.notifier is not None else 0
+        while not self._stop.is_set():
+            with self._lock:
+                failed = {}
+                if self._retry_at is not None and time.monotonic() >= self._retry_at:
+                    self._retry_at = None
+                    failed, self._failed = self._failed, {}
+            if failed:
+                try:
+                    self._offer_groups(failed, retry=True)
+                except Exception as e:
+                    self._note_error(e)
+                    with self._lock:
+                        self._retry_later(failed)  # the groups not yet recorded or queued
+            try:
+                alerts = self.fetch(self._cursor, self.page_size)
+                if alerts:
+                    self._offer(alerts)
+                    self._cursor = alerts[-1]['id']
+            except Exception as e:
+                alerts = []
+                self._note_error(e)
+            if len(alerts) == self.page_size:
+                continue
+            if self.notifier is not None:
+                seq, _ = self.notifier.wait(seq, self.poll_interval)
+            else:
+                self._stop.wait(self.poll_interval)
+
+    def _offer(self, alerts):
+        groups = {}
+        for alert in alerts:
+            groups.setdefault(fingerprint(alert), (alert, []))[1].append(alert['id'])
+        self._offer_groups(groups)
+
+    def _offer_groups(self, groups, retry=False):
+        """Record cached verdicts for {fingerprint: (sample alert, ids)} and queue the rest"""
+        for fp, verdict in self.cache.get_many(groups).items():
+            ids = groups[fp][1]
+            self.record(ids, verdict)
+            del groups[fp]
+            with self._lock:
+                self.cache_hits += len(ids)
+                self.analyzed += len(ids)
+        new = []
+        with self._lock:
+            for fp, (sample, ids) in groups.items():
+                if fp in self._pending:
+                    self._pending[fp][1].extend(ids)
+                    self.deduplicated += 0 if retry else len(ids)
+                else:
+                    self._pending[fp] = (sample, ids)
+                    self.deduplicated += 0 if retry else len(ids) - 1
+                    new.append(fp)
+        for fp in new:
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(fp, timeout=0.5)
+                    break
+                except queue.Full:
+                    pass
+
+    def _work_loop(self):
+        conn = None
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._lock:
+                samples = [self._pending[fp][0] for fp in batch]
+            conn, verdicts = self._analyze(conn, samples)
+            done = {fp: v for fp, v in zip(batch, verdicts) if v}
+            if done:
+                try:
+                    self.cache.put_many(done)
+                except Exception as e:
+                    self._note_error(e)
+            with self._lock:
+                entries = [(fp, *self._pending.pop(fp)) for fp in batch]
+            for fp, sample, ids in entries:
+                if fp in done:
+                    try:
+                        self.record(ids, done[fp])
+                    except Exception as e:
+                        # The verdict is cached, so the retry records it without the model
+                        self._note_error(e)
+                        with self._lock:
+                            self._retry_later({fp: (sample, ids)})
+                        continue
+                    with self._lock:
+                        self.analyzed += len(ids)
+                else:
+                    with self._lock:
+                        self.failed += len(ids)
+                        self._retry_later({fp: (sample, ids)})
+        if conn is not None:
+            conn.close()
+
+    def _retry_later(self, groups):
+        """Offer {fingerprint: (sample alert, ids)} again at the next retry; call with self._lock held"""
+        for fp, (sample, ids) in groups.items():
+            self._failed.setdefault(fp, (sample, []))[1].extend(ids)
+        if self._retry_at is None:
+            self._retry_at = time.monotonic() + self.retry_interval
+
+    def _analyze(self, conn, alerts):
+        """One model request for alerts, with retries; returns (connection, verdicts)"""
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._stop.wait(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            try:
+                if conn is None:
+                    conn = self.model.connect(self.timeout)
+                conn.request('POST', self.model.request_path, body=self.model.encode(alerts),
+                             headers=self.model.headers)
+                response = conn.getresponse()
+                body = response.read()
+                with self._lock:
+                    self.model_calls += 1
+                verdicts = self.model.verdicts(response.status, body, len(alerts))
+                if verdicts is not None:
+                    return conn, verdicts
+                self._note_error(f'model asked for a retry: HTTP {response.status}')
+            except (ModelError, ValueError, KeyError, IndexError, TypeError) as e:
+                self._note_error(e)
+                break
+            except (OSError, http.client.HTTPException) as e:
+                if conn is not None:
+                    conn.close()
+                conn = None
+                self._note_error(e)
+        return conn, [None] * len(alerts)
+
+    def _note_error(self, error):
+        with self._lock:
+            self.last_error = str(error)
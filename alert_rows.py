@@ -0,0 +1,110 @@
+# alert_rows.py - alert dicts to and from stored rows, without the web app
+import json
+import time
+from datetime import datetime
+from functools import lru_cache
+
+from ingest import parse_ts
+from storage import ALERT_COLUMNS
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+INGEST_BATCH_ROWS = 5000  # rows per group-commit batch when ingesting
+SQLITE_INT_MAX = 2 ** 63 - 1
+
+
+def event_time(value):
+    """(local TIMESTAMP_FORMAT text, epoch seconds) for an ISO-8601, app-format or epoch timestamp"""
+    if not value:
+        value = time.time()
+    try:
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value).strftime(TIMESTAMP_FORMAT), int(value)
+        return _parse_event_time(str(value))
+    except (OverflowError, OSError):  # out of the platform's time_t range
+        raise ValueError(f'timestamp out of range: {value!r}')
+
+
+@lru_cache(maxsize=4096)  # bulk ingests repeat the same second many times
+def _parse_event_time(value):
+    if len(value) == 19 and value[10] == ' ':
+        dt = datetime.strptime(value, TIMESTAMP_FORMAT)  # already in TIMESTAMP_FORMAT
+    else:
+        dt = parse_ts(value.replace(' ', 'T', 1))
+        if dt.tzinfo is not None:
+            return dt.astimezone().strftime(TIMESTAMP_FORMAT), int(dt.timestamp())
+    return dt.strftime(TIMESTAMP_FORMAT), int(dt.timestamp())
+
+
+def _text(value, name):
+    """An alert field as stored text; anything but a string or integer is rejected"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError(f'{name} must be a string')
+
+
+def _count(value):
+    if value is None:
+        return 1
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError('count must be an integer')
+    count = int(value)
+    if not 1 <= count <= SQLITE_INT_MAX:
+        raise ValueError(f'count must be between 1 and {SQLITE_INT_MAX}')
+    return count
+
+
+def alert_row(alert):
+    """Map a dashboard-style or detector-style alert dict onto ALERT_COLUMNS.
+
+    Raises ValueError for an alert that cannot be stored as it is: a field
+    that is not a string or integer, or a count outside SQLite's integer range.
+    """
+    evidence = alert.get('evidence') or {}
+    if not isinstance(evidence, dict):
+        raise ValueError('evidence must be an object')
+    detection = _text(alert.get('detection') or alert.get('threat_type'), 'detection')
+    if not detection:
+        raise ValueError('alert has no detection or threat_type')
+    source_ip = _text(alert.get('source_ip') or evidence.get('src_ip'), 'source_ip')
+    owasp = alert.get('owasp_category') or alert.get('owasp')
+    if isinstance(owasp, list):
+        owasp = ', '.join(_text(o, 'owasp_category') for o in owasp)
+    log_data = alert.get('log_data') or evidence.get('msg') or (json.dumps(evidence) if evidence else None)
+    timestamp, ts = event_time(alert.get('timestamp') or alert.get('ts'))
+    samples = alert.get('samples')
+    row = {
+        'timestamp': timestamp,
+        'threat_type': _text(alert.get('threat_type'), 'threat_type') or detection,
+        'detection': detection,
+        'severity': (_text(alert.get('severity'), 'severity') or 'Medium').capitalize(),
+        'source_ip': source_ip,
+        'entity': _text(alert.get('entity'), 'entity') or source_ip,
+        'owasp_category': _text(owasp, 'owasp_category'),
+        'log_data': _text(log_data, 'log_data'),
+        'ai_analysis': _text(alert.get('ai_analysis'), 'ai_analysis'),
+        'siem_sent': int(bool(alert.get('siem_sent'))),
+        'siem_platforms': _text(alert.get('siem_platforms'), 'siem_platforms') or 'Pending',
+        'ts': ts,
+        'count': _count(alert.get('count') or None),  # set on alerts aggregated before ingest
+        'last_ts': event_time(alert['last_seen'])[1] if alert.get('last_seen') else ts,
+        'samples': json.dumps(samples) if samples else None,
+        'agg_key': None,
+    }
+    return tuple(row[c] for c in ALERT_COLUMNS)
+
+
+def alert_user(alert):
+    """The user an alert's evidence names, or None"""
+    evidence = alert.get('evidence')
+    user = evidence.get('user') if isinstance(evidence, dict) else None
+    return user if isinstance(user, str) and user else None
+
+
+def alert_dict(row):
+    """A stored alert row (id, *ALERT_COLUMNS) as the API returns it"""
+    alert = dict(zip(('id',) + ALERT_COLUMNS, row))
+    alert['siem_sent'] = bool(alert['siem_sent'])
+    alert['samples'] = json.loads(alert['samples']) if alert['samples'] else []
+    return alert
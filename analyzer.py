@@ -0,0 +1,229 @@
+import argparse
+import math
+import os
+import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from ingest import read_jsonl, parse_jsonl, iter_lines, iter_range_lines, shard_ranges, is_compressed
+from aggregation import AlertAggregator, aggregate_alerts
+from batch_detect import detect_lines
+from detectors import RULES, run_rules
+from anomaly import WindowedZScore, anomaly_alert, event_time
+from serialization import JSONLWriter, loads
+from sketches import AlertSketches
+from state_store import DEFAULT_MAX_ENTRIES, StateStore, entries_for_budget
+
+MIN_SHARD_BYTES = 4 << 20  # smaller inputs are not worth a process pool
+
+
+def analyze_logs(input_path="sample_logs.jsonl", out_path="alerts.jsonl", z_threshold=3.0, workers=1,
+                 online=None, batch=False, aggregate=None, max_entities=DEFAULT_MAX_ENTRIES):
+    """Run detections over input_path and write alerts to out_path as JSON lines.
+
+    workers > 1 splits a plain input file into newline-aligned byte ranges and
+    scans them in a process pool; the result is identical to workers=1.
+    Passing a WindowedZScore as `online` scores anomalies per event-time window
+    while scanning (single process) instead of in a pass over the whole file.
+    batch=True detects over columnar batches of events (see batch_detect)
+    rather than one event at a time, with the same output; online scoring is
+    always per event. aggregate (seconds) merges the alerts of every mode per
+    detection, entity and window in a final pass (see aggregation).
+    Per-IP counts keep at most max_entities IPs in memory and spill the rest
+    to a temporary SQLite file (see state_store), with the same output.
+    The summary includes heavy-hitter sources and distinct sources and users
+    per detection and hour (see sketches).
+    """
+    if aggregate:
+        raw_path = f"{out_path}.raw"
+        try:
+            summary = analyze_logs(input_path, raw_path, z_threshold, workers, online, batch,
+                                   max_entities=max_entities)
+            summary = dict(_aggregate_file(raw_path, out_path, aggregate), raw_alerts_count=summary["alerts_count"],
+                           entity_state=summary["entity_state"], sketches=summary["sketches"])
+        finally:
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+        return summary
+
+    sketches = AlertSketches()
+    if online is not None:
+        with open(out_path, "wb") as f, JSONLWriter(f) as out:
+            try:
+                counts_by_detection = _scan(read_jsonl(input_path), out, None, sketches, online)
+                state = online.stats()
+            finally:
+                online.close()
+        return {"alerts_count": sum(counts_by_detection.values()), "counts_by_detection": dict(counts_by_detection),
+                "entity_state": state, "sketches": sketches.summary()}
+
+    counts = StateStore(max_entities, spill=True)
+    try:
+        if workers > 1 and _shardable(input_path):
+            counts_by_detection = _analyze_sharded(input_path, out_path, workers, counts, sketches, batch)
+        else:
+            with open(out_path, "wb") as f, JSONLWriter(f) as out:
+                if batch:
+                    counts_by_detection = _scan_batched(iter_lines(input_path), out, counts, sketches)
+                else:
+                    counts_by_detection = _scan(read_jsonl(input_path), out, counts, sketches)
+
+        with open(out_path, "ab") as f, JSONLWriter(f) as out:
+            for a in score_anomalies(counts, z_threshold):
+                out.write(a)
+                counts_by_detection[a["detection"]] += 1
+                sketches.add_alert(a)
+        state = counts.stats()
+    finally:
+        counts.close()
+
+    return {"alerts_count": sum(counts_by_detection.values()), "counts_by_detection": dict(counts_by_detection),
+            "entity_state": state, "sketches": sketches.summary()}
+
+
+def _aggregate_file(raw_path, out_path, window):
+    counts_by_detection = Counter()
+    with open(out_path, "wb") as f, JSONLWriter(f) as out:
+        alerts = (loads(line) for line in iter_lines(raw_path) if line.strip())
+        for a in aggregate_alerts(alerts, AlertAggregator(window)):
+            out.write(a)
+            counts_by_detection[a["detection"]] += 1
+    return {"alerts_count": sum(counts_by_detection.values()), "counts_by_detection": dict(counts_by_detection)}
+
+
+def _scan(events, out, counts, sketches, online=None):
+    """Detect over events, writing alerts to a JSONLWriter and AlertSketches and counting events
+    per IP into the StateStore counts (unless scoring online); return per-detection counts"""
+    counts_by_detection = Counter()
+    for e in events:
+        alerts = run_rules(e)
+        ip = e.get("src_ip") or "unknown"
+        if online is None:
+            counts.add(ip)
+        else:
+            hit = online.observe(ip, event_time(e))
+            if hit:
+                alerts.append(anomaly_alert(ip, *hit, ts=e.get("ts")))
+        for a in alerts:
+            out.write(a)
+            counts_by_detection[a["detection"]] += 1
+            sketches.add_alert(a)
+    return counts_by_detection
+
+
+def _scan_batched(lines, out, counts, sketches):
+    """_scan() over JSON lines, a columnar batch at a time"""
+    counts_by_detection = Counter()
+    for batch, alerts in detect_lines(lines):
+        for ip, c in batch.ip_counts().items():
+            counts.add(ip, c)
+        for a in alerts:
+            out.write(a)
+            counts_by_detection[a["detection"]] += 1
+            sketches.add_alert(a)
+    return counts_by_detection
+
+
+def _scan_shard(input_path, start, end, part_path, max_entities, rules_path, batch=False):
+    """Scan one byte range; its per-IP counts are handed back in the spill file part_path.state,
+    its per-detection counts and AlertSketches are returned"""
+    if RULES.pack.path != rules_path:  # a worker started afresh rather than forked
+        RULES.load(rules_path)
+    if os.path.exists(f"{part_path}.state"):
+        os.remove(f"{part_path}.state")  # left over from an interrupted run
+    counts = StateStore(max_entities, spill=f"{part_path}.state")
+    sketches = AlertSketches()
+    try:
+        with open(part_path, "wb") as f, JSONLWriter(f) as out:
+            lines = iter_range_lines(input_path, start, end)
+            if batch:
+                dets = _scan_batched(lines, out, counts, sketches)
+            else:
+                dets = _scan(parse_jsonl(lines), out, counts, sketches)
+        counts.flush()
+    finally:
+        counts.close()
+    return dets, sketches
+
+
+def _shardable(input_path):
+    return (input_path != "-" and not is_compressed(input_path)
+            and os.path.getsize(input_path) >= MIN_SHARD_BYTES)
+
+
+def _analyze_sharded(input_path, out_path, workers, counts, sketches, batch=False):
+    ranges = shard_ranges(input_path, workers)
+    parts = [f"{out_path}.part{i}" for i in range(len(ranges))]
+    counts_by_detection = Counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_scan_shard, [input_path] * len(ranges),
+                               [r[0] for r in ranges], [r[1] for r in ranges], parts,
+                               [counts.max_entries] * len(ranges), [RULES.pack.path] * len(ranges),
+                               [batch] * len(ranges))
+            # Shards come back in file order, so merging keeps first-seen IP
+            # order and the alert order of a single-process run.
+            for part, (shard_dets, shard_sketches) in zip(parts, results):
+                shard_counts = StateStore(counts.max_entries, spill=f"{part}.state")
+                try:
+                    for ip, c in shard_counts.items():
+                        counts.add(ip, c)
+                finally:
+                    shard_counts.close()
+                counts_by_detection.update(shard_dets)
+                sketches.merge(shard_sketches)
+        with open(out_path, "wb") as out:
+            for part in parts:
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out)
+    finally:
+        for part in parts:
+            for path in (part, f"{part}.state"):
+                if os.path.exists(path):
+                    os.remove(path)
+    return counts_by_detection
+
+
+def score_anomalies(counts, z_threshold=3.0):
+    """Anomaly alerts for the IPs whose count is z_threshold sample deviations above the mean;
+    counts is a mapping or StateStore, read in two passes instead of being copied"""
+    n = total = total_sq = 0
+    for c in counts.values():
+        n += 1
+        total += c
+        total_sq += c * c
+    if n >= 2:
+        mu = total / n
+        sd = math.sqrt((n * total_sq - total * total) / (n * (n - 1)))  # exact integer sums, as statistics.stdev
+        if sd > 0:
+            for ip, c in counts.items():
+                z = (c - mu) / sd
+                if z >= z_threshold:
+                    yield anomaly_alert(ip, c, z)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Analyze JSONL logs for threats")
+    ap.add_argument("input", nargs="?", default="sample_logs.jsonl")
+    ap.add_argument("-o", "--output", default="alerts.jsonl")
+    ap.add_argument("-z", "--z-threshold", type=float, default=3.0)
+    ap.add_argument("-j", "--workers", type=int, default=1,
+                    help="processes to shard the input across (0 = all cores)")
+    ap.add_argument("--online", action="store_true",
+                    help="score anomalies per event-time window while scanning")
+    ap.add_argument("--batch", action="store_true",
+                    help="detect over columnar batches of events (faster for large backfills)")
+    ap.add_argument("-w", "--window", type=int, default=300, help="online window length in seconds")
+    ap.add_argument("--state", help="file to persist online anomaly baselines across restarts")
+    ap.add_argument("--aggregate", type=int, metavar="SECONDS",
+                    help="merge repeats of a detection per entity within windows of this length")
+    ap.add_argument("--state-memory", type=float, metavar="MB",
+                    help="memory for per-IP state; colder IPs spill to disk (default: %d IPs)" % DEFAULT_MAX_ENTRIES)
+    ap.add_argument("--rules", help="rule pack (JSON, or YAML with PyYAML) instead of $ZOCK_RULES or rules.json")
+    args = ap.parse_args()
+    if args.rules:
+        RULES.load(args.rules)
+    max_entities = entries_for_budget(args.state_memory) if args.state_memory else DEFAULT_MAX_ENTRIES
+    online = (WindowedZScore(args.window, args.z_threshold, state_path=args.state, max_entities=max_entities)
+              if args.online else None)
+    print(analyze_logs(args.input, args.output, args.z_threshold, args.workers or os.cpu_count(), online,
+                       args.batch, args.aggregate, max_entities))
@@ -0,0 +1,165 @@
+# anomaly.py - online z-score detection over per-entity event counts
+import json
+import math
+import os
+import time
+
+from detectors import owasp_for, recommendations_for, severity_for
+from ingest import parse_ts
+from state_store import DEFAULT_MAX_ENTRIES, StateStore
+
+ANOMALY = "Behavioral anomaly"  # severity, OWASP categories and recommendations come from the rule pack
+
+
+def event_time(evt):
+    """Epoch seconds of the event's ts, so replaying a log scores it in the
+    windows it was written in; the wall clock when ts does not parse"""
+    try:
+        return parse_ts(evt["ts"]).timestamp()
+    except (KeyError, TypeError, ValueError, OverflowError, OSError):
+        return time.time()
+
+
+def anomaly_alert(entity, count, z, ts=None, pack=None, count_key="count"):
+    """The alert for an entity whose count of events has a z-score of z; count_key names what was counted"""
+    return {
+        "ts": ts,
+        "detection": ANOMALY,
+        "severity": severity_for(ANOMALY, pack=pack),
+        "entity": entity,
+        "evidence": {count_key: count, "zscore": round(z, 2)},
+        "owasp": owasp_for(ANOMALY, pack),
+        "recommendations": recommendations_for(ANOMALY, pack)
+    }
+
+
+class WindowedZScore:
+    """Incremental z-score over per-entity counts in tumbling event-time windows.
+
+    Every observe() is O(1): it bumps the entity's count for the current window
+    and compares it with the baseline, so an anomaly is reported the moment an
+    entity crosses the threshold instead of after the whole input was read.
+
+    The baseline is a Welford running mean/variance of per-entity counts from
+    closed windows. Until min_samples of those exist, the entities of the
+    current window are compared with each other (the same statistic as the old
+    batch pass, kept up to date with running sums) once at least min_samples
+    entities were seen. Entities below min_count events are never flagged, so
+    the first few events of a window cannot trip the threshold. Events older than the
+    current window are counted into it. With state_path set, the baseline and
+    the open window are saved on every window roll and on save()/close() and
+    restored on start-up.
+
+    The window's counts live in a StateStore of at most max_entities entries.
+    Past that, the least recently seen entities are spilled to disk with
+    spill set (see StateStore), otherwise dropped from the window and its
+    statistic, so a sweep of spoofed source addresses cannot exhaust memory.
+    """
+
+    def __init__(self, window_seconds=300, z_threshold=3.0, min_samples=30, min_count=10, state_path=None,
+                 max_entities=DEFAULT_MAX_ENTRIES, spill=False):
+        self.window_seconds = window_seconds
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.min_count = min_count
+        self.state_path = state_path
+        # Welford accumulators over closed windows
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        # Open window
+        self.bucket = None
+        self.counts = StateStore(max_entities, spill=spill, on_drop=self._dropped)
+        self.flagged = set()
+        self.total = 0
+        self.total_sq = 0
+        if state_path and os.path.exists(state_path):
+            self._load()
+
+    def observe(self, entity, ts):
+        """Count one event for entity at epoch time ts; return (count, z) if it just became anomalous"""
+        bucket = int(ts // self.window_seconds)
+        if self.bucket is None:
+            self.bucket = bucket
+        elif bucket > self.bucket:
+            self._roll(bucket)
+
+        c = self.counts.add(entity)
+        self.total += 1
+        self.total_sq += 2 * c - 1  # c^2 - (c-1)^2
+
+        if c < self.min_count or entity in self.flagged:
+            return None
+        z = self.zscore(c)
+        if z is not None and z >= self.z_threshold:
+            self.flagged.add(entity)
+            return c, z
+        return None
+
+    def zscore(self, count):
+        if self.n >= self.min_samples:
+            mu, var = self.mean, self.m2 / (self.n - 1)
+        else:
+            k = len(self.counts)
+            if k < max(self.min_samples, 2):
+                return None
+            mu = self.total / k
+            var = self.total_sq / k - mu * mu
+        if var <= 0:
+            return None
+        return (count - mu) / math.sqrt(var)
+
+    def _roll(self, bucket):
+        for c in self.counts.values():
+            self.n += 1
+            delta = c - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (c - self.mean)
+        self.bucket = bucket
+        self.counts.clear()
+        self.flagged = set()
+        self.total = 0
+        self.total_sq = 0
+        if self.state_path:
+            self.save()
+
+    def save(self):
+        state = {
+            "window_seconds": self.window_seconds,
+            "n": self.n, "mean": self.mean, "m2": self.m2,
+            "bucket": self.bucket,
+            "counts": dict(self.counts.items()),
+            "flagged": sorted(self.flagged),
+        }
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def close(self):
+        if self.state_path:
+            self.save()
+        self.counts.close()
+
+    def stats(self):
+        return self.counts.stats()
+
+    def _dropped(self, entity, count):
+        self.total -= count
+        self.total_sq -= count * count
+        self.flagged.discard(entity)
+
+    def _load(self):
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("window_seconds") != self.window_seconds:
+            return  # baseline was built over a different window size
+        self.n = state["n"]
+        self.mean = state["mean"]
+        self.m2 = state["m2"]
+        self.bucket = state["bucket"]
+        self.flagged = set(state["flagged"])
+        for entity, c in state["counts"].items():
+            self.counts.set(entity, c)
+            self.total += c
+            self.total_sq += c * c
@@ -1,37 +1,157 @@
 # app.py - COMPLETE WORKING VERSION
-from flask import Flask, render_template, request, jsonify
+import time
+IMPORT_STARTED = time.perf_counter()  # startup_report() times the import of this module from here
+from flask import Blueprint, Flask, Response, current_app, g, render_template, request, jsonify
 import sqlite3
+import base64
+import heapq
 import json
 import random
-from datetime import datetime, timedelta
+import sys
+from datetime import datetime
 import os
+import threading
+import uuid
+from detectors import RULES, run_rules
+from ingest import normalize_event
+from collections import Counter
+from storage import ConnectionPool, ALERT_COLUMNS, INSERT_ALERT_SQL, UPSERT_AGGREGATE_SQL
+from alert_rows import INGEST_BATCH_ROWS, TIMESTAMP_FORMAT, alert_dict, alert_row, alert_user, event_time
+from partitions import (AlertPartitions, EXTEND_RANGE_SQL, FILTER_COLUMNS, INDEX_NEW_ROWS_SQL, LEGACY_TABLE,
+                        SCHEMA_VERSION, SchemaError)
+from live import ChangeNotifier, ResponseCache, sse
+from metrics import Metrics
+from siem_forwarder import SIEMForwarder, targets_from_env
+from ai_analysis import AIAnalyzer, VerdictCache, model_from_env
+from aggregation import AlertAggregator
+from serialization import dumps, iter_json_array
+from export import ExportError, export_chunks, filename, media_type
+from sketches import AlertSketches
+from deps import loaded
 
-app = Flask(__name__)
+# Routes; create_app() registers them on a new app
+api = Blueprint('zock', __name__, cli_group=None)
+
+DB_PATH = 'zock.db'
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH = 500
+STREAM_POLL_SECONDS = 5  # also picks up alerts written by other processes
+STREAM_EVENTS = ('siem', 'clear', 'aggregate', 'purge')  # change kinds forwarded to dashboards
+RETENTION_DAYS = int(os.environ.get('ZOCK_RETENTION_DAYS', 30))  # 0 keeps alerts forever
+# Retention skips the alerts adopted from a pre-partitioning database unless set
+PURGE_LEGACY = os.environ.get('ZOCK_PURGE_LEGACY', '') == '1'
+MAINTENANCE_SECONDS = 300  # how often expired partitions are dropped and space reclaimed
+SIEM_SWEEP_SECONDS = 30  # how soon SIEM work another process left in the database is picked up
+AI_CACHE_TTL = int(os.environ.get('ZOCK_AI_CACHE_TTL', 7 * 86400))  # seconds a model verdict is reused
+AI_CACHE_SIZE = int(os.environ.get('ZOCK_AI_CACHE_SIZE', 100000))
+# Detector alerts with the same detection and entity within this many seconds
+# of event time are stored as one row with a count; 0 stores every alert
+AGGREGATE_SECONDS = int(os.environ.get('ZOCK_AGGREGATE_SECONDS', 300))
+# Seconds this process spent starting up, by phase: import, create_app, engine
+STARTUP = {}
+
+def background_lock(path):
+    """A connection holding the lock that makes this process the one running
+    the background stages for the database at path; None when another
+    process holds it. The lock is released when the connection is closed or
+    the process exits."""
+    conn = sqlite3.connect(path + '-background.lock', timeout=0, isolation_level=None, check_same_thread=False)
+    try:
+        conn.execute('BEGIN EXCLUSIVE')
+    except sqlite3.OperationalError:
+        conn.close()
+        return None
+    return conn
+
+def migrate(path=DB_PATH, retention_days=RETENTION_DAYS):
+    """Create or upgrade the database schema: the explicit deploy step run before workers start.
+
+    Returns how many alerts adopted from a pre-partitioning database are past
+    retention_days: kept, but dropped by the next purge once PURGE_LEGACY is set.
+    """
+    pool = ConnectionPool(path, max_readers=1)
+    try:
+        partitions = AlertPartitions(pool, retention_days, purge_legacy=True)
+        partitions.init_db()
+        partitions.current()
+        VerdictCache(pool).init_db()
+        with pool.reader() as conn:
+            if not any(p.name == LEGACY_TABLE for p in partitions.expired(conn)):
+                return 0
+            return conn.execute(f'SELECT COUNT(*) FROM {LEGACY_TABLE}').fetchone()[0]
+    finally:
+        pool.close()
 
 class ZOCKEngine:
-    def __init__(self):
-        self.conn = sqlite3.connect('zock.db', check_same_thread=False)
-        self.init_db()
+    def __init__(self, path=DB_PATH, max_readers=8, siem_targets=None, retention_days=RETENTION_DAYS,
+                 ai_model=None, aggregate_seconds=AGGREGATE_SECONDS, migrate=False, background=True,
+                 purge_legacy=PURGE_LEGACY):
+        """Open the store at path; its schema must be current (see migrate()) unless migrate is set.
+
+        With background set, and unless another process holds background_lock()
+        for path, this engine also runs the stages that must run once per
+        database: SIEM forwarding, AI analysis and partition maintenance.
+        Otherwise it serves requests only; the process that holds the lock
+        finds its writes in the database.
+        """
+        self.pool = ConnectionPool(path, max_readers=max_readers)
+        self.writer = self.pool.writer
+        self.changes = ChangeNotifier()
+        self.metrics = Metrics()
+        self.partitions = AlertPartitions(self.pool, retention_days, on_purge=self._on_purge,
+                                          purge_legacy=purge_legacy)
+        self.verdicts = VerdictCache(self.pool, AI_CACHE_TTL, AI_CACHE_SIZE)
+        self.aggregator = AlertAggregator(aggregate_seconds) if aggregate_seconds else None
+        self._aggregate_lock = threading.Lock()
+        self._aggregate_token = uuid.uuid4().hex[:12]  # agg_keys of this process never match older rows
+        self._sketch_delta = AlertSketches()  # alerts sketched since the last _flush_sketches()
+        self._sketch_lock = threading.Lock()
+        if migrate:
+            self.init_db()
+        else:
+            try:
+                self.partitions.check_schema()
+            except SchemaError:
+                self.pool.close()
+                raise
+        targets = targets_from_env() if siem_targets is None else siem_targets
+        model = model_from_env() if ai_model is None else ai_model
+        self.siem_platforms = [t.name for t in targets]
+        self.ai_enabled = bool(model)
+        self._background_lock = background_lock(path) if background else None
+        self.background = self._background_lock is not None
+        self.forwarders = []
+        self.analyzer = None
+        if self.background:
+            self.forwarders = [SIEMForwarder(t, self.pending_for_siem, self.record_siem_status,
+                                             notifier=self.changes, fetch_aggregates=self.aggregates_for_siem,
+                                             fetch_unsettled=self.unsettled_for_siem,
+                                             sweep_interval=SIEM_SWEEP_SECONDS)
+                               for t in targets]
+            if model:
+                self.analyzer = AIAnalyzer(model, self.verdicts, self.pending_for_ai, self.record_ai_analysis,
+                                           notifier=self.changes)
+            self.partitions.start_maintenance(MAINTENANCE_SECONDS)
+        self._register_metrics()
+        RULES.watch()  # edits to the rule pack apply to the next events ingested
     
     def init_db(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS alerts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT,
-                threat_type TEXT,
-                detection TEXT,
-                severity TEXT,
-                source_ip TEXT,
-                entity TEXT,
-                owasp_category TEXT,
-                log_data TEXT,
-                ai_analysis TEXT,
-                siem_sent BOOLEAN DEFAULT 0,
-                siem_platforms TEXT
-            )
-        ''')
-        self.conn.commit()
+        """Create or migrate the partitioned alert store"""
+        self.partitions.init_db()
+        self.partitions.current()
+        self.verdicts.init_db()
+
+    def close(self):
+        """Stop the background threads, then close the store's connections"""
+        for forwarder in self.forwarders:
+            forwarder.close()
+        if self.analyzer is not None:
+            self.analyzer.close()
+        self.partitions.close()
+        self.pool.close()
+        if self._background_lock is not None:
+            self._background_lock.close()
     
     def generate_sample_alerts(self, count=5):
         """Generate realistic security alerts"""
@@ -46,23 +166,21 @@ class ZOCKEngine:
         ]
         
         alerts = []
+        rows = []
         for i in range(count):
             threat = random.choice(threats)
             source_ip = f"192.168.1.{random.randint(1, 255)}"
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            now = time.time()
+            timestamp = datetime.fromtimestamp(now).strftime(TIMESTAMP_FORMAT)
             
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT INTO alerts (timestamp, threat_type, detection, severity, source_ip, entity, 
-                                  owasp_category, log_data, ai_analysis, siem_sent, siem_platforms)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            rows.append((
                 timestamp, threat['type'], threat['type'],
                 threat['severity'], source_ip, source_ip,
                 threat['owasp'], f"Detected {threat['type']} from {source_ip}",
-                f"AI analysis confirmed {threat['type']} with 96% confidence",
+                None,  # ai_analysis: filled in by the AI analyzer when a model is configured
                 False,  # Start as not sent to SIEM
-                "Pending"
+                "Pending",
+                int(now), 1, int(now), None, None
             ))
             alerts.append({
                 'timestamp': timestamp,
@@ -71,105 +189,962 @@ class ZOCKEngine:
                 'source_ip': source_ip
             })
         
-        self.conn.commit()
+        self.write_alerts(rows)
         return alerts
+
+    def write_alerts(self, rows):
+        """Insert ALERT_COLUMNS rows and their dashboard counters in one group commit"""
+        if rows:
+            self.writer.wait(self.submit_alerts(rows))
+            self._flush_sketches()
+            self.changes.publish('insert')
+        return len(rows)
+
+    def submit_alerts(self, rows, aggregates=(), users=None):
+        """Queue a write_alerts() batch without waiting for the commit.
+
+        aggregates are written as their current state: a new one becomes a row
+        of today's partition (and is counted like any other row), one written
+        before updates its row in the partition it went to. users holds the
+        user each row's evidence names, if any, for the sketches.
+        """
+        ts, sev, sent, threat = (ALERT_COLUMNS.index(c) for c in
+                                 ('ts', 'severity', 'siem_sent', 'threat_type'))
+        self._sketch(rows, users)  # aggregated alerts were sketched one by one in _aggregate()
+        table = self.partitions.current()
+        upserts = {}
+        new_rows = list(rows)
+        with self._aggregate_lock:
+            for agg in aggregates:
+                row = agg.alert[:ts + 1] + (agg.count, int(agg.last_ts), json.dumps(agg.samples),
+                                            f'{self._aggregate_token}-{agg.seq}')
+                if agg.table is None:
+                    agg.table = table
+                    new_rows.append(row)
+                upserts.setdefault(agg.table, []).append(row)
+        self.metrics.inc('zock_alerts_total', len(new_rows))
+        counters = Counter(total_alerts=len(new_rows))
+        minutes = Counter()
+        for row in new_rows:
+            counters['siem_alerts'] += bool(row[sent])
+            counters['critical_alerts'] += row[sev] == 'Critical'
+            counters['high_alerts'] += row[sev] == 'High'
+            counters['threat:' + row[threat]] += 1
+            minutes[row[ts] // 60] += 1
+        statements = [(UPSERT_AGGREGATE_SQL.format(table=t), upsert_rows) for t, upsert_rows in upserts.items()]
+        # Upserts only insert into other partitions when racing a concurrent batch, but then they must be indexed
+        indexing = [(sql.format(name=t), [()]) for t in {table, *upserts} for sql in INDEX_NEW_ROWS_SQL]
+        if not new_rows:
+            return self.writer.submit(statements + indexing)
+        return self.writer.submit(statements + [
+            (INSERT_ALERT_SQL.format(table=table), rows),
+            ('INSERT INTO alert_counters (part, name, value) VALUES (?, ?, ?) '
+             'ON CONFLICT(part, name) DO UPDATE SET value = value + excluded.value',
+             [(table, name, n) for name, n in counters.items()]),
+            ('INSERT INTO alert_minutes (minute, part, n) VALUES (?, ?, ?) '
+             'ON CONFLICT(minute, part) DO UPDATE SET n = n + excluded.n',
+             [(minute, table, n) for minute, n in minutes.items()]),
+            (EXTEND_RANGE_SQL, [(min(row[ts] for row in new_rows), max(row[ts] for row in new_rows), table)]),
+        ] + indexing)
+
+    def ingest(self, lines):
+        """Store NDJSON lines holding alerts or raw log events.
+
+        Raw events (objects with a `msg` but no detection) go through the
+        detection rules first; unless aggregation is off, their alerts are
+        merged per detection, entity and window into one row that keeps being
+        updated (see AlertAggregator). Rows are written in batches through
+        the group-commit writer, so memory stays bounded for any body size;
+        the next batch is parsed while the previous one commits.
+        """
+        result = {'events': 0, 'alerts_ingested': 0, 'alerts_aggregated': 0, 'rejected': 0}
+        rows, users = [], []
+        touched = {}  # aggregates changed since the last batch, by seq
+        pending = 0  # alerts in rows and touched
+        in_flight = None
+        accepted = 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+                if not isinstance(obj, dict):
+                    raise ValueError
+                if is_raw_event(obj):
+                    result['events'] += 1
+                    found = run_rules(normalize_event(obj))
+                    alerts = [alert_row(a) for a in found]
+                    if self.aggregator is not None and alerts:
+                        touched.update(self._aggregate(alerts, result, [alert_user(a) for a in found]))
+                    else:
+                        rows.extend(alerts)
+                        users.extend(alert_user(a) for a in found)
+                    pending += len(alerts)
+                else:
+                    rows.append(alert_row(obj))
+                    users.append(alert_user(obj))
+                    pending += 1
+            except ValueError:
+                result['rejected'] += 1
+                continue
+            accepted += 1
+            if pending >= INGEST_BATCH_ROWS:
+                if in_flight:
+                    self._committed(*in_flight)
+                in_flight = (self.submit_alerts(rows, touched.values(), users), touched)
+                result['alerts_ingested'] += pending
+                rows, users, touched, pending = [], [], {}, 0
+                self.count_events(accepted)
+                accepted = 0
+        if in_flight:
+            self._committed(*in_flight)
+        if rows or touched:
+            self._committed(self.submit_alerts(rows, touched.values(), users), touched)
+            result['alerts_ingested'] += pending
+        self.count_events(accepted)
+        return result
+
+    def _aggregate(self, rows, result, users=None):
+        """Add ALERT_COLUMNS rows to their aggregates; return them by seq"""
+        ts, detection, entity, log_data = (ALERT_COLUMNS.index(c) for c in
+                                           ('ts', 'detection', 'entity', 'log_data'))
+        touched = {}
+        self._sketch(rows, users)
+        with self._aggregate_lock:
+            for row in rows:
+                agg, created = self.aggregator.add((row[detection], row[entity]), row[ts], row, row[log_data])
+                result['alerts_aggregated'] += not created
+                touched[agg.seq] = agg
+            self.aggregator.expire()  # closed aggregates are done with; later alerts open new ones
+        return touched
+
+    def _sketch(self, rows, users=None):
+        """Count ALERT_COLUMNS rows into the heavy-hitter and distinct-count sketches.
+
+        users[i] is the user row i's evidence names, or None. The counts stay
+        in this process until _flush_sketches() stores them.
+        """
+        detection, source, ts, count = (ALERT_COLUMNS.index(c) for c in ('detection', 'source_ip', 'ts', 'count'))
+        users = users or [None] * len(rows)
+        with self._sketch_lock:
+            for row, user in zip(rows, users):
+                self._sketch_delta.add(row[detection], row[source], user, row[ts], row[count])
+
+    def _flush_sketches(self):
+        """Merge what was sketched since the last flush into the stored sketches of today's partition.
+
+        Every process merges into the same rows, so get_stats() sees the
+        alerts of all of them; a row goes when its partition is dropped.
+        """
+        with self._sketch_lock:
+            delta, self._sketch_delta = self._sketch_delta, AlertSketches()
+        if not delta.detections:
+            return
+        table = self.partitions.current()
+        try:
+            with self.pool.write() as conn:
+                row = conn.execute('SELECT sketch FROM alert_sketches WHERE part = ?', (table,)).fetchone()
+                sketches = delta
+                if row is not None:
+                    sketches = AlertSketches.loads(row[0])
+                    sketches.merge(delta)
+                conn.execute('INSERT OR REPLACE INTO alert_sketches (part, sketch) VALUES (?, ?)',
+                             (table, sketches.dumps()))
+        except sqlite3.Error:
+            with self._sketch_lock:  # tried again with the next batch
+                self._sketch_delta.merge(delta)
+
+    def _committed(self, batch, aggregates):
+        """Wait for a submit_alerts() batch, then tell dashboards what changed"""
+        self.writer.wait(batch)
+        self._flush_sketches()
+        self.changes.publish('insert')
+        with self._aggregate_lock:
+            # A grown count made the row pending for every SIEM again (UPSERT_AGGREGATE_SQL)
+            updates = [{'agg_key': f'{self._aggregate_token}-{agg.seq}', 'count': agg.count,
+                        'last_seen': event_time(agg.last_ts)[0], 'siem_sent': False, 'siem_platforms': 'Pending'}
+                       for agg in aggregates.values() if agg.count > 1]
+        if updates:
+            for forwarder in self.forwarders:
+                forwarder.refresh([u['agg_key'] for u in updates])
+            self.changes.publish('aggregate', updates)
+
+    def _on_purge(self, names):
+        if self.aggregator is not None:
+            with self._aggregate_lock:
+                self.aggregator.discard(lambda agg: agg.table in names)
+        self.changes.publish('purge', names)
+
+    def count_events(self, n):
+        """Record n ingested log events or alerts for the events/sec series"""
+        if n:
+            self.metrics.events.add(n)
+            self.metrics.inc('zock_events_total', n)
+
+    def _register_metrics(self):
+        m = self.metrics
+        m.describe('zock_events_total', 'counter', 'Log events and alerts accepted by ingest')
+        m.describe('zock_alerts_total', 'counter', 'Alerts queued for writing')
+        m.describe('zock_rule_evaluations_total', 'counter', 'Events evaluated by each detection rule')
+        m.describe('zock_rule_matches_total', 'counter', 'Events matched by each detection rule')
+        m.describe('zock_rule_seconds_total', 'counter', 'Estimated time spent in each detection rule (sampled)')
+        m.describe('zock_queue_depth', 'gauge', 'Items waiting in an internal queue')
+        m.describe('zock_db_commit_seconds', 'histogram', 'Duration of each group-commit transaction')
+        m.describe('zock_db_write_seconds', 'histogram', 'Alert batch latency from submit to commit')
+        m.describe('zock_request_duration_seconds', 'histogram', 'HTTP request latency per route')
+        m.describe('zock_requests_total', 'counter', 'HTTP requests per route and status')
+        m.describe('zock_ai_alerts_total', 'counter', 'Alerts given an AI verdict, by where it came from')
+        m.describe('zock_ai_model_calls_total', 'counter', 'Requests sent to the AI model')
+        m.describe('zock_startup_seconds', 'gauge', 'Time this process spent starting up, by phase')
+        m.add_histogram('zock_db_commit_seconds', self.writer.commit_latency)
+        m.add_histogram('zock_db_write_seconds', self.writer.write_latency)
+        m.add_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        samples = [('zock_queue_depth', {'queue': 'writer'}, self.writer.queue_depth())]
+        samples += [('zock_queue_depth', {'queue': f'siem_{m["platform"].lower()}'}, m['queue_depth'])
+                    for m in self.siem_metrics()]
+        ai = self.ai_metrics()
+        if ai:
+            samples += [('zock_queue_depth', {'queue': 'ai'}, ai['queue_depth']),
+                        ('zock_ai_alerts_total', {'source': 'model'}, ai['analyzed'] - ai['cache_hits']),
+                        ('zock_ai_alerts_total', {'source': 'cache'}, ai['cache_hits']),
+                        ('zock_ai_model_calls_total', {}, ai['model_calls'])]
+        for stat in RULES.pack.ruleset.stats():
+            labels = {'rule': stat['rule']}
+            samples += [('zock_rule_evaluations_total', labels, stat['evaluations']),
+                        ('zock_rule_matches_total', labels, stat['matches']),
+                        ('zock_rule_seconds_total', labels, stat['seconds'])]
+        samples += [('zock_startup_seconds', {'phase': phase}, seconds) for phase, seconds in STARTUP.items()]
+        return samples
+
+    def metrics_summary(self):
+        """Events/sec series (newest first) with rule, queue, DB write and route timings"""
+        starts, rates = self.metrics.events.series()
+        samples, histograms = self.metrics.samples()
+        rules = RULES.pack.ruleset.stats()
+        for stat in rules:
+            stat['seconds'] = round(stat['seconds'], 6)
+        return {
+            'timestamps': [datetime.fromtimestamp(t).strftime('%H:%M:%S') for t in starts],
+            'values': rates,
+            'interval_seconds': self.metrics.events.interval,
+            'rules': rules,
+            'queues': {labels['queue']: value for name, labels, value in samples if name == 'zock_queue_depth'},
+            'db_write': {'commit': self.writer.commit_latency.summary(),
+                         'batch': self.writer.write_latency.summary()},
+            'routes': {f"{labels['method']} {labels['route']}": h.summary()
+                       for name, labels, h in histograms if name == 'zock_request_duration_seconds'},
+            'ai': self.ai_metrics(),
+        }
+    
+    def get_alerts(self, limit=PAGE_SIZE, after=None, since=None, until=None, **filters):
+        """Get one page of alerts, newest first.
+
+        `after` is the (ts, id) of the last alert of the previous page and
+        since/until are epoch seconds of event time; the returned next key is
+        None on the last page. Every filter combined with the ordering is a
+        range scan of a (column, ts) index in each partition. Partitions are
+        visited latest event times first and the walk stops once none of
+        the remaining ones can hold a row for this page, so a page costs the
+        same however much history is kept.
+        """
+        sql, params = alert_query_sql(after, since, until, filters)
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+
+        ts, key = ALERT_COLUMNS.index('ts') + 1, lambda row: (row[ts], row[0])
+        rows = []
+        with self.pool.reader() as conn:
+            upper = min((t for t in (until, after and after[0]) if t is not None), default=None)
+            for part in self.partitions.for_time_range(conn, since, upper):
+                if len(rows) > limit and part.max_ts < rows[limit][ts]:
+                    break
+                cursor = conn.execute(sql.format(table=part.name), params)
+                rows = sorted(rows + cursor.fetchall(), key=key, reverse=True)[:limit + 1]
+        alerts = [alert_dict(row) for row in rows[:limit]]
+
+        next_key = None
+        if len(rows) > limit:
+            next_key = (alerts[-1]['ts'], alerts[-1]['id'])
+        return alerts, next_key
+
+    def iter_alerts(self, after=None, since=None, until=None, **filters):
+        """Every alert get_alerts() would page through, newest first, as a generator.
+
+        Rows come straight from one cursor per partition, merged lazily, so
+        memory stays the same however many alerts match. The whole walk reads
+        one snapshot and holds a reader connection until it is exhausted or
+        closed.
+        """
+        sql, params = alert_query_sql(after, since, until, filters)
+        ts = ALERT_COLUMNS.index('ts') + 1
+        with self.pool.reader() as conn:
+            upper = min((t for t in (until, after and after[0]) if t is not None), default=None)
+            cursors = [conn.execute(sql.format(table=part.name), params)
+                       for part in self.partitions.for_time_range(conn, since, upper)]
+            for row in heapq.merge(*cursors, key=lambda row: (row[ts], row[0]), reverse=True):
+                yield alert_dict(row)
     
-    def get_alerts(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM alerts ORDER BY timestamp DESC')
-        columns = [col[0] for col in cursor.description]
+    def search(self, q, limit=PAGE_SIZE, order='rank', since=None, until=None, **filters):
+        """Alerts whose evidence matches the FTS5 query q, best matches first.
+
+        q takes FTS5 syntax: words, "exact phrases", prefix*, AND/OR/NOT and
+        column filters such as ai_analysis: benign. order='time' returns the
+        most recently stored matches first instead, which stays fast for very
+        common terms.
+        Each partition answers from its own full-text index, joined to the
+        alert rows for the API filters; bm25 scores are per partition, so
+        ranks across days are approximate. Every alert carries its bm25
+        score (lower is better) and a snippet with the matched terms in [].
+        """
+        where, params = [], [q]
+        for column in FILTER_COLUMNS:
+            if filters.get(column) is not None:
+                where.append(f'a.{column} = ?')
+                params.append(filters[column])
+        if since is not None:
+            where.append('a.ts >= ?')
+            params.append(since)
+        if until is not None:
+            where.append('a.ts < ?')
+            params.append(until)
+        params.append(limit)
+        sql = '''
+            SELECT a.*, bm25({table}_fts), snippet({table}_fts, -1, '[', ']', '…', 12)
+            FROM {table}_fts JOIN {table} a ON a.id = {table}_fts.rowid
+            WHERE {table}_fts MATCH ?'''
+        sql += ''.join(f' AND {w}' for w in where)
+        sql += ' ORDER BY rank LIMIT ?' if order == 'rank' else ' ORDER BY {table}_fts.rowid DESC LIMIT ?'
+
+        key = (lambda row: row[-2]) if order == 'rank' else (lambda row: -row[0])
+        rows = []
+        with self.pool.reader() as conn:
+            for part in self.partitions.for_time_range(conn, since, until):
+                rows = heapq.nsmallest(limit, rows + conn.execute(sql.format(table=part.name), params).fetchall(),
+                                       key=key)
         alerts = []
-        
-        for row in cursor.fetchall():
-            alert = dict(zip(columns, row))
-            alert['siem_sent'] = bool(alert['siem_sent'])
+        for row in rows:
+            alert = alert_dict(row[:-2])
+            alert['score'], alert['snippet'] = round(row[-2], 4), row[-1]
             alerts.append(alert)
-        
         return alerts
-    
+
     def test_siem_integration(self):
-        """Test SIEM integration by sending sample alerts"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            UPDATE alerts SET siem_sent = 1, 
-            siem_platforms = 'Splunk, Elasticsearch, Microsoft Defender'
-            WHERE siem_sent = 0
-        ''')
-        updated = cursor.rowcount
-        self.conn.commit()
-        
+        """Queue every alert not yet delivered to all SIEM platforms, including earlier failures.
+
+        Failures are cleared in the database, so the background process sends
+        them again whichever process handles the request.
+        """
+        if not self.siem_platforms:
+            return {
+                'message': 'No SIEM platforms configured (set ZOCK_SPLUNK_HEC_URL or ZOCK_ELASTICSEARCH_URL)',
+                'siems_joined': '',
+                'alerts_pending': 0
+            }
+        stats = self.get_stats()
+        pending = stats['total_alerts'] - stats['siem_alerts']
+        self.clear_siem_failures()
+        for forwarder in self.forwarders:
+            forwarder.retry_failed()
+        platforms = ', '.join(self.siem_platforms)
         return {
-            'message': f'✅ Successfully sent {updated} alerts to all SIEM platforms',
-            'siems_joined': 'Splunk, Elasticsearch, Microsoft Defender',
-            'alerts_sent': updated
+            'message': f'✅ Forwarding {pending} pending alerts to {platforms}',
+            'siems_joined': platforms,
+            'alerts_pending': pending
         }
-    
+
+    def pending_for_siem(self, platform, after_id, limit):
+        """Alerts after after_id, in id order, that platform has not acknowledged"""
+        return self._siem_rows(platform, after_id, limit, "IS NOT 'sent'")
+
+    def unsettled_for_siem(self, platform, after_id, limit):
+        """Alerts after after_id, in id order, that platform has neither acknowledged nor failed"""
+        return self._siem_rows(platform, after_id, limit, 'IS NULL')
+
+    def _siem_rows(self, platform, after_id, limit, status):
+        rows = []
+        with self.pool.reader() as conn:
+            for part in self.partitions.after_id(conn, after_id):
+                rows += conn.execute(f'''
+                    SELECT * FROM {part.name} WHERE id > ? AND siem_sent = 0
+                    AND (NOT json_valid(siem_platforms) OR json_extract(siem_platforms, ?) {status})
+                    ORDER BY id LIMIT ?
+                ''', (after_id, f'$."{platform}"', limit - len(rows))).fetchall()
+                if len(rows) == limit:
+                    break
+        return [alert_dict(row) for row in rows]
+
+    def clear_siem_failures(self):
+        """Make alerts a platform failed pending for it again"""
+        with self.pool.write() as conn:
+            for part in self.partitions.list(conn):
+                for platform in self.siem_platforms:
+                    path = f'$."{platform}"'
+                    conn.execute(f'''
+                        UPDATE {part.name} SET siem_platforms = json_remove(siem_platforms, ?)
+                        WHERE siem_sent = 0 AND json_valid(siem_platforms) AND json_extract(siem_platforms, ?) = 'failed'
+                    ''', (path, path))
+
+    def aggregates_for_siem(self, platform, agg_keys):
+        """Aggregates among agg_keys whose latest count platform has not acknowledged"""
+        rows = []
+        keys = json.dumps(agg_keys)
+        with self.pool.reader() as conn:
+            for part in reversed(self.partitions.list(conn)):  # open aggregates are in recent partitions
+                rows += conn.execute(f'''
+                    SELECT * FROM {part.name} WHERE agg_key IN (SELECT value FROM json_each(?)) AND siem_sent = 0
+                    AND (NOT json_valid(siem_platforms) OR json_extract(siem_platforms, ?) IS NOT 'sent')
+                ''', (keys, f'$."{platform}"')).fetchall()
+        return [alert_dict(row) for row in rows]
+
+    def record_siem_status(self, platform, alerts, status):
+        """Store platform's delivery status in siem_platforms (a JSON object per alert).
+
+        Only rows still holding the count that was delivered are updated: an
+        aggregate that grew meanwhile stays pending. siem_sent flips once every
+        configured platform reports 'sent'.
+        """
+        all_sent = ' AND '.join(f"json_extract(siem_platforms, '$.\"{name}\"') = 'sent'"
+                                for name in self.siem_platforms)
+        counts = {a['id']: a.get('count') or 1 for a in alerts}
+        delivered = []
+        with self.pool.write() as conn:
+            for table, table_ids in self.partitions.route(conn, counts).items():
+                id_list = json.dumps(table_ids)
+                conn.execute(f'''
+                    UPDATE {table} SET siem_platforms = json_set(
+                        CASE WHEN json_valid(siem_platforms) THEN siem_platforms ELSE '{{}}' END, ?, ?)
+                    WHERE (id, count) IN (SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?))
+                ''', (f'$."{platform}"', status, json.dumps([[i, counts[i]] for i in table_ids])))
+                delivered += [row[0] for row in conn.execute(f'''
+                    UPDATE {table} SET siem_sent = 1
+                    WHERE id IN (SELECT value FROM json_each(?)) AND siem_sent = 0 AND {all_sent}
+                    RETURNING id
+                ''', (id_list,)).fetchall()]
+        if delivered:
+            self.changes.publish('siem', {'ids': delivered, 'siem_platforms': ', '.join(self.siem_platforms)})
+        return delivered
+
+    def pending_for_ai(self, after_id, limit):
+        """Alerts after after_id, in id order, that have no AI analysis yet"""
+        rows = []
+        with self.pool.reader() as conn:
+            for part in self.partitions.after_id(conn, after_id):
+                rows += conn.execute(f'''
+                    SELECT id, detection, severity, source_ip, log_data FROM {part.name}
+                    WHERE id > ? AND ai_analysis IS NULL ORDER BY id LIMIT ?
+                ''', (after_id, limit - len(rows))).fetchall()
+                if len(rows) == limit:
+                    break
+        return [dict(zip(('id', 'detection', 'severity', 'source_ip', 'log_data'), row)) for row in rows]
+
+    def record_ai_analysis(self, ids, text):
+        """Store one model verdict on every alert in ids that has none yet"""
+        with self.pool.write() as conn:
+            for table, table_ids in self.partitions.route(conn, ids).items():
+                conn.execute(f'''
+                    UPDATE {table} SET ai_analysis = ?
+                    WHERE id IN (SELECT value FROM json_each(?)) AND ai_analysis IS NULL
+                ''', (text, json.dumps(table_ids)))
+
+    def ai_metrics(self):
+        return self.analyzer.metrics() if self.analyzer else None
+
+    def siem_metrics(self):
+        return [forwarder.metrics() for forwarder in self.forwarders]
+
     def get_stats(self):
         """Get dashboard statistics"""
-        alerts = self.get_alerts()
-        stats = {
-            'total_alerts': len(alerts),
-            'siem_alerts': len([a for a in alerts if a['siem_sent']]),
-            'critical_alerts': len([a for a in alerts if a['severity'] == 'Critical']),
-            'high_alerts': len([a for a in alerts if a['severity'] == 'High']),
-            'recent_alerts': len([a for a in alerts if 
-                                datetime.now() - datetime.strptime(a['timestamp'], '%Y-%m-%d %H:%M:%S') < timedelta(hours=1)])
-        }
+        since = int(time.time()) - 3600
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT name, SUM(value) FROM alert_counters GROUP BY name')
+            stats = {'threat_counts': {}, 'total_alerts': 0, 'siem_alerts': 0,
+                     'critical_alerts': 0, 'high_alerts': 0}
+            for name, value in cursor.fetchall():
+                if name.startswith('threat:'):
+                    if value > 0:
+                        stats['threat_counts'][name[7:]] = value
+                else:
+                    stats[name] = value
+
+            # Last hour = whole minutes from alert_minutes, plus the rows of the
+            # boundary minute that fall inside the window (an index range scan)
+            cursor.execute('SELECT COALESCE(SUM(n), 0) FROM alert_minutes WHERE minute > ?', (since // 60,))
+            recent = cursor.fetchone()[0]
+            boundary = (since, since // 60 * 60 + 59)
+            for part in self.partitions.for_time_range(conn, *boundary):
+                # Answered from the ts index alone
+                cursor.execute(f'SELECT COUNT(*) FROM {part.name} WHERE ts > ? AND ts <= ?', boundary)
+                recent += cursor.fetchone()[0]
+            stats['recent_alerts'] = recent
+            sketches = AlertSketches()
+            for (data,) in cursor.execute('SELECT sketch FROM alert_sketches'):
+                sketches.merge(AlertSketches.loads(data))
+        stats['sketches'] = sketches.summary()
         return stats
 
-# Initialize engine
-zock = ZOCKEngine()
+    def clear_alerts(self):
+        """Drop every partition; ids keep increasing afterwards"""
+        if self.aggregator is not None:
+            with self._aggregate_lock:
+                self.aggregator.clear()
+        with self._sketch_lock:
+            self._sketch_delta = AlertSketches()
+        self.partitions.clear()
+        self.changes.publish('clear')
+
+    def get_alerts_since(self, last_id, limit=STREAM_BATCH):
+        """Alerts with id > last_id in id order (a primary-key range scan per partition)"""
+        rows = []
+        with self.pool.reader() as conn:
+            for part in self.partitions.after_id(conn, last_id):
+                rows += conn.execute(f'SELECT * FROM {part.name} WHERE id > ? ORDER BY id LIMIT ?',
+                                     (last_id, limit - len(rows))).fetchall()
+                if len(rows) == limit:
+                    break
+        return [alert_dict(row) for row in rows]
+
+    def data_version(self):
+        """Changes on every insert, SIEM update or clear, from this process or another"""
+        return f'{self.changes.seq}.{self.pool.data_version()}'
+
+    def max_alert_id(self):
+        with self.pool.reader() as conn:
+            for part in reversed(self.partitions.list(conn)):
+                max_id = conn.execute(f'SELECT MAX(id) FROM {part.name}').fetchone()[0]
+                if max_id is not None:
+                    return max_id
+        return 0
+
+def iter_body_lines(stream, chunk_size=1 << 20):
+    """Split a request body into lines, reading it in large chunks"""
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8', errors='replace')
+    if pending:
+        yield pending.decode('utf-8', errors='replace')
+
+def is_raw_event(obj):
+    return 'msg' in obj and not ('detection' in obj or 'threat_type' in obj)
+
+def alert_query_sql(after, since, until, filters):
+    """SELECT over a partition ({table}) for the API filters, newest first, and its parameters"""
+    where, params = [], []
+    for column in FILTER_COLUMNS:
+        if filters.get(column) is not None:
+            where.append(f'{column} = ?')
+            params.append(filters[column])
+    if since is not None:
+        where.append('ts >= ?')
+        params.append(since)
+    if until is not None:
+        where.append('ts < ?')
+        params.append(until)
+    if after:
+        where.append('(ts, id) < (?, ?)')
+        params.extend(after)
+    sql = 'SELECT * FROM {table}'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return sql + ' ORDER BY ts DESC, id DESC', params
+
+class EngineHandle:
+    """An app's ZOCKEngine, created on first use in each process.
+
+    Nothing is opened at import or in create_app(), so a pre-forking server
+    can load the app once in its master: every worker builds its own engine
+    (connections, group-commit writer) on its first request instead of
+    inheriting the master's across fork, which SQLite connections do not
+    survive. An engine passed in is used as it is.
+    """
+
+    def __init__(self, options, engine=None):
+        self.options = options
+        self.pinned = engine is not None
+        self._engine = engine
+        self._pid = os.getpid() if engine is not None else None
+        self._lock = threading.Lock()
+        self.response_cache = ResponseCache()
+        # ETags carry a per-engine token: versions read by another worker's
+        # connections, or before a restart, never match
+        self.etag_token = uuid.uuid4().hex[:12]
+
+    def get(self):
+        if self._pid != os.getpid() and not self.pinned:
+            with self._lock:
+                if self._pid != os.getpid():
+                    start = time.perf_counter()
+                    self.response_cache = ResponseCache()
+                    self.etag_token = uuid.uuid4().hex[:12]
+                    self._engine = ZOCKEngine(**self.options)
+                    self._pid = os.getpid()
+                    STARTUP['engine'] = round(time.perf_counter() - start, 4)
+        return self._engine
+
+    def db_path(self):
+        return self._engine.pool.path if self.pinned else self.options.get('path', DB_PATH)
+
+def create_app(engine=None, **engine_options):
+    """The ZOCK Flask app.
+
+    engine_options go to ZOCKEngine(), which each process creates on its
+    first request; pass engine to serve one built already (e.g. in tests).
+    Workers serve requests only unless background=True is passed: SIEM
+    forwarding, AI analysis and partition maintenance run in the one
+    process started with `flask background`.
+    """
+    start = time.perf_counter()
+    engine_options.setdefault('background', False)
+    app = Flask(__name__)
+    app.extensions['zock'] = EngineHandle(engine_options, engine)
+    app.register_blueprint(api)
+    STARTUP['create_app'] = round(time.perf_counter() - start, 4)
+    return app
+
+def engine():
+    """The current app's ZOCKEngine in this process"""
+    return current_app.extensions['zock'].get()
+
+def startup_report():
+    """This process's startup time by phase (engine is missing until its first
+    request) and which optional dependencies it has imported so far"""
+    return {
+        'pid': os.getpid(),
+        'seconds': dict(STARTUP),
+        'total_seconds': round(sum(STARTUP.values()), 4),
+        'optional_modules': loaded(),
+    }
+
+def versioned_json(build, version_suffix=''):
+    """JSON response built at most once per data version.
+
+    build() returns (data, headers). A client that sends the current ETag back
+    in If-None-Match gets a 304 without the database being read; otherwise the
+    body comes from the response cache until the next write.
+    """
+    handle = current_app.extensions['zock']
+    # Read the version before the data: a write racing the build can only
+    # make the cached body newer than its version, never older
+    version = handle.get().data_version() + version_suffix
+    etag = f'{handle.etag_token}-{version}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        key = request.full_path
+        cached = handle.response_cache.get(key, version)
+        if cached is None:
+            data, headers = build()
+            cached = (dumps(data), headers)
+            handle.response_cache.put(key, version, cached)
+        body, headers = cached
+        response = Response(body, mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(token):
+    try:
+        ts, alert_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return int(ts), int(alert_id)
+    except Exception:
+        raise ValueError('invalid cursor')
+
+def parse_time_arg(name, value):
+    """Epoch seconds from a local 'YYYY-MM-DD HH:MM:SS' or an epoch number"""
+    if value.isdigit():
+        return int(value)
+    try:
+        return int(datetime.strptime(value, TIMESTAMP_FORMAT).timestamp())
+    except ValueError:
+        raise ValueError(f"{name} must be formatted as 'YYYY-MM-DD HH:MM:SS' or epoch seconds")
+
+def alert_query_args(args):
+    """Translate query-string filters into get_alerts() keyword arguments"""
+    query = {}
+    try:
+        if args.get('limit') == 'all':
+            query['limit'] = None
+        else:
+            query['limit'] = min(max(int(args.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("limit must be an integer or 'all'")
+    if args.get('cursor'):
+        query['after'] = decode_cursor(args['cursor'])
+    for name in ('severity', 'threat_type', 'source_ip'):
+        if args.get(name):
+            query[name] = args[name]
+    if args.get('siem_sent'):
+        if args['siem_sent'].lower() not in ('1', '0', 'true', 'false'):
+            raise ValueError('siem_sent must be true or false')
+        query['siem_sent'] = int(args['siem_sent'].lower() in ('1', 'true'))
+    for name in ('since', 'until'):
+        if args.get(name):
+            query[name] = parse_time_arg(name, args[name])
+    return query
+
+@api.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
 
-@app.route('/')
+@api.after_app_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Route templates, not paths, keep the label set bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics = engine().metrics
+        metrics.observe('zock_request_duration_seconds', time.perf_counter() - start,
+                        method=request.method, route=route)
+        metrics.inc('zock_requests_total', method=request.method, route=route, status=response.status_code)
+    return response
+
+@api.route('/')
 def dashboard():
     """Main dashboard"""
     return render_template('dashboard.html')
 
-@app.route('/api/alerts')
+@api.route('/api/alerts')
 def api_alerts():
-    """Get all alerts as JSON"""
-    alerts = zock.get_alerts()
-    return jsonify(alerts)
+    """Get a page of alerts as JSON, newest first.
+
+    Filters: severity, threat_type, source_ip, siem_sent, since, until.
+    Pass the X-Next-Cursor response header back as ?cursor= for the next page.
+    limit=all streams every matching alert from the database as one array.
+    """
+    try:
+        query = alert_query_args(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    limit = query.pop('limit')
+    if limit is None:
+        return Response(iter_json_array(engine().iter_alerts(**query)), mimetype='application/json',
+                        headers={'Cache-Control': 'no-cache'})
+
+    def build():
+        alerts, next_key = engine().get_alerts(limit, **query)
+        return alerts, {'X-Next-Cursor': encode_cursor(next_key)} if next_key else {}
+
+    return versioned_json(build)
+
+@api.route('/api/export')
+def api_export():
+    """Download every matching alert, newest first, streamed from the database.
+
+    format: ndjson (default), csv or parquet; compression: none (default),
+    gzip or zstd (the Parquet codec for parquet). Filters are those of
+    /api/alerts, including cursor; limit is not used.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    compression = request.args.get('compression', 'none')
+    try:
+        query = alert_query_args(request.args)
+        query.pop('limit')
+        chunks = export_chunks(engine().iter_alerts(**query), fmt, compression)
+    except (ValueError, ExportError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    name = filename(f'zock_alerts_{datetime.now():%Y%m%d_%H%M%S}', fmt, compression)
+    return Response(chunks, mimetype=media_type(fmt, compression),
+                    headers={'Content-Disposition': f'attachment; filename="{name}"', 'Cache-Control': 'no-cache'})
+
+@api.route('/api/search')
+def api_search():
+    """Full-text search over alert evidence (log_data, ai_analysis, samples).
+
+    q: FTS5 query (words, "phrases", prefix*, AND/OR/NOT); order: rank
+    (default) or time; limit, severity, threat_type, source_ip, siem_sent,
+    since and until as for /api/alerts.
+    """
+    q = request.args.get('q', '').strip()
+    order = request.args.get('order', 'rank')
+    if not q:
+        return jsonify({'status': 'error', 'message': 'q is required'}), 400
+    if order not in ('rank', 'time'):
+        return jsonify({'status': 'error', 'message': 'order must be rank or time'}), 400
+    try:
+        query = alert_query_args(request.args)
+        if 'after' in query or query['limit'] is None:
+            raise ValueError('search takes neither cursor nor limit=all')
+        return versioned_json(lambda: (engine().search(q, order=order, **query), {}))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except sqlite3.OperationalError as e:  # FTS5 rejects malformed queries as they run
+        return jsonify({'status': 'error', 'message': f'invalid search query: {e}'}), 400
+
+@api.route('/api/alerts/stream')
+def api_alert_stream():
+    """Server-Sent Events: new alerts after last_id, SIEM status changes and clears.
+
+    Resumes from the Last-Event-ID header that EventSource sends on reconnect,
+    else from ?last_id=, else from the newest alert.
+    """
+    zock = engine()  # the stream outlives the app context
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_id') or zock.max_alert_id())
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'last_id must be an integer'}), 400
+
+    def stream(last_id):
+        seq = zock.changes.seq
+        yield 'retry: 3000\n\n'
+        while True:
+            alerts = zock.get_alerts_since(last_id)
+            for alert in alerts:
+                last_id = alert['id']
+                yield sse('alert', alert, event_id=last_id)
+            if len(alerts) == STREAM_BATCH:
+                continue
+            seq, events = zock.changes.wait(seq, STREAM_POLL_SECONDS)
+            for kind, data in events:
+                if kind in STREAM_EVENTS:
+                    yield sse(kind, data)
+            if not events:
+                yield ': keep-alive\n\n'
+
+    return Response(stream(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-@app.route('/api/generate', methods=['POST'])
+@api.route('/api/generate', methods=['POST'])
 def generate_alerts():
     """Generate sample alerts"""
     count = request.json.get('count', 5) if request.json else 5
-    alerts = zock.generate_sample_alerts(count)
+    alerts = engine().generate_sample_alerts(count)
     return jsonify({
         'status': 'success',
         'alerts_count': len(alerts),
         'message': f'✅ Generated {len(alerts)} security alerts with AI analysis'
     })
 
-@app.route('/api/test-siem', methods=['POST'])
+@api.route('/api/ingest', methods=['POST'])
+def ingest():
+    """Bulk-ingest NDJSON alerts or raw log events"""
+    result = engine().ingest(iter_body_lines(request.stream))
+    status = 400 if result['rejected'] and not (result['events'] or result['alerts_ingested']) else 200
+    return jsonify({'status': 'success' if status == 200 else 'error', **result}), status
+
+@api.route('/api/test-siem', methods=['POST'])
 def test_siem():
-    """Test SIEM integration"""
-    result = zock.test_siem_integration()
+    """Queue pending alerts for SIEM forwarding; delivery happens in the background"""
+    result = engine().test_siem_integration()
     return jsonify(result)
 
-@app.route('/api/stats')
+@api.route('/api/siem')
+def api_siem():
+    """Get per-platform SIEM forwarding metrics"""
+    return jsonify(engine().siem_metrics())
+
+@api.route('/api/ai')
+def api_ai():
+    """Get AI analysis metrics: model calls, cache hits and deduplicated alerts"""
+    zock = engine()
+    metrics = zock.ai_metrics()
+    if metrics is None and zock.ai_enabled:
+        return jsonify({'status': 'background', 'message': 'AI analysis runs in the background process'})
+    if metrics is None:
+        return jsonify({'status': 'disabled', 'message': 'No AI model configured (set ZOCK_AI_URL)'})
+    return jsonify(metrics)
+
+@api.route('/api/rules')
+def api_rules():
+    """Get the active rule pack, its reloads and the last reload error"""
+    return jsonify(RULES.status())
+
+@api.route('/api/startup')
+def api_startup():
+    """Get this worker's startup timings"""
+    engine()
+    return jsonify(startup_report())
+
+@api.route('/api/stats')
 def api_stats():
     """Get dashboard statistics"""
-    stats = zock.get_stats()
-    return jsonify(stats)
+    # recent_alerts slides with the clock, so stats are also rebuilt each minute
+    minute = datetime.now().strftime('%Y%m%d%H%M')
+    return versioned_json(lambda: (engine().get_stats(), {}), f'@{minute}')
+
+@api.route('/api/pool')
+def api_pool():
+    """Get database connection pool metrics"""
+    handle = current_app.extensions['zock']
+    metrics = handle.get().pool.metrics()
+    metrics['response_cache_hits'] = handle.response_cache.hits
+    metrics['response_cache_misses'] = handle.response_cache.misses
+    return jsonify(metrics)
 
-@app.route('/api/clear', methods=['POST'])
+@api.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(engine().metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/metrics')
+def api_metrics():
+    """Events/sec series for the metrics chart, plus rule, queue, DB and route timings"""
+    return jsonify(engine().metrics_summary())
+
+@api.route('/api/clear', methods=['POST'])
 def clear_alerts():
     """Clear all alerts"""
-    cursor = zock.conn.cursor()
-    cursor.execute('DELETE FROM alerts')
-    zock.conn.commit()
+    engine().clear_alerts()
     return jsonify({'status': 'success', 'message': 'All alerts cleared'})
 
+@api.cli.command('migrate')
+def migrate_command():
+    """Create or upgrade the database schema"""
+    path = current_app.extensions['zock'].db_path()
+    legacy = migrate(path)
+    print(f'{path}: schema version {SCHEMA_VERSION}')
+    if legacy:
+        print(f'{path}: {legacy} alerts from before partitioning are older than {RETENTION_DAYS} days; '
+              'they are kept until ZOCK_PURGE_LEGACY=1, then dropped by the next purge')
+
+@api.cli.command('background')
+def background_command():
+    """Run SIEM forwarding, AI analysis and partition maintenance until interrupted"""
+    handle = current_app.extensions['zock']
+    zock = handle.get() if handle.pinned else ZOCKEngine(**{**handle.options, 'background': True})
+    try:
+        if not zock.background:
+            sys.exit(f'{zock.pool.path}: background stages already run in another process')
+        print(f'{zock.pool.path}: forwarding to {", ".join(zock.siem_platforms) or "no SIEM"}, '
+              f'AI analysis {"on" if zock.analyzer else "off"}')
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if not handle.pinned:
+            zock.close()
+
+@api.cli.command('startup-report')
+def startup_report_command():
+    """Create the engine and print how long this process took to start"""
+    current_app.extensions['zock'].get()
+    print(json.dumps(startup_report(), indent=2))
+
+STARTUP['import'] = round(time.perf_counter() - IMPORT_STARTED, 4)
+app = create_app()
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1:  # python app.py migrate | startup-report, as the flask commands
+        with app.app_context():
+            app.cli.main(sys.argv[1:], prog_name='python app.py')
     print("""
     🚀 ZOCK AI Threat Detection System
     ==================================
     
     🎯 Features:
     • AI-Powered Threat Detection
-    • Multi-SIEM Integration (Splunk, Elasticsearch, Microsoft Defender)
+    • Multi-SIEM Forwarding (Splunk HEC, Elasticsearch _bulk)
     • Real-time Dark Dashboard
     • OWASP Categorization
     • Export Capabilities
@@ -177,16 +1152,27 @@ if __name__ == '__main__':
     📊 Dashboard: http://localhost:5000
     
     🔧 API Endpoints:
-    /api/alerts     - Get all alerts
+    /api/alerts     - Get alerts (paginated, filterable)
+    /api/alerts/stream - Live alert stream (Server-Sent Events)
     /api/generate   - Generate sample alerts  
-    /api/test-siem  - Test SIEM integration
+    /api/ingest     - Bulk-ingest NDJSON alerts or log events
+    /api/test-siem  - Forward pending alerts to SIEM platforms
+    /api/siem       - SIEM forwarding metrics
+    /api/ai         - AI analysis metrics
+    /api/rules      - Active rule pack and reload status
     /api/stats      - Get statistics
+    /api/startup    - Worker startup timings
+    /api/pool       - Database connection pool metrics
+    /api/metrics    - Events/sec, rule, DB write and request timings
+    /metrics        - Prometheus metrics
     /api/clear      - Clear all alerts
     
     🛡️ Ready to detect threats!
     """)
     
-    # Generate initial sample data
-    zock.generate_sample_alerts(3)
+    # The development server is one process: it runs the background stages itself
+    app = create_app(background=True)
+    migrate()
+    app.extensions['zock'].get().generate_sample_alerts(3)
     
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
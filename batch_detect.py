@@ -0,0 +1,149 @@
+# batch_detect.py - columnar detection over batches of events for large backfills
+import json
+from bisect import bisect_right
+from collections import Counter
+from functools import lru_cache
+from itertools import accumulate
+
+from deps import optional
+from detectors import RULES, entity_for, make_alert
+from ingest import parse_ts
+
+BATCH_SIZE = 50000
+
+
+class EventBatch:
+    """Parsed log events held column by column.
+
+    ts, src_ip, user, service and msg are lists with one entry per event, the
+    fields normalize_event() produces; `raw` keeps the parsed objects. Only
+    events that raise alerts are turned back into dicts, with event().
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.ts = [normalize_ts(e.get("ts")) for e in raw]
+        self.src_ip = [e.get("src_ip") for e in raw]
+        self.user = [e.get("user") for e in raw]
+        self.service = [e.get("service") for e in raw]
+        self.msg = [e.get("msg", "") for e in raw]
+
+    def __len__(self):
+        return len(self.raw)
+
+    def event(self, i):
+        """Event i as normalize_event() returns it"""
+        return {"ts": self.ts[i], "src_ip": self.src_ip[i], "user": self.user[i],
+                "service": self.service[i], "msg": self.msg[i], "raw": self.raw[i]}
+
+    def ip_counts(self):
+        """Events per src_ip ("unknown" when missing), in first-seen order"""
+        counts = {}
+        for ip, n in Counter(self.src_ip).items():
+            ip = ip or "unknown"
+            counts[ip] = counts.get(ip, 0) + n
+        return counts
+
+
+def normalize_ts(ts):
+    try:
+        return _normalize_ts(ts) if ts else None
+    except TypeError:  # unhashable, so not a timestamp normalize_event could parse either
+        return ts
+
+
+@lru_cache(maxsize=4096)  # backfills repeat the same second many times
+def _normalize_ts(ts):
+    try:
+        return parse_ts(ts).isoformat()
+    except Exception:
+        return ts
+
+
+def iter_batches(lines, size=BATCH_SIZE):
+    """Group JSON lines into EventBatches of up to size events; bad lines are skipped like parse_jsonl()"""
+    raw = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            raw.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+        if len(raw) == size:
+            yield EventBatch(raw)
+            raw = []
+    if raw:
+        yield EventBatch(raw)
+
+
+def prefilter_rows(texts, literals):
+    """Indexes of the texts whose lowercased form contains any of literals.
+
+    With pyarrow each literal is matched against the whole column in C++.
+    Otherwise the texts are joined and lowercased as one string and each
+    literal is located with str.find, which skips through the batch at C
+    speed; match offsets are mapped back to rows, so per-text interpreter work
+    only happens for the texts that match.
+
+    numpy and pyarrow are optional: without numpy bisect does the row lookups,
+    without pyarrow the str.find path is taken.
+    """
+    np, pa, pc = optional("numpy"), optional("pyarrow"), optional("pyarrow.compute")
+    if pa is not None and pc is not None:
+        column = pa.array(texts, type=pa.string())
+        mask = None
+        for literal in literals:
+            hits = pc.match_substring(column, pattern=literal, ignore_case=True)
+            mask = hits if mask is None else pc.or_(mask, hits)
+        if np is not None:
+            return np.flatnonzero(mask.to_numpy(zero_copy_only=False)).tolist()
+        return [i for i, hit in enumerate(mask.to_pylist()) if hit]
+
+    lowered = "\n".join(texts).lower()
+    if len(lowered) == sum(map(len, texts)) + len(texts) - 1:
+        lengths = map(len, texts)
+    else:  # some characters lowercase to more than one; offsets must follow the lowered texts
+        lowered_texts = [t.lower() for t in texts]
+        lowered = "\n".join(lowered_texts)
+        lengths = map(len, lowered_texts)
+    if np is not None:
+        starts = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(lengths, dtype=np.int64, count=len(texts)) + 1, out=starts[1:])
+    else:
+        starts = [0]
+        starts.extend(accumulate(n + 1 for n in lengths))
+    positions = []
+    find = lowered.find
+    for literal in literals:
+        pos = find(literal)
+        while pos != -1:
+            positions.append(pos)
+            pos = find(literal, pos + 1)
+    if not positions:
+        return []
+    if np is not None:
+        return np.unique(np.searchsorted(starts, positions, side="right") - 1).tolist()
+    return sorted({bisect_right(starts, p) - 1 for p in positions})
+
+
+def detect_batch(batch, pack=None):
+    """Alerts for every event of batch, the same and in the same order as run_rules() per event;
+    the whole batch uses one rule pack, the active one by default"""
+    pack = RULES.pack if pack is None else pack
+    ruleset = pack.ruleset
+    texts = [m or "" for m in batch.msg]
+    candidates = prefilter_rows(texts, ruleset.literals) if ruleset.literals else None
+    alerts = []
+    for i, rules in ruleset.match_batch(texts, candidates):
+        evt = batch.event(i)
+        alerts.extend(make_alert(rule.name, evt, entity=entity_for(rule, evt), severity=rule.severity, pack=pack)
+                      for rule in rules)
+    return alerts
+
+
+def detect_lines(lines, size=BATCH_SIZE, pack=None):
+    """Yield (batch, alerts) for JSON log lines, one batch at a time"""
+    for batch in iter_batches(lines, size):
+        yield batch, detect_batch(batch, pack)
@@ -0,0 +1,360 @@
+# bench.py - reproducible end-to-end benchmark over seeded synthetic logs
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from statistics import median
+
+from alert_rows import INGEST_BATCH_ROWS, alert_row
+from anomaly import WindowedZScore, anomaly_alert, event_time
+from detectors import run_rules
+from ingest import iter_lines, normalize_event
+
+RESULTS_DIR = "bench_results"
+RESULTS_FORMAT = 1
+CHUNK_EVENTS = 10000  # events parsed, detected and scored per timed step
+START_TS = 1755561600  # 2025-08-19T00:00:00Z, the day of sample_logs.jsonl
+
+# Share of events per kind; the remainder is benign traffic
+ATTACK_MIX = {
+    "failed_auth": 0.02,
+    "sqli": 0.005,
+    "traversal": 0.003,
+    "admin": 0.002,
+}
+
+USERS = ("alice", "bob", "carol", "dave", "erin", "frank", "grace", "root", "admin", "deploy")
+PAGES = ("/", "/index.html", "/login", "/static/app.js", "/static/site.css", "/api/items", "/products/42")
+
+# Per kind: (service, message templates); {user}, {page}, {n} are filled in
+MESSAGES = {
+    "benign": [
+        ("ssh", "successful login"),
+        ("ssh", "Accepted publickey for {user}"),
+        ("httpd", "GET {page} HTTP/1.1 200"),
+        ("httpd", "GET {page} HTTP/1.1 304"),
+        ("httpd", "POST /api/login HTTP/1.1 200"),
+        ("httpd", "GET /products/{n} HTTP/1.1 404"),
+    ],
+    "failed_auth": [
+        ("ssh", "failed password for {user}"),
+        ("ssh", "invalid user {user}"),
+        ("sshd", "pam_unix(sshd:auth): authentication failure; user={user}"),
+    ],
+    "sqli": [
+        ("httpd", "GET /index.php?q=1' UNION SELECT username,password FROM users --"),
+        ("httpd", "GET /products?id={n} OR 1=1"),
+        ("httpd", "POST /search q=x'/*comment*/ HTTP/1.1 500"),
+    ],
+    "traversal": [
+        ("httpd", "GET /../../../etc/passwd HTTP/1.1 404"),
+        ("httpd", "GET /download?file=../../{page} HTTP/1.1 403"),
+    ],
+    "admin": [
+        ("httpd", "GET /admin HTTP/1.1 200 - unauthenticated"),
+        ("httpd", "GET /admin/users HTTP/1.1 401"),
+        ("httpd", "POST /admin/config HTTP/1.1 403"),
+    ],
+}
+
+API_REQUESTS = (
+    ("alerts", "/api/alerts"),
+    ("alerts_filtered", "/api/alerts?severity=High&limit=50"),
+    ("alerts_time_range", f"/api/alerts?since={START_TS}&until={START_TS + 3600}"),
+    ("stats", "/api/stats"),
+)
+
+
+def parse_mix(text):
+    """Parse kind=share[,kind=share...] into an attack mix"""
+    mix = dict(ATTACK_MIX)
+    for item in filter(None, (text or "").split(",")):
+        kind, _, share = item.partition("=")
+        if kind not in ATTACK_MIX:
+            raise ValueError(f"unknown attack kind {kind!r}; expected one of {', '.join(ATTACK_MIX)}")
+        mix[kind] = float(share)
+    if sum(mix.values()) > 1:
+        raise ValueError("attack shares add up to more than 1")
+    return mix
+
+
+def generate_events(count, seed=0, mix=None, rate=1000, attackers=20, hosts=5000):
+    """Yield `count` log events in the sample_logs.jsonl schema.
+
+    The same seed always yields the same events. Event time advances by
+    1/rate seconds per event from START_TS. Attacks come from a small pool of
+    attacker addresses, so per-IP counts are skewed the way the anomaly
+    scorer expects; benign traffic is spread over `hosts` addresses.
+    """
+    rng = random.Random(seed)
+    mix = ATTACK_MIX if mix is None else mix
+    kinds = ["benign"] + list(mix)
+    cum, total = [], 0.0
+    for share in [1 - sum(mix.values())] + list(mix.values()):
+        total += share
+        cum.append(total)
+    attacker_ips = [f"203.0.113.{i % 254 + 1}" if i < 254 else f"198.51.100.{i % 254 + 1}"
+                    for i in range(attackers)]
+    host_ips = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(hosts)]
+    second, stamp = None, None
+    for i in range(count):
+        now = START_TS + i // rate
+        if now != second:
+            second = now
+            stamp = datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        kind = rng.choices(kinds, cum_weights=cum)[0]
+        service, template = rng.choice(MESSAGES[kind])
+        user = rng.choice(USERS)
+        evt = {
+            "ts": stamp,
+            "src_ip": rng.choice(host_ips if kind == "benign" else attacker_ips),
+            "msg": template.format(user=user, page=rng.choice(PAGES), n=rng.randrange(1000)),
+            "service": service,
+        }
+        if service.startswith("ssh"):
+            evt["user"] = user
+        yield evt
+
+
+def write_events(path, events):
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for evt in events:
+            f.write(json.dumps(evt, separators=(",", ":")) + "\n")
+            n += 1
+    return n
+
+
+class Stage:
+    """Accumulated wall time and item count of one pipeline stage"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.items = 0
+
+    def add(self, seconds, items):
+        self.seconds += seconds
+        self.items += items
+
+    def result(self):
+        rate = self.items / self.seconds if self.seconds else None
+        return {"seconds": round(self.seconds, 4), "items": self.items,
+                "per_second": round(rate, 1) if rate else None}
+
+
+def run_pipeline(path, engine=None, chunk=CHUNK_EVENTS):
+    """Run the detection pipeline over path, timing each stage separately.
+
+    Events are handled chunk by chunk so memory stays flat for any input
+    size: parse + normalize_event, then run_rules, then anomaly scoring, then
+    (with an engine) alert_row conversion and the group-commit write.
+    """
+    stages = {name: Stage() for name in ("ingest", "rules", "anomaly", "db_write")}
+    online = WindowedZScore()
+    lines = iter_lines(path)
+    rows = []
+    alerts_total = 0
+    clock = time.perf_counter
+    while True:
+        t0 = clock()
+        events = []
+        for line in lines:
+            line = line.strip()
+            if line:
+                events.append(normalize_event(json.loads(line)))
+                if len(events) == chunk:
+                    break
+        stages["ingest"].add(clock() - t0, len(events))
+        if not events:
+            break
+
+        t0 = clock()
+        alerts = [a for e in events for a in run_rules(e)]
+        stages["rules"].add(clock() - t0, len(events))
+
+        t0 = clock()
+        for e in events:
+            ip = e.get("src_ip") or "unknown"
+            hit = online.observe(ip, event_time(e))
+            if hit:
+                alerts.append(anomaly_alert(ip, *hit, ts=e.get("ts")))
+        stages["anomaly"].add(clock() - t0, len(events))
+        alerts_total += len(alerts)
+
+        if engine is not None:
+            t0 = clock()
+            rows.extend(alert_row(a) for a in alerts)
+            if len(rows) >= INGEST_BATCH_ROWS:
+                engine.write_alerts(rows)
+                stages["db_write"].add(clock() - t0, len(rows))
+                rows = []
+            else:
+                stages["db_write"].add(clock() - t0, 0)
+    if engine is not None and rows:
+        t0 = clock()
+        engine.write_alerts(rows)
+        stages["db_write"].add(clock() - t0, len(rows))
+    if engine is None:
+        del stages["db_write"]
+    return {name: s.result() for name, s in stages.items()}, alerts_total
+
+
+def measure_api(client, requests=200):
+    """Latency of each API_REQUESTS endpoint through the Flask test client, in ms.
+
+    The first request of each endpoint builds the response; later ones are
+    served from the versioned response cache, as they would be between writes.
+    """
+    results = {}
+    for name, url in API_REQUESTS:
+        samples = []
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            response = client.get(url)
+            samples.append((time.perf_counter() - t0) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned HTTP {response.status_code}")
+        warm = sorted(samples[1:]) or samples
+        results[name] = {
+            "requests": len(samples),
+            "cold_ms": round(samples[0], 3),
+            "p50_ms": round(median(warm), 3),
+            "p95_ms": round(warm[int(0.95 * (len(warm) - 1))], 3),
+            "p99_ms": round(warm[int(0.99 * (len(warm) - 1))], 3),
+            "max_ms": round(warm[-1], 3),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance=0.10):
+    """List regressions of results against a baseline results file.
+
+    A stage regresses when its throughput drops by more than `tolerance`; an
+    endpoint regresses when its p95 latency grows by more than `tolerance`.
+    """
+    regressions = []
+    for name, stage in results.get("stages", {}).items():
+        before = baseline.get("stages", {}).get(name, {}).get("per_second")
+        after = stage.get("per_second")
+        if before and after and after < before * (1 - tolerance):
+            regressions.append(f"{name}: {after:,.0f}/s vs {before:,.0f}/s baseline ({after / before - 1:+.1%})")
+    for name, endpoint in results.get("api", {}).items():
+        before = baseline.get("api", {}).get(name, {}).get("p95_ms")
+        after = endpoint.get("p95_ms")
+        if before and after and after > before * (1 + tolerance):
+            regressions.append(f"api {name}: p95 {after:.3f} ms vs {before:.3f} ms baseline ({after / before - 1:+.1%})")
+    return regressions
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run(args):
+    mix = parse_mix(args.mix)
+    output = os.path.abspath(args.output or os.path.join(
+        RESULTS_DIR, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"))
+    input_path = os.path.abspath(args.input) if args.input else None
+    workdir = tempfile.mkdtemp(prefix="zock-bench-")
+    results = {
+        "format": RESULTS_FORMAT,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "params": {"events": args.events, "seed": args.seed, "rate": args.rate, "mix": mix,
+                   "input": input_path, "api_requests": args.api_requests},
+        "stages": {},
+    }
+    engine = None
+    try:
+        if input_path is None:
+            input_path = os.path.join(workdir, "events.jsonl")
+            t0 = time.perf_counter()
+            n = write_events(input_path, generate_events(args.events, args.seed, mix, args.rate))
+            elapsed = time.perf_counter() - t0
+            results["generate"] = {"seconds": round(elapsed, 4), "items": n,
+                                   "bytes": os.path.getsize(input_path)}
+            print(f"generated {n:,} events in {elapsed:.1f}s")
+
+        if not args.no_db:  # app (and with it Flask) is only imported with a database
+            import app as zock_app
+            engine = zock_app.ZOCKEngine(os.path.join(workdir, "bench.db"), siem_targets=[], retention_days=0,
+                                         migrate=True)
+
+        stages, alerts = run_pipeline(input_path, engine, args.chunk)
+        results["stages"] = stages
+        results["alerts"] = alerts
+
+        if engine is not None and args.api_requests:
+            results["api"] = measure_api(zock_app.create_app(engine=engine).test_client(), args.api_requests)
+    finally:
+        if engine is not None:
+            engine.close()  # the writer thread and pooled connections hold files in workdir
+        if args.keep:
+            print(f"kept scratch files in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return results, output
+
+
+def report(results):
+    for name, stage in results["stages"].items():
+        rate = f"{stage['per_second']:>12,.0f}/s" if stage["per_second"] else f"{'-':>14}"
+        print(f"{name:<10} {stage['seconds']:>9.2f}s {stage['items']:>12,} items {rate}")
+    for name, endpoint in results.get("api", {}).items():
+        print(f"api {name:<18} p50 {endpoint['p50_ms']:>8.3f} ms  p95 {endpoint['p95_ms']:>8.3f} ms"
+              f"  cold {endpoint['cold_ms']:>8.3f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark ZOCK ingest, detection, storage and API stages")
+    ap.add_argument("-n", "--events", type=int, default=1_000_000, help="synthetic events to generate")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--mix", help="attack shares, e.g. failed_auth=0.05,sqli=0.01 "
+                                  f"(default {','.join(f'{k}={v}' for k, v in ATTACK_MIX.items())})")
+    ap.add_argument("--rate", type=int, default=1000, help="events per second of event time")
+    ap.add_argument("-i", "--input", help="benchmark an existing JSONL log instead of generating one")
+    ap.add_argument("--chunk", type=int, default=CHUNK_EVENTS, help="events per timed step")
+    ap.add_argument("--no-db", action="store_true", help="skip the database write and API stages")
+    ap.add_argument("--api-requests", type=int, default=200, help="requests per endpoint (0 skips the API stage)")
+    ap.add_argument("-o", "--output", help=f"results file (default {RESULTS_DIR}/bench-<time>.json)")
+    ap.add_argument("-b", "--baseline", help="results file to check for regressions against")
+    ap.add_argument("-t", "--tolerance", type=float, default=0.10, help="allowed slowdown vs the baseline")
+    ap.add_argument("--keep", action="store_true", help="keep the generated log and database")
+    args = ap.parse_args()
+
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        ap.error(str(e))
+    results, output = run(args)
+    report(results)
+    print(f"results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+# deps.py - optional dependencies, imported on first use rather than at start-up
+import importlib
+
+_modules = {}  # name -> module, or None when it is not installed
+
+
+def optional(name):
+    """Module `name`, imported on the first call; None when it is not installed.
+
+    numpy, pyarrow, dateutil and the like take from tens to over a hundred
+    milliseconds to import, which every web worker would otherwise pay at
+    start-up for features most requests never touch.
+    """
+    try:
+        return _modules[name]
+    except KeyError:
+        pass
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        module = None
+    _modules[name] = module
+    return module
+
+
+def loaded():
+    """{name: installed} for every optional module asked for so far"""
+    return {name: module is not None for name, module in sorted(_modules.items())}
@@ -0,0 +1,369 @@
+# detectors.py - compiled multi-pattern rule engine, loaded from a hot-reloadable rule pack
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from rulepack import RulePackError, load_pack
+
+DEFAULT_PACK = os.environ.get("ZOCK_RULES") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json")
+RULE_RELOAD_SECONDS = 2  # how often the watcher checks the pack file for changes
+DEFAULT_RECOMMENDATIONS = ("Investigate",)  # for detections the pack does not describe
+
+# A rule fires when any of its patterns matches. `literals` are strings of which
+# at least one must occur for any pattern to match; they feed the prefilter.
+# `entity` lists the event fields tried in order for the alert entity.
+Rule = namedtuple("Rule", "name patterns severity literals entity ignore_case",
+                  defaults=((), ("src_ip",), True))
+
+RULE_SAMPLE_EVERY = 256  # time the rules one by one on every Nth event
+
+
+class RuleSet:
+    """All rules compiled into one prefilter and one named-group alternation.
+
+    An event is scanned once by the combined matcher no matter how many rules
+    there are. Every alternative is a zero-width lookahead, so at each position
+    the first matching rule wins; the rules after it are re-checked only at the
+    positions where something matched, which keeps the result identical to
+    testing each rule separately.
+
+    For instrumentation every event is counted and each rule's matches are
+    counted. Every sample_every-th event is also run through each rule on
+    its own under a timer; stats() scales those samples up to an estimate of
+    the time each rule costs, without timing the combined matcher per event.
+    """
+
+    def __init__(self, rules, sample_every=RULE_SAMPLE_EVERY):
+        self.rules = tuple(rules)
+        self.sample_every = sample_every
+        self.scanned = 0
+        self.matched = [0] * len(self.rules)
+        self._sampled = 0
+        self._sample_seconds = [0.0] * len(self.rules)
+        self._compiled = []
+        alternatives = []
+        literals = []
+        for i, rule in enumerate(self.rules):
+            flag = "i" if rule.ignore_case else "-i"
+            body = "|".join(f"(?:{p})" for p in rule.patterns)
+            self._compiled.append(re.compile(f"(?{flag}:{body})"))
+            alternatives.append(f"(?=(?P<r{i}>(?{flag}:{body})))")
+            if not rule.literals:
+                literals = None
+            elif literals is not None:
+                literals.extend(lit.lower() for lit in rule.literals)
+        self._matcher = re.compile("|".join(alternatives)) if alternatives else None
+        # Only usable when every rule declares its literals. Matching lowercased
+        # literals against the lowercased text is conservative for
+        # case-sensitive rules too.
+        self.literals = tuple(dict.fromkeys(literals)) if literals else None
+        self.prefilter = re.compile(trie_pattern(literals)) if literals else None
+
+    def match(self, text):
+        """Return the rules matching text, in rule order"""
+        if self._matcher is None:
+            return []
+        self.scanned += 1
+        if self.sample_every and self.scanned % self.sample_every == 0:
+            self._sample(text)
+        if self.prefilter is not None and not self.prefilter.search(text.lower()):
+            return []
+        return self._scan(text)
+
+    def match_batch(self, texts, candidates=None):
+        """Return [(index, rules)] for the texts matching any rule, in index order.
+
+        candidates are the indexes of the texts that passed the prefilter,
+        when the caller already found them for the whole batch at once (see
+        batch_detect); the other texts are only counted.
+        """
+        if self._matcher is None:
+            return []
+        if self.sample_every:
+            # The same events match() would have sampled
+            for i in range((-self.scanned - 1) % self.sample_every, len(texts), self.sample_every):
+                self._sample(texts[i])
+        self.scanned += len(texts)
+        if candidates is None:
+            candidates = range(len(texts))
+            if self.prefilter is not None:
+                search = self.prefilter.search
+                candidates = [i for i, text in enumerate(texts) if search(text.lower())]
+        hits = []
+        for i in candidates:
+            rules = self._scan(texts[i])
+            if rules:
+                hits.append((i, rules))
+        return hits
+
+    def _scan(self, text):
+        hit = [False] * len(self.rules)
+        remaining = len(self.rules)
+        for m in self._matcher.finditer(text):
+            winner = int(m.lastgroup[1:])
+            if not hit[winner]:
+                hit[winner] = True
+                remaining -= 1
+            pos = m.start()
+            for j in range(winner + 1, len(self.rules)):
+                if not hit[j] and self._compiled[j].match(text, pos):
+                    hit[j] = True
+                    remaining -= 1
+            if not remaining:
+                break
+        matched = []
+        for i, h in enumerate(hit):
+            if h:
+                self.matched[i] += 1
+                matched.append(self.rules[i])
+        return matched
+
+    def adopt_stats(self, other):
+        """Continue the counters of the rules other has under the same names"""
+        previous = {rule.name: i for i, rule in enumerate(other.rules)}
+        self.scanned = other.scanned
+        self._sampled = other._sampled
+        for i, rule in enumerate(self.rules):
+            j = previous.get(rule.name)
+            if j is not None:
+                self.matched[i] = other.matched[j]
+                self._sample_seconds[i] = other._sample_seconds[j]
+
+    def stats(self):
+        """Per rule: name, events evaluated, matches and estimated seconds spent"""
+        scale = self.scanned / self._sampled if self._sampled else 0.0
+        return [{"rule": rule.name, "evaluations": self.scanned, "matches": m, "seconds": s * scale}
+                for rule, m, s in zip(self.rules, self.matched, self._sample_seconds)]
+
+    def _sample(self, text):
+        clock = time.perf_counter
+        for i, pattern in enumerate(self._compiled):
+            start = clock()
+            pattern.search(text)
+            self._sample_seconds[i] += clock() - start
+        self._sampled += 1
+
+
+def trie_pattern(words):
+    """Build a regex matching any of words, factored into a prefix trie.
+
+    Python's re engine tries alternatives one by one; sharing prefixes keeps
+    the work per text position close to constant as the word list grows.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        if "" in node and len(node) == 1:
+            return ""
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+def numbered_reference(pattern):
+    """The first reference to a group by number in pattern (\\1, (?(1)...)), or None.
+
+    Rules are compiled into one combined regex, where every group is
+    renumbered, so such a reference would silently point at another group.
+    """
+    i, in_class = 0, False
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            digits = re.match(r"\d+", pattern[i + 1:i + 3])
+            # \0 and three octal digits are character escapes, as is anything in a class
+            if not in_class and digits and digits[0][0] != "0" and not re.match(r"[0-7]{3}", pattern[i + 1:i + 4]):
+                return pattern[i:i + 1 + len(digits[0])]
+            i += 2
+            continue
+        if in_class:
+            in_class = ch != "]"
+        elif ch == "[":
+            in_class = True
+            i += 1
+            if pattern[i:i + 1] == "^":
+                i += 1
+            if pattern[i:i + 1] == "]":  # a leading ] is literal
+                i += 1
+            continue
+        elif pattern.startswith("(?(", i):
+            ref = re.match(r"\(\?\((\d+)\)", pattern[i:])
+            if ref:
+                return ref[0]
+        i += 1
+    return None
+
+
+# A rule pack compiled once: the RuleSet of its pattern rules, and OWASP categories,
+# recommendations and severity per detection name (tuples in read-only mappings)
+CompiledPack = namedtuple("CompiledPack", "name version ruleset owasp recommendations severity path mtime")
+
+
+def compile_pack(path):
+    mtime = os.stat(path).st_mtime_ns  # before reading: a write racing the load is seen by the next check
+    data = load_pack(path)
+    rules = []
+    for r in data["rules"]:
+        if not r["patterns"]:
+            continue
+        for pattern in r["patterns"]:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise RulePackError(f"{path}: rule '{r['name']}' pattern {pattern!r}: {e}") from None
+            ref = numbered_reference(pattern)
+            if ref:
+                raise RulePackError(f"{path}: rule '{r['name']}' pattern {pattern!r}: group reference {ref} by number "
+                                    "is not supported; use a named group and (?P=name)")
+        rules.append(Rule(r["name"], tuple(r["patterns"]), r["severity"], literals=tuple(r["literals"]),
+                          entity=tuple(r["entity"]), ignore_case=r["ignore_case"]))
+    try:
+        ruleset = RuleSet(rules)
+    except re.error as e:  # patterns that only clash once combined, e.g. repeated group names
+        raise RulePackError(f"{path}: {e}") from None
+    return CompiledPack(
+        data["name"], data["version"], ruleset,
+        MappingProxyType({r["name"]: tuple(r["owasp"]) for r in data["rules"]}),
+        MappingProxyType({r["name"]: tuple(r["recommendations"]) for r in data["rules"]}),
+        MappingProxyType({r["name"]: r["severity"] for r in data["rules"]}),
+        path, mtime)
+
+
+class LiveRules:
+    """The active rule pack, swapped for a newly compiled one when its file changes.
+
+    Detection reads `pack` once per event or batch and uses that object
+    throughout, so it never waits for a reload and never sees half a pack:
+    check() (run by the watch() thread, or directly) compiles a changed file
+    off the detection path and publishes it with one assignment. A pack that
+    fails to load leaves the previous one active, with the error in
+    last_error, until the file changes again.
+    """
+
+    def __init__(self, path=DEFAULT_PACK):
+        self.reloads = 0
+        self.last_error = None
+        self._failed_mtime = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.load(path)
+
+    def load(self, path):
+        """Make the pack at path active; raises RulePackError or OSError when it cannot be loaded"""
+        with self._lock:
+            self._publish(compile_pack(path))
+
+    def check(self):
+        """Reload the pack if its file changed; True when a new pack became active"""
+        with self._lock:
+            path = self.pack.path
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError as e:  # e.g. mid-save; tried again on the next check
+                self.last_error = str(e)
+                return False
+            if mtime in (self.pack.mtime, self._failed_mtime):
+                return False
+            try:
+                pack = compile_pack(path)
+            except (OSError, RulePackError) as e:
+                self.last_error = str(e)
+                self._failed_mtime = mtime
+                return False
+            self._publish(pack)
+            self.reloads += 1
+            return True
+
+    def _publish(self, pack):
+        current = getattr(self, "pack", None)
+        if current is not None:
+            pack.ruleset.adopt_stats(current.ruleset)
+        self.pack = pack
+        self.last_error = None
+        self._failed_mtime = None
+
+    def watch(self, interval=RULE_RELOAD_SECONDS):
+        """Check for changes in a background thread every `interval` seconds"""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                self.check()
+
+        self._thread = threading.Thread(target=run, name="zock-rules", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._stop.clear()
+
+    def status(self):
+        pack = self.pack
+        return {"name": pack.name, "version": pack.version, "path": pack.path,
+                "rules": [rule.name for rule in pack.ruleset.rules],
+                "detections": list(pack.owasp), "reloads": self.reloads, "last_error": self.last_error}
+
+
+RULES = LiveRules()
+
+
+def run_rules(evt, pack=None):
+    pack = RULES.pack if pack is None else pack
+    msg = evt.get("msg") or ""
+    return [make_alert(rule.name, evt, entity=entity_for(rule, evt), severity=rule.severity, pack=pack)
+            for rule in pack.ruleset.match(msg)]
+
+
+def entity_for(rule, evt):
+    for field in rule.entity:
+        if evt.get(field):
+            return evt[field]
+    return "unknown"
+
+
+def make_alert(detection_name, evt, entity, severity="low", pack=None):
+    pack = RULES.pack if pack is None else pack
+    return {
+        "ts": evt.get("ts"),
+        "detection": detection_name,
+        "severity": severity,
+        "entity": entity,
+        "evidence": {
+            "msg": evt.get("msg"),
+            "src_ip": evt.get("src_ip"),
+            "user": evt.get("user"),
+            "service": evt.get("service")
+        },
+        "owasp": owasp_for(detection_name, pack),
+        "recommendations": recommendations_for(detection_name, pack)
+    }
+
+
+def owasp_for(detection_name, pack=None):
+    pack = RULES.pack if pack is None else pack
+    return list(pack.owasp.get(detection_name, ()))
+
+
+def recommendations_for(detection_name, pack=None):
+    pack = RULES.pack if pack is None else pack
+    return list(pack.recommendations.get(detection_name) or DEFAULT_RECOMMENDATIONS)
+
+
+def severity_for(detection_name, default="medium", pack=None):
+    pack = RULES.pack if pack is None else pack
+    return pack.severity.get(detection_name, default)
@@ -0,0 +1,153 @@
+# export.py - alert exports (NDJSON, CSV, Parquet) encoded and compressed as a stream of chunks
+import csv
+import io
+import zlib
+
+from deps import optional
+from serialization import CHUNK_SIZE, dumps, iter_json_lines
+from storage import ALERT_COLUMNS
+
+# zstandard (zstd exports) and pyarrow (Parquet exports) are optional and
+# imported on first use, see deps.optional
+
+# agg_key only matters to the live aggregator
+EXPORT_COLUMNS = ('id',) + tuple(c for c in ALERT_COLUMNS if c != 'agg_key')
+FORMATS = {'ndjson': ('application/x-ndjson', 'ndjson'), 'csv': ('text/csv', 'csv'),
+           'parquet': ('application/vnd.apache.parquet', 'parquet')}
+COMPRESSIONS = {'none': None, 'gzip': 'gz', 'zstd': 'zst'}
+PARQUET_ROW_GROUP = 50000  # rows buffered per Parquet row group
+
+INTEGER_COLUMNS = ('id', 'ts', 'count', 'last_ts')
+
+
+class ExportError(Exception):
+    pass
+
+
+def check(fmt, compression):
+    """Raise ExportError unless fmt and compression can be produced here"""
+    if fmt not in FORMATS:
+        raise ExportError(f"format must be one of {', '.join(FORMATS)}")
+    if compression not in COMPRESSIONS:
+        raise ExportError(f"compression must be one of {', '.join(COMPRESSIONS)}")
+    if fmt == 'parquet' and optional('pyarrow.parquet') is None:
+        raise ExportError("parquet export needs 'pyarrow' installed")
+    if compression == 'zstd' and optional('zstandard') is None:
+        raise ExportError("zstd compression needs 'zstandard' installed")
+
+
+def filename(base, fmt, compression):
+    """Download name; Parquet compresses inside the file, so it keeps its own extension"""
+    name = f'{base}.{FORMATS[fmt][1]}'
+    if fmt != 'parquet' and COMPRESSIONS[compression]:
+        name += '.' + COMPRESSIONS[compression]
+    return name
+
+
+def media_type(fmt, compression):
+    if fmt == 'parquet' or compression == 'none':
+        return FORMATS[fmt][0]
+    return 'application/gzip' if compression == 'gzip' else 'application/zstd'
+
+
+def export_chunks(alerts, fmt='ndjson', compression='none'):
+    """Encode alert dicts (as ZOCKEngine.iter_alerts yields them) chunk by chunk.
+
+    Chunks are about CHUNK_SIZE bytes before compression (a row group for
+    Parquet), so memory stays bounded however many alerts there are.
+    """
+    check(fmt, compression)
+    if fmt == 'parquet':
+        return iter_parquet(alerts, None if compression == 'none' else compression)
+    chunks = iter_json_lines(alerts) if fmt == 'ndjson' else iter_csv(alerts)
+    return compress(chunks, compression)
+
+
+def iter_csv(alerts, columns=EXPORT_COLUMNS):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for alert in alerts:
+        writer.writerow([csv_value(alert.get(c)) for c in columns])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def csv_value(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (list, dict)):
+        return dumps(value).decode('utf-8')
+    return value
+
+
+def compress(chunks, compression):
+    if compression == 'none':
+        yield from chunks
+        return
+    if compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    else:
+        compressor = optional('zstandard').ZstdCompressor().compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands what was written back to the caller with take()"""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def take(self):
+        data, self._parts = b''.join(self._parts), []
+        return data
+
+
+def parquet_schema():
+    pa = optional('pyarrow')
+    types = {'siem_sent': pa.bool_()}
+    types.update((c, pa.int64()) for c in INTEGER_COLUMNS)
+    return pa.schema([(c, types.get(c, pa.string())) for c in EXPORT_COLUMNS])
+
+
+def iter_parquet(alerts, compression=None, row_group=PARQUET_ROW_GROUP):
+    """Parquet, one row group at a time; the footer goes out with the last chunk"""
+    pa, pq = optional('pyarrow'), optional('pyarrow.parquet')
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression=compression or 'none')
+    columns = {c: [] for c in EXPORT_COLUMNS}
+    rows = 0
+    for alert in alerts:
+        for c in EXPORT_COLUMNS:
+            value = alert.get(c)
+            columns[c].append(dumps(value).decode('utf-8') if isinstance(value, list) else value)
+        rows += 1
+        if rows == row_group:
+            writer.write_table(pa.table(columns, schema=schema))
+            columns = {c: [] for c in EXPORT_COLUMNS}
+            rows = 0
+            yield sink.take()
+    if rows:
+        writer.write_table(pa.table(columns, schema=schema))
+    writer.close()
+    yield sink.take()
@@ -0,0 +1,161 @@
+# ingest.py - streaming log readers (plain, gzip, zstd) shared by main.py and the analyzer
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from deps import optional
+
+# dateutil (falls back to the stdlib ISO-8601 parser) and zstandard (only
+# needed for .zst inputs) are optional and imported on first use
+
+CHUNK_SIZE = 1 << 20  # 1 MiB reads keep memory flat regardless of file size
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def open_log(path):
+    """Open a log file as a binary stream, transparently decompressing gzip/zstd"""
+    if path == "-":
+        return sys.stdin.buffer
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, "rb")
+    if magic.startswith(ZSTD_MAGIC):
+        zstandard = optional("zstandard")
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd-compressed; install 'zstandard' to read it")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+def is_compressed(path):
+    if path == "-":
+        return False
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    return magic.startswith(GZIP_MAGIC) or magic.startswith(ZSTD_MAGIC)
+
+
+def iter_lines(path, follow=False, chunk_size=CHUNK_SIZE, poll_interval=0.5):
+    """Yield decoded lines from path, reading chunk by chunk.
+
+    With follow=True the reader behaves like `tail -F`: at EOF it waits for more
+    data, and reopens the file when it is rotated or truncated.
+    """
+    if follow and (path == "-" or is_compressed(path)):
+        raise ValueError("follow mode needs an uncompressed log file")
+
+    f = open_log(path)
+    inode = os.fstat(f.fileno()).st_ino if follow else None
+    pending = b""
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    yield line.decode("utf-8", errors="replace")
+                continue
+            if not follow:
+                break
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                st = None  # mid-rotation; keep polling
+            if st is not None and st.st_ino != inode:
+                # Rotated: the old handle is fully drained, switch to the new file
+                f.close()
+                f = open(path, "rb")
+                inode = os.fstat(f.fileno()).st_ino
+                continue
+            if st is not None and st.st_size < f.tell():
+                f.seek(0)  # truncated in place
+                pending = b""
+                continue
+            time.sleep(poll_interval)
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+
+def shard_ranges(path, shards):
+    """Split a plain file into up to `shards` newline-aligned (start, end) byte ranges"""
+    size = os.path.getsize(path)
+    cuts = [0]
+    with open(path, "rb") as f:
+        for i in range(1, shards):
+            target = size * i // shards
+            if target <= cuts[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline()  # move to the start of the next full line
+            pos = f.tell()
+            if cuts[-1] < pos < size:
+                cuts.append(pos)
+    cuts.append(size)
+    return list(zip(cuts, cuts[1:]))
+
+
+def iter_range_lines(path, start, end, chunk_size=CHUNK_SIZE):
+    """Yield the lines of a plain file between two newline-aligned offsets"""
+    pending = b""
+    with open(path, "rb") as f:
+        f.seek(start)
+        left = end - start
+        while left > 0:
+            chunk = f.read(min(chunk_size, left))
+            if not chunk:
+                break
+            left -= len(chunk)
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line.decode("utf-8", errors="replace")
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+
+def read_jsonl(path, follow=False):
+    return parse_jsonl(iter_lines(path, follow=follow))
+
+
+def parse_jsonl(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+            yield normalize_event(obj)
+        except json.JSONDecodeError:
+            continue
+
+
+def parse_ts(ts):
+    parser = optional("dateutil.parser")
+    if parser is not None:
+        return parser.isoparse(ts)
+    return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+
+
+def normalize_event(evt):
+    ts = evt.get("ts")
+    try:
+        ts_norm = parse_ts(ts).isoformat() if ts else None
+    except Exception:
+        ts_norm = ts
+    return {
+        "ts": ts_norm,
+        "src_ip": evt.get("src_ip"),
+        "user": evt.get("user"),
+        "service": evt.get("service"),
+        "msg": evt.get("msg", ""),
+        "raw": evt
+    }
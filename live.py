@@ -0,0 +1,74 @@
+# live.py - in-process change notifications, versioned response caching and SSE framing
+import threading
+from collections import OrderedDict, deque
+
+from serialization import dumps_str
+
+
+class ChangeNotifier:
+    """Wakes stream handlers when alerts change.
+
+    Writers publish after their transaction commits; each stream waits on the
+    sequence number it last saw, so an idle stream costs nothing until there is
+    something to send. Recent events are kept so a stream that was busy
+    sending does not miss one.
+    """
+
+    def __init__(self, history=256):
+        self.seq = 0
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)
+
+    def publish(self, kind, data=None):
+        with self._cond:
+            self.seq += 1
+            self._events.append((self.seq, kind, data))
+            self._cond.notify_all()
+
+    def wait(self, seq, timeout):
+        """Block until something newer than seq is published; return (seq, [(kind, data), ...])"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq != seq, timeout)
+            return self.seq, [(kind, data) for s, kind, data in self._events if s > seq]
+
+
+class ResponseCache:
+    """Serialized response bodies, each valid for the data version it was built at.
+
+    Entries are keyed by request (path and query string); a lookup at a newer
+    version misses and the entry is rebuilt. The least recently used entries
+    are dropped beyond max_entries.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {dumps_str(data)}')
+    return '\n'.join(lines) + '\n\n'
@@ -1,107 +1,173 @@
 import re
+import argparse
 import json
-import numpy as np
+import time
+from collections import Counter
 from datetime import datetime
-from owasp_mapping import OWASP_MAPPING
-
-# Load logs
-with open("sample_logs.txt", "r") as f:
-    logs = f.readlines()
-
-alerts = []
-
-# === Detection Rules ===
-failed_auth_count = {}
-for line in logs:
-    ts = datetime.now().isoformat()
-    if "failed password" in line.lower():
-        user = re.search(r"user=(\w+)", line)
-        ip = re.search(r"from ([\d\.]+)", line)
-        entity = user.group(1) if user else "unknown"
-        src_ip = ip.group(1) if ip else "unknown"
-
-        failed_auth_count[src_ip] = failed_auth_count.get(src_ip, 0) + 1
-        alerts.append({
-            "ts": ts,
-            "detection": "Failed authentication",
-            "severity": "low",
-            "entity": entity,
-            "evidence": {"src_ip": src_ip, "user": entity},
-            "owasp": OWASP_MAPPING["Failed authentication"],
-            "recommendations": [
-                "Monitor for password spraying",
-                "Enforce MFA",
-                "Alert if threshold exceeded"
-            ]
-        })
-
-    if "union select" in line.lower():
-        alerts.append({
-            "ts": ts,
-            "detection": "Injection pattern",
-            "severity": "high",
-            "entity": "database",
-            "evidence": {"payload": line.strip()},
-            "owasp": OWASP_MAPPING["Injection pattern"],
-            "recommendations": [
-                "Use parameterized queries",
-                "Apply WAF rules for SQL injection"
-            ]
-        })
-
-    if "GET /admin unauthenticated" in line:
-        alerts.append({
-            "ts": ts,
-            "detection": "Unauthenticated access to admin path",
-            "severity": "medium",
-            "entity": "web-server",
-            "evidence": {"request": line.strip()},
-            "owasp": OWASP_MAPPING["Unauthenticated access to admin path"],
-            "recommendations": [
-                "Restrict admin panel to VPN or specific IPs",
-                "Enable 2FA on admin login"
-            ]
-        })
-
-    if "../" in line:
-        alerts.append({
-            "ts": ts,
-            "detection": "Path traversal attempt",
-            "severity": "critical",
-            "entity": "filesystem",
-            "evidence": {"request": line.strip()},
-            "owasp": OWASP_MAPPING["Path traversal attempt"],
-            "recommendations": [
-                "Sanitize user input",
-                "Harden file system permissions"
-            ]
-        })
-
-# === Behavioral Anomaly Detection (Z-Score) ===
-login_counts = np.array(list(failed_auth_count.values()))
-if len(login_counts) > 0:
-    mean = np.mean(login_counts)
-    std = np.std(login_counts)
-    for ip, count in failed_auth_count.items():
-        if std > 0 and (count - mean) / std >= 3.0:
-            alerts.append({
-                "ts": datetime.now().isoformat(),
-                "detection": "Behavioral anomaly",
-                "severity": "high",
-                "entity": ip,
-                "evidence": {"login_count": count},
-                "owasp": OWASP_MAPPING["Behavioral anomaly"],
-                "recommendations": [
-                    "Investigate possible brute force attack",
-                    "Block suspicious IP at firewall"
-                ]
-            })
-
-# Save alerts
-with open("alerts.jsonl", "w") as f:
+from aggregation import AlertAggregator, aggregate_alerts, closed_alerts
+from anomaly import WindowedZScore, anomaly_alert, event_time
+from detectors import RULES, entity_for, make_alert
+from ingest import iter_lines, parse_ts
+from serialization import JSONLWriter
+from state_store import DEFAULT_MAX_ENTRIES, entries_for_budget
+
+
+# === Detection (rules from the active rule pack, see detectors.RULES) ===
+ANOMALY_TRIGGER = "Failed authentication"  # the detection whose source IPs are scored for anomalies
+
+
+ISO_TS = re.compile(r"\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d(?:\.\d+)?(?:Z|[+-]\d\d:?\d\d)?")
+SYSLOG_TS = re.compile(r"^([A-Z][a-z]{2}) +(\d{1,2}) (\d\d:\d\d:\d\d)\b")
+
+
+def line_time(line):
+    """The time a log line records, as ISO-8601: the first ISO-8601 timestamp
+    in it, or a leading syslog "Mon DD HH:MM:SS" (taken to be this year); None
+    when it has neither"""
+    m = ISO_TS.search(line)
+    if m:
+        try:
+            return parse_ts(m.group(0).replace(" ", "T", 1)).isoformat()
+        except ValueError:
+            pass
+    m = SYSLOG_TS.match(line)
+    if m:
+        try:
+            return datetime.strptime(f"{datetime.now().year} {m.group(1)} {m.group(2)} {m.group(3)}",
+                                     "%Y %b %d %H:%M:%S").isoformat()
+        except ValueError:
+            pass
+    return None
+
+
+def line_event(line):
+    """The event fields a log line carries. A JSON object line gives them
+    directly (msg is empty when it has none); a plain line gives its message,
+    the user and source IP it names and the time it records. ts is the wall
+    clock only when the line has no time."""
+    if is_json_line(line):
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            obj = None
+        if isinstance(obj, dict):
+            ts, msg = obj.get("ts"), obj.get("msg")
+            return {
+                "ts": ts if isinstance(ts, str) and ts else datetime.now().isoformat(),
+                "msg": msg if isinstance(msg, str) else "",
+                "src_ip": obj.get("src_ip"),
+                "user": obj.get("user"),
+                "service": obj.get("service"),
+            }
+    user = re.search(r"user=(\w+)", line)
+    ip = re.search(r"from ([\d\.]+)", line)
+    return {
+        "ts": line_time(line) or datetime.now().isoformat(),
+        "msg": line.strip(),
+        "src_ip": ip.group(1) if ip else None,
+        "user": user.group(1) if user else None,
+        "service": None,
+    }
+
+
+def is_json_line(line):
+    return line.lstrip().startswith("{")
+
+
+def detect_line(line, anomalies, pack=None):
+    """Yield the alerts raised by a single log line.
+
+    Rules see the event's message only, never the other fields of a JSON
+    line. A plain line is its message, so one no rule matches is not parsed.
+    """
+    pack = RULES.pack if pack is None else pack
+    if is_json_line(line):
+        evt = line_event(line)
+        rules = pack.ruleset.match(evt["msg"])
+    else:
+        rules = pack.ruleset.match(line)
+        evt = line_event(line) if rules else None
+    if not rules:
+        return
+    for rule in rules:
+        yield make_alert(rule.name, evt, entity=entity_for(rule, evt), severity=rule.severity, pack=pack)
+        if rule.name == ANOMALY_TRIGGER:
+            src_ip = evt["src_ip"] or "unknown"
+            anomaly = anomalies.observe(src_ip, event_time(evt))
+            if anomaly:
+                yield anomaly_alert(src_ip, *anomaly, ts=evt["ts"], pack=pack, count_key="login_count")
+
+
+def detect(lines, anomalies):
+    for line in lines:
+        yield from detect_line(line, anomalies)  # each line uses the pack active when it arrives
+
+
+# === Sink ===
+def write_alerts(alerts, out, counts):
+    """Write alerts to a JSONLWriter as they arrive, tallying them per detection"""
     for alert in alerts:
-        f.write(json.dumps(alert) + "\n")
+        out.write(alert)
+        counts[alert["detection"]] += 1
+
+
+def run(input_path, out_path, follow=False, anomalies=None, aggregate=None):
+    """Detect over input_path into out_path; with aggregate (seconds), repeats
+    of a detection for the same entity within a window become one alert with
+    a count (see aggregation.aggregate_alerts)"""
+    anomalies = anomalies or WindowedZScore()
+    aggregator = AlertAggregator(aggregate) if aggregate else None
+    counts = Counter()
+    with open(out_path, "wb") as f, JSONLWriter(f, flush=follow) as out:
+        try:
+            alerts = detect(iter_lines(input_path, follow=follow), anomalies)
+            if aggregator is not None:
+                alerts = aggregate_alerts(alerts, aggregator, clock=time.time)
+            write_alerts(alerts, out, counts)
+        except KeyboardInterrupt:
+            pass  # --follow runs until interrupted
+        finally:
+            state = anomalies.stats()
+            anomalies.close()
+        if aggregator is not None:
+            write_alerts(closed_alerts(aggregator.flush()), out, counts)  # windows still open when interrupted
+    return counts, state
+
+
+def main():
+    ap = argparse.ArgumentParser(description="ZOCK log detector")
+    ap.add_argument("input", nargs="?", default="sample_logs.txt",
+                    help="log file (plain, .gz or .zst), or - for stdin")
+    ap.add_argument("-o", "--output", default="alerts.jsonl")
+    ap.add_argument("-f", "--follow", action="store_true",
+                    help="keep reading as the log grows, like tail -F")
+    ap.add_argument("-w", "--window", type=int, default=300,
+                    help="anomaly window length in seconds")
+    ap.add_argument("-z", "--z-threshold", type=float, default=3.0)
+    ap.add_argument("--state", help="file to persist anomaly baselines across restarts")
+    ap.add_argument("--aggregate", type=int, metavar="SECONDS",
+                    help="merge repeats of a detection per entity within windows of this length")
+    ap.add_argument("--rules", help="rule pack (JSON, or YAML with PyYAML) instead of $ZOCK_RULES or rules.json; "
+                                    "with --follow, edits to it take effect without a restart")
+    ap.add_argument("--state-memory", type=float, metavar="MB",
+                    help="memory for per-IP anomaly state; least recently seen IPs are dropped "
+                         "past it (default: %d IPs)" % DEFAULT_MAX_ENTRIES)
+    args = ap.parse_args()
+    if args.rules:
+        RULES.load(args.rules)
+    if args.follow:
+        RULES.watch()
+
+    max_entities = entries_for_budget(args.state_memory) if args.state_memory else DEFAULT_MAX_ENTRIES
+    anomalies = WindowedZScore(args.window, args.z_threshold, state_path=args.state, max_entities=max_entities)
+    counts, state = run(args.input, args.output, follow=args.follow, anomalies=anomalies, aggregate=args.aggregate)
+
+    print(f"=== Alerts generated: {sum(counts.values())} (written to {args.output}) ===")
+    for det in counts:
+        print("-", det)
+    print(f"Entity state: {state['entries']} IPs held, hit rate {state['hit_rate']}, "
+          f"{state['evictions']} evicted")
+
 
-print(f"=== Alerts generated: {len(alerts)} (written to alerts.jsonl) ===")
-for det in set([a["detection"] for a in alerts]):
-    print("-", det)
+if __name__ == "__main__":
+    main()
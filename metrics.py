@@ -0,0 +1,177 @@
+# metrics.py - low-overhead counters, latency histograms and Prometheus text exposition
+import bisect
+import threading
+import time
+from collections import deque
+
+# Upper bounds in seconds; an implicit +Inf bucket follows
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Latency distribution over fixed buckets, as Prometheus histograms count them.
+
+    observe() is a bisect and three additions, so it can sit on hot paths;
+    quantiles are estimated as the upper bound of the bucket they fall in.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        counts, _, count = self.snapshot()
+        if not count:
+            return None
+        rank, seen = q * count, 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        """Count, mean and estimated p50/p95/p99 in milliseconds"""
+        _, total, count = self.snapshot()
+        summary = {'count': count, 'mean_ms': round(total / count * 1000, 3) if count else None}
+        for q in (0.5, 0.95, 0.99):
+            bound = self.quantile(q)
+            summary[f'p{int(q * 100)}_ms'] = bound * 1000 if bound not in (None, float('inf')) else bound
+        return summary
+
+
+class RateSeries:
+    """Counts per fixed interval over the last `points` intervals, for charts"""
+
+    def __init__(self, interval=10, points=60):
+        self.interval = interval
+        self.points = points
+        self._buckets = deque(maxlen=points)  # [interval start, count], oldest first
+        self._lock = threading.Lock()
+
+    def add(self, n=1, now=None):
+        start = int((now or time.time()) // self.interval * self.interval)
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] < start:
+                self._buckets.append([start, 0])
+            self._buckets[-1][1] += n
+
+    def series(self, now=None):
+        """(interval starts, per-second rates) newest first; idle intervals are 0"""
+        current = int((now or time.time()) // self.interval * self.interval)
+        with self._lock:
+            counts = {start: n for start, n in self._buckets}
+        starts = [current - i * self.interval for i in range(self.points)]
+        return starts, [counts.get(s, 0) / self.interval for s in starts]
+
+
+class Metrics:
+    """Named counters and histograms with labels, plus collectors read at scrape time.
+
+    Counters and histograms are updated as things happen; values that already
+    live elsewhere (queue depths, per-rule statistics) are pulled by collector
+    functions only when the metrics are read, so they cost nothing in between.
+    """
+
+    def __init__(self, interval=10, points=60):
+        self.events = RateSeries(interval, points)
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def add_histogram(self, name, histogram, **labels):
+        """Expose a histogram owned by another component"""
+        with self._lock:
+            self._histograms[(name, tuple(sorted(labels.items())))] = histogram
+
+    def observe(self, name, seconds, **labels):
+        self.histogram(name, **labels).observe(seconds)
+
+    def add_collector(self, collect):
+        """collect() returns [(name, labels dict, value), ...] of current values"""
+        self._collectors.append(collect)
+
+    def samples(self):
+        with self._lock:
+            samples = [(name, dict(labels), value) for (name, labels), value in self._counters.items()]
+            histograms = list(self._histograms.items())
+        for collect in self._collectors:
+            samples.extend(collect())
+        return samples, [(name, dict(labels), h) for (name, labels), h in histograms]
+
+    def prometheus(self):
+        """Prometheus text exposition format, version 0.0.4"""
+        samples, histograms = self.samples()
+        lines, described = [], set()
+
+        def header(name, default_kind):
+            if name not in described:
+                described.add(name)
+                kind, text = self._help.get(name, (default_kind, ''))
+                if text:
+                    lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for name, labels, value in sorted(samples, key=lambda s: s[0]):
+            header(name, 'gauge')
+            lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        for name, labels, histogram in sorted(histograms, key=lambda h: h[0]):
+            header(name, 'histogram')
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, n in zip(histogram.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{format_labels({**labels, "le": le})} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(total)}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+def format_value(value):
+    if not isinstance(value, float):
+        return str(int(value))
+    if value != value:
+        return 'NaN'
+    if abs(value) == float('inf'):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
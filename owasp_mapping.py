@@ -1,9 +1,20 @@
 # owasp_mapping.py
+from collections.abc import Mapping
 
-OWASP_MAPPING = {
-    "Failed authentication": ["A07:2021-Identification and Authentication Failures"],
-    "Injection pattern": ["A03:2021-Injection"],
-    "Unauthenticated access to admin path": ["A01:2021-Broken Access Control"],
-    "Path traversal attempt": ["A05:2021-Security Misconfiguration"],
-    "Behavioral anomaly": ["A10:2021-Server-Side Request Forgery (SSRF)"]
-}
+from detectors import RULES
+
+
+class PackOWASPMapping(Mapping):
+    """Detection name -> OWASP categories, read from the active rule pack (so it follows reloads)"""
+
+    def __getitem__(self, detection):
+        return list(RULES.pack.owasp[detection])
+
+    def __iter__(self):
+        return iter(RULES.pack.owasp)
+
+    def __len__(self):
+        return len(RULES.pack.owasp)
+
+
+OWASP_MAPPING = PackOWASPMapping()
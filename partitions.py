@@ -0,0 +1,491 @@
+# partitions.py - alerts stored as one table per ingestion day, with retention
+import bisect
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from sketches import AlertSketches
+
+# Equality filters accepted by the API; each has a (column, ts) index per partition
+FILTER_COLUMNS = ('severity', 'threat_type', 'source_ip', 'siem_sent')
+ID_SHIFT = 32  # alert ids are (ingestion day << ID_SHIFT) + sequence within the day
+LEGACY_TABLE = 'alerts_legacy'  # the unpartitioned table of a pre-partitioning database
+SCHEMA_VERSION = 5
+VACUUM_STEP_PAGES = 2048  # pages freed per write-lock hold, so writers are never held up for long
+
+Partition = namedtuple('Partition', 'name day first_id min_ts max_ts')
+
+
+class SchemaError(Exception):
+    pass
+
+
+PARTITION_SQL = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        threat_type TEXT,
+        detection TEXT,
+        severity TEXT,
+        source_ip TEXT,
+        entity TEXT,
+        owasp_category TEXT,
+        log_data TEXT,
+        ai_analysis TEXT,
+        siem_sent BOOLEAN DEFAULT 0,
+        siem_platforms TEXT,
+        ts INTEGER NOT NULL DEFAULT 0,  -- event time, epoch seconds; `timestamp` is its display form
+        count INTEGER NOT NULL DEFAULT 1,  -- alerts merged into this row by aggregation
+        last_ts INTEGER,  -- event time of the latest of them
+        samples TEXT,  -- JSON list of distinct evidence from them
+        agg_key TEXT  -- identifies the open aggregate that updates this row
+    )
+'''
+
+# Columns added to existing partitions with ALTER TABLE, by schema version
+ADDED_COLUMNS = (
+    (2, 'ts', 'INTEGER NOT NULL DEFAULT 0'),
+    (3, 'count', 'INTEGER NOT NULL DEFAULT 1'),
+    (3, 'last_ts', 'INTEGER'),
+    (3, 'samples', 'TEXT'),
+    (3, 'agg_key', 'TEXT'),
+)
+
+# Inserts are counted per batch by the writer; a per-row trigger costs more
+# than the insert itself at bulk-ingest rates. Deletes and updates are rare.
+PARTITION_TRIGGERS = ('''
+    CREATE TRIGGER IF NOT EXISTS {name}_stats_delete AFTER DELETE ON {name} BEGIN
+        UPDATE alert_counters SET value = value - CASE name
+            WHEN 'total_alerts' THEN 1
+            WHEN 'siem_alerts' THEN OLD.siem_sent = 1
+            WHEN 'critical_alerts' THEN OLD.severity = 'Critical'
+            WHEN 'high_alerts' THEN OLD.severity = 'High'
+            ELSE 1 END
+            WHERE part = '{name}' AND name IN ('total_alerts', 'siem_alerts', 'critical_alerts', 'high_alerts',
+                                               'threat:' || OLD.threat_type);
+        UPDATE alert_minutes SET n = n - 1 WHERE minute = OLD.ts / 60 AND part = '{name}';
+        DELETE FROM alert_minutes WHERE minute = OLD.ts / 60 AND part = '{name}' AND n <= 0;
+    END
+''', '''
+    CREATE TRIGGER IF NOT EXISTS {name}_stats_update AFTER UPDATE OF siem_sent, severity, ts ON {name} BEGIN
+        UPDATE alert_counters SET value = value + CASE name
+            WHEN 'siem_alerts' THEN (NEW.siem_sent = 1) - (OLD.siem_sent = 1)
+            WHEN 'critical_alerts' THEN (NEW.severity = 'Critical') - (OLD.severity = 'Critical')
+            WHEN 'high_alerts' THEN (NEW.severity = 'High') - (OLD.severity = 'High')
+            ELSE 0 END
+            WHERE part = '{name}' AND name IN ('siem_alerts', 'critical_alerts', 'high_alerts');
+        UPDATE alert_minutes SET n = n - 1
+            WHERE minute = OLD.ts / 60 AND part = '{name}' AND OLD.ts IS NOT NEW.ts;
+        INSERT INTO alert_minutes (minute, part, n)
+            SELECT NEW.ts / 60, '{name}', 1 WHERE OLD.ts IS NOT NEW.ts
+            ON CONFLICT(minute, part) DO UPDATE SET n = n + 1;
+        UPDATE partitions SET min_ts = min(COALESCE(min_ts, NEW.ts), NEW.ts),
+                              max_ts = max(COALESCE(max_ts, NEW.ts), NEW.ts)
+            WHERE name = '{name}' AND OLD.ts IS NOT NEW.ts;
+    END
+''')
+
+# Full-text index over each partition's evidence ({name}_fts), stored by
+# reference to the partition's own rows; prefix indexes make foo* queries cheap.
+# Like the counters, inserts are indexed per batch (INDEX_NEW_ROWS_SQL): FTS5
+# takes a batch in one statement several times faster than row by row.
+SEARCH_COLUMNS = ('log_data', 'ai_analysis', 'samples')
+FTS_SQL = (f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {{name}}_fts USING fts5(
+        {', '.join(SEARCH_COLUMNS)}, content='{{name}}', content_rowid='id', prefix='2 3'
+    )
+''', f'''
+    CREATE TRIGGER IF NOT EXISTS {{name}}_fts_delete AFTER DELETE ON {{name}} BEGIN
+        INSERT INTO {{name}}_fts ({{name}}_fts, rowid, {', '.join(SEARCH_COLUMNS)})
+            VALUES ('delete', OLD.id, {', '.join('OLD.' + c for c in SEARCH_COLUMNS)});
+    END
+''', f'''
+    CREATE TRIGGER IF NOT EXISTS {{name}}_fts_update AFTER UPDATE OF {', '.join(SEARCH_COLUMNS)} ON {{name}} BEGIN
+        INSERT INTO {{name}}_fts ({{name}}_fts, rowid, {', '.join(SEARCH_COLUMNS)})
+            VALUES ('delete', OLD.id, {', '.join('OLD.' + c for c in SEARCH_COLUMNS)});
+        INSERT INTO {{name}}_fts (rowid, {', '.join(SEARCH_COLUMNS)})
+            VALUES (NEW.id, {', '.join('NEW.' + c for c in SEARCH_COLUMNS)});
+    END
+''')
+
+# Indexes the rows of {name} added since the last run and moves its high-water
+# mark; runs after every batch of inserts, in the same transaction
+INDEX_NEW_ROWS_SQL = (f'''
+    INSERT INTO {{name}}_fts (rowid, {', '.join(SEARCH_COLUMNS)})
+    SELECT id, {', '.join(SEARCH_COLUMNS)} FROM {{name}}
+    WHERE id > COALESCE((SELECT value FROM partition_meta WHERE name = 'fts:{{name}}'), 0)
+''', '''
+    INSERT INTO partition_meta (name, value) SELECT 'fts:{name}', COALESCE(MAX(id), 0) FROM {name} WHERE true
+    ON CONFLICT(name) DO UPDATE SET value = excluded.value
+''')
+
+# Keeps each partition's event-time (ts) range current for query routing
+EXTEND_RANGE_SQL = '''
+    UPDATE partitions SET min_ts = min(COALESCE(min_ts, ?1), ?1), max_ts = max(COALESCE(max_ts, ?2), ?2)
+    WHERE name = ?3
+'''
+
+
+def today():
+    return int(time.time() // 86400)
+
+
+# Epoch seconds of a local 'YYYY-MM-DD HH:MM:SS' column; 0 when it is not in that form
+TS_FROM_TIMESTAMP_SQL = '''
+    CASE WHEN timestamp GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] *'
+    THEN COALESCE(CAST(strftime('%s', timestamp, 'utc') AS INTEGER), 0) ELSE 0 END
+'''
+
+
+def partition_name(day):
+    return f'alerts_{datetime.fromtimestamp(day * 86400, timezone.utc):%Y%m%d}'
+
+
+class AlertPartitions:
+    """Alerts split into one table per ingestion day (UTC), listed in `partitions`.
+
+    Ids encode the day (day << ID_SHIFT) and keep increasing across days and
+    purges, so id cursors route straight to a partition. Each partition
+    records the range of event times (ts) it holds; time-ordered queries
+    visit only the partitions that overlap the range they ask for. Dashboard
+    counters are kept per partition, so expiring a day is a DROP TABLE plus
+    deleting its counter rows, whatever the size of the day or the history.
+    """
+
+    def __init__(self, pool, retention_days=None, on_purge=None, purge_legacy=False):
+        self.pool = pool
+        self.retention_days = retention_days
+        self.purge_legacy = purge_legacy  # whether retention also applies to LEGACY_TABLE
+        self._current = None  # (day, name, data_version when last checked)
+        self._on_purge = on_purge
+        self._stop = threading.Event()
+        self._thread = None
+
+    def init_db(self):
+        """Create the catalog, migrating an unpartitioned database on first start"""
+        with self.pool.write() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            migrated = version < 1 and self._table_exists(conn, 'alerts')
+            if migrated:
+                # Counters and triggers are rebuilt per partition below
+                conn.execute('DROP TRIGGER IF EXISTS alerts_stats_delete')
+                conn.execute('DROP TRIGGER IF EXISTS alerts_stats_update')
+                conn.execute('DROP TABLE IF EXISTS alert_counters')
+                conn.execute('DROP TABLE IF EXISTS alert_minutes')
+            upgrade_catalog = version == 1
+            if upgrade_catalog:
+                # Schema 1 kept text timestamp ranges; they are recomputed from ts below
+                conn.execute('ALTER TABLE partitions RENAME TO partitions_v1')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS partitions (
+                    name TEXT PRIMARY KEY,
+                    day INTEGER NOT NULL,
+                    first_id INTEGER NOT NULL,
+                    min_ts INTEGER,
+                    max_ts INTEGER
+                )
+            ''')
+            if upgrade_catalog:
+                conn.execute('INSERT INTO partitions (name, day, first_id) SELECT name, day, first_id FROM partitions_v1')
+                conn.execute('DROP TABLE partitions_v1')
+            # Highest id of any dropped partition, so ids are never reused
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS partition_meta (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            ''')
+            # Dashboard counters per partition, kept current on write so
+            # /api/stats never scans alerts
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS alert_counters (
+                    part TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    value INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (part, name)
+                ) WITHOUT ROWID
+            ''')
+            if version < 2:
+                conn.execute('DROP TABLE IF EXISTS alert_minutes')  # rebuilt from ts below
+            # Alerts per event-time minute (ts / 60) for the recent-alerts window
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS alert_minutes (
+                    minute INTEGER NOT NULL,
+                    part TEXT NOT NULL,
+                    n INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (minute, part)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_alert_minutes_part ON alert_minutes(part)')
+            # Heavy-hitter and distinct-count sketches of each partition's
+            # alerts (sketches.AlertSketches.dumps()), merged by every process
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS alert_sketches (
+                    part TEXT PRIMARY KEY,
+                    sketch BLOB NOT NULL
+                )
+            ''')
+            if migrated:
+                self._adopt_legacy(conn)
+            if version < 2:
+                for part in self.list(conn):
+                    self._add_event_time(conn, part.name)
+            elif version < 3:
+                for part in self.list(conn):
+                    self._add_aggregation(conn, part.name)
+            if version < 4:
+                for part in self.list(conn):
+                    self._add_search(conn, part.name)
+            if version < 5:
+                for part in self.list(conn):
+                    self._add_sketches(conn, part.name)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        if migrated:
+            # Rewrites the file once so incremental vacuum is available from now on
+            with self.pool.write(transaction=False) as conn:
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                conn.execute('VACUUM')
+
+    def check_schema(self):
+        """Raise SchemaError unless init_db() has brought the database to SCHEMA_VERSION"""
+        with self.pool.reader() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < SCHEMA_VERSION:
+            raise SchemaError(f'{self.pool.path} is at schema version {version}, not {SCHEMA_VERSION}; '
+                              'run `python app.py migrate` first')
+        if version > SCHEMA_VERSION:
+            raise SchemaError(f'{self.pool.path} is at schema version {version}, '
+                              f'newer than this release ({SCHEMA_VERSION})')
+
+    def _adopt_legacy(self, conn):
+        conn.execute(f'ALTER TABLE alerts RENAME TO {LEGACY_TABLE}')
+        max_ts = conn.execute(f'SELECT MAX({TS_FROM_TIMESTAMP_SQL}) FROM {LEGACY_TABLE}').fetchone()[0]
+        day = max_ts // 86400 if max_ts else today()
+        conn.execute('INSERT INTO partitions (name, day, first_id) VALUES (?, ?, 0)', (LEGACY_TABLE, day))
+        conn.execute(f'''
+            INSERT INTO alert_counters (part, name, value)
+            SELECT '{LEGACY_TABLE}', 'total_alerts', COUNT(*) FROM {LEGACY_TABLE}
+            UNION ALL SELECT '{LEGACY_TABLE}', 'siem_alerts', COUNT(*) FROM {LEGACY_TABLE} WHERE siem_sent = 1
+            UNION ALL SELECT '{LEGACY_TABLE}', 'critical_alerts', COUNT(*) FROM {LEGACY_TABLE} WHERE severity = 'Critical'
+            UNION ALL SELECT '{LEGACY_TABLE}', 'high_alerts', COUNT(*) FROM {LEGACY_TABLE} WHERE severity = 'High'
+            UNION ALL SELECT '{LEGACY_TABLE}', 'threat:' || threat_type, COUNT(*) FROM {LEGACY_TABLE}
+                GROUP BY threat_type
+        ''')
+
+    def _add_event_time(self, conn, name):
+        """Schema 2: backfill the integer ts column and index it in place of timestamp"""
+        self._add_columns(conn, name)
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}_stats_delete')
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}_stats_update')
+        conn.execute(f'DROP INDEX IF EXISTS idx_{name}_timestamp')
+        for column in FILTER_COLUMNS:
+            conn.execute(f'DROP INDEX IF EXISTS idx_{name}_{column}_ts')
+        conn.execute(f'UPDATE {name} SET ts = {TS_FROM_TIMESTAMP_SQL}')
+        conn.execute(f'UPDATE {name} SET last_ts = ts')
+        self._create_schema(conn, name)
+        conn.execute(f'''
+            UPDATE partitions SET min_ts = (SELECT MIN(ts) FROM {name}), max_ts = (SELECT MAX(ts) FROM {name})
+            WHERE name = ?
+        ''', (name,))
+        conn.execute(f'''
+            INSERT INTO alert_minutes (minute, part, n)
+            SELECT ts / 60, ?, COUNT(*) FROM {name} GROUP BY 1
+        ''', (name,))
+
+    def _add_aggregation(self, conn, name):
+        """Schema 3: existing rows are single alerts, first and last seen at ts"""
+        self._add_columns(conn, name)
+        conn.execute(f'UPDATE {name} SET last_ts = ts')
+        self._create_schema(conn, name)
+
+    def _add_search(self, conn, name):
+        """Schema 4: index the evidence of existing rows for full-text search"""
+        self._create_schema(conn, name)
+        conn.execute(f"INSERT INTO {name}_fts ({name}_fts) VALUES ('rebuild')")
+        conn.execute(INDEX_NEW_ROWS_SQL[1].format(name=name))
+
+    @staticmethod
+    def _add_sketches(conn, name):
+        """Schema 5: sketch the existing rows (the users their evidence named were not stored)"""
+        sketches = AlertSketches()
+        for detection, source, ts, count in conn.execute(f'SELECT detection, source_ip, ts, count FROM {name}'):
+            sketches.add(detection, source, None, ts, count)
+        if sketches.detections:
+            conn.execute('INSERT OR REPLACE INTO alert_sketches (part, sketch) VALUES (?, ?)',
+                         (name, sketches.dumps()))
+
+    @staticmethod
+    def _add_columns(conn, name):
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info({name})')]
+        for _, column, definition in ADDED_COLUMNS:
+            if column not in columns:
+                conn.execute(f'ALTER TABLE {name} ADD COLUMN {column} {definition}')
+
+    @staticmethod
+    def _table_exists(conn, name):
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+
+    @staticmethod
+    def _create_schema(conn, name):
+        conn.execute(PARTITION_SQL.format(name=name))
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_ts ON {name}(ts)')
+        for column in FILTER_COLUMNS:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_{column}_ts ON {name}({column}, ts)')
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{name}_agg_key ON {name}(agg_key) '
+                     'WHERE agg_key IS NOT NULL')
+        for trigger in PARTITION_TRIGGERS + FTS_SQL:
+            conn.execute(trigger.format(name=name))
+
+    def current(self):
+        """Name of today's partition, created on first use.
+
+        The name is cached per process. Once any other connection has
+        committed, the cache is checked against the catalog, so a partition
+        dropped by another worker (or /api/clear there) is created again
+        instead of being written to; on_purge hears of the drop.
+        """
+        day = today()
+        current = self._current
+        if current is not None and current[0] == day:
+            version = self.pool.data_version()
+            if version == current[2]:
+                return current[1]
+            with self.pool.reader() as conn:
+                exists = conn.execute('SELECT 1 FROM partitions WHERE name = ?', (current[1],)).fetchone()
+            if exists:
+                self._current = (day, current[1], version)
+                return current[1]
+            if self._on_purge:
+                self._on_purge([current[1]])
+        with self.pool.write() as conn:
+            # Never go back to an older day if the clock does, or id ranges would overlap
+            newest = conn.execute('SELECT MAX(day) FROM partitions WHERE first_id > 0').fetchone()[0]
+            name = self._create(conn, max(day, newest or day))
+        self._current = (day, name, self.pool.data_version())
+        return name
+
+    def _create(self, conn, day):
+        name = partition_name(day)
+        if conn.execute('SELECT 1 FROM partitions WHERE name = ?', (name,)).fetchone():
+            return name
+        self._create_schema(conn, name)  # also creates sqlite_sequence on a new database
+        floor = conn.execute('''
+            SELECT MAX(COALESCE((SELECT MAX(seq) FROM sqlite_sequence), 0),
+                       COALESCE((SELECT value FROM partition_meta WHERE name = 'id_floor'), 0))
+        ''').fetchone()[0]
+        seed = max(day << ID_SHIFT, floor)
+        conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (name, seed))
+        conn.execute('INSERT INTO partitions (name, day, first_id) VALUES (?, ?, ?)', (name, day, seed + 1))
+        return name
+
+    def list(self, conn):
+        """All partitions, oldest ids first"""
+        return [Partition(*row) for row in
+                conn.execute('SELECT name, day, first_id, min_ts, max_ts FROM partitions ORDER BY first_id')]
+
+    def for_time_range(self, conn, since=None, until=None):
+        """Non-empty partitions holding event times in [since, until], latest first"""
+        parts = [p for p in self.list(conn) if p.max_ts is not None
+                 and (since is None or p.max_ts >= since) and (until is None or p.min_ts <= until)]
+        parts.sort(key=lambda p: p.max_ts, reverse=True)
+        return parts
+
+    def after_id(self, conn, last_id):
+        """Partitions that can hold ids greater than last_id, in id order"""
+        parts = self.list(conn)
+        start = bisect.bisect_right([p.first_id for p in parts], last_id) - 1
+        return parts[max(start, 0):]
+
+    def route(self, conn, ids):
+        """Group alert ids by the partition holding them: {name: [ids]}"""
+        parts = self.list(conn)
+        first_ids = [p.first_id for p in parts]
+        routed = {}
+        for alert_id in ids:
+            i = bisect.bisect_right(first_ids, alert_id) - 1
+            if i >= 0:
+                routed.setdefault(parts[i].name, []).append(alert_id)
+        return routed
+
+    def drop(self, conn, names):
+        for name in names:
+            seq = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (name,)).fetchone()
+            if seq:
+                conn.execute('''
+                    INSERT INTO partition_meta (name, value) VALUES ('id_floor', ?)
+                    ON CONFLICT(name) DO UPDATE SET value = max(value, excluded.value)
+                ''', seq)
+            conn.execute(f'DROP TABLE IF EXISTS {name}')
+            conn.execute(f'DROP TABLE IF EXISTS {name}_fts')
+            conn.execute('DELETE FROM partition_meta WHERE name = ?', (f'fts:{name}',))
+            conn.execute('DELETE FROM alert_counters WHERE part = ?', (name,))
+            conn.execute('DELETE FROM alert_minutes WHERE part = ?', (name,))
+            conn.execute('DELETE FROM alert_sketches WHERE part = ?', (name,))
+            conn.execute('DELETE FROM partitions WHERE name = ?', (name,))
+
+    def clear(self):
+        """Drop every partition and start today's afresh"""
+        with self.pool.write() as conn:
+            self.drop(conn, [p.name for p in self.list(conn)])
+            self._current = None
+        self.current()
+
+    def expired(self, conn):
+        """Partitions older than the retention period. The one adopted from a
+        pre-partitioning database is dated to its newest alert, so it is only
+        included once purge_legacy is set."""
+        if not self.retention_days:
+            return []
+        cutoff = today() - self.retention_days
+        return [p for p in self.list(conn) if p.day < cutoff and (self.purge_legacy or p.name != LEGACY_TABLE)]
+
+    def expire(self):
+        """Drop partitions older than the retention period; returns their names"""
+        with self.pool.write() as conn:
+            names = [p.name for p in self.expired(conn)]
+            self.drop(conn, names)
+        return names
+
+    def vacuum(self):
+        """Return pages freed by dropped partitions to the filesystem, a step at a time"""
+        freed = 0
+        while not self._stop.is_set():
+            with self.pool.write(transaction=False) as conn:
+                free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if not free:
+                    break
+                # executescript steps the pragma to completion; execute() frees one page
+                conn.executescript(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})')
+            freed += min(free, VACUUM_STEP_PAGES)
+        return freed
+
+    def start_maintenance(self, interval=300, on_purge=None):
+        """Expire and vacuum in a background thread every `interval` seconds.
+
+        on_purge(names) is called with the partitions dropped by expiry, and by
+        current() with one it finds dropped by another process; it defaults to
+        the one given to the constructor.
+        """
+        if on_purge is not None:
+            self._on_purge = on_purge
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    names = self.expire()
+                    if names and self._on_purge:
+                        self._on_purge(names)
+                    self.vacuum()
+                except sqlite3.Error:
+                    pass  # a busy or locked database is retried on the next round
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=run, name='zock-partitions', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,87 @@
+# rulepack.py - read and validate detection rule packs (JSON, or YAML with PyYAML installed)
+import json
+
+from deps import optional
+
+SEVERITIES = ("low", "medium", "high", "critical")
+
+# field -> (type, default); a rule without patterns only tags alerts raised
+# elsewhere (e.g. by the anomaly detector) with its severity, OWASP categories
+# and recommendations
+RULE_FIELDS = {
+    "name": (str, None),
+    "patterns": (list, []),
+    "literals": (list, []),
+    "severity": (str, "medium"),
+    "entity": (list, ["src_ip"]),
+    "ignore_case": (bool, True),
+    "owasp": (list, []),
+    "recommendations": (list, []),
+}
+
+
+class RulePackError(ValueError):
+    pass
+
+
+def load_pack(path):
+    """The validated pack at path: {"name", "version", "rules": [rule dicts with every RULE_FIELDS key]}.
+
+    A pack is an object with a list of rules:
+
+        name: site-rules
+        version: 3
+        rules:
+          - name: Path traversal
+            patterns: ['\\.\\./', 'etc/passwd']   # regexes; any of them matching fires the rule
+            literals: ['../', 'etc/passwd']       # substrings one of which every match contains
+            severity: high
+            owasp: [A01:2021-Broken Access Control]
+            recommendations: [Block IP; review file access]
+
+    Files ending in .yaml or .yml are read as YAML, anything else as JSON.
+    """
+    with open(path, "rb") as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        yaml = optional("yaml")  # only needed for YAML rule packs
+        if yaml is None:
+            raise RulePackError(f"{path}: YAML rule packs need 'PyYAML' installed")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise RulePackError(f"{path}: {e}") from None
+    else:
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise RulePackError(f"{path}: {e}") from None
+    return validate_pack(data, path)
+
+
+def validate_pack(data, source="rule pack"):
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+        raise RulePackError(f"{source}: expected an object with a 'rules' list")
+    rules = []
+    names = set()
+    for i, raw in enumerate(data["rules"]):
+        if not isinstance(raw, dict):
+            raise RulePackError(f"{source}: rule {i + 1} is not an object")
+        unknown = set(raw) - set(RULE_FIELDS)
+        if unknown:
+            raise RulePackError(f"{source}: rule {i + 1} has unknown fields {', '.join(sorted(unknown))}")
+        rule = {}
+        for field, (kind, default) in RULE_FIELDS.items():
+            value = raw.get(field, default)
+            if value is None or not isinstance(value, kind) or (
+                    kind is list and not all(isinstance(v, str) for v in value)):
+                what = "a list of strings" if kind is list else f"a {kind.__name__}"
+                raise RulePackError(f"{source}: rule {i + 1} field '{field}' must be {what}")
+            rule[field] = list(value) if kind is list else value
+        if rule["name"] in names:
+            raise RulePackError(f"{source}: rule '{rule['name']}' is defined twice")
+        if rule["severity"] not in SEVERITIES:
+            raise RulePackError(f"{source}: rule '{rule['name']}' severity must be one of {', '.join(SEVERITIES)}")
+        names.add(rule["name"])
+        rules.append(rule)
+    return {"name": str(data.get("name", source)), "version": data.get("version"), "rules": rules}
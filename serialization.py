@@ -0,0 +1,109 @@
+# serialization.py - fast JSON encoding, streamed JSON arrays and an incremental JSON lines writer
+import json
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder produces the same text, slower
+    orjson = None
+
+CHUNK_SIZE = 1 << 16  # bytes gathered before a streamed chunk or buffered write goes out
+
+if orjson is not None:
+    # datetimes go through default=str as they do with json; int keys are allowed as with json
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes; objects JSON cannot represent are encoded as str()"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:  # e.g. integers beyond 64 bits, which json handles
+            pass
+    return json.dumps(obj, default=str, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def dumps_str(obj):
+    return dumps(obj).decode('utf-8')
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def iter_json_array(items, chunk_size=CHUNK_SIZE):
+    """Encode items as one JSON array, yielded in chunks of about chunk_size bytes.
+
+    Only the chunk being filled is held, so a response built from a database
+    cursor starts at once and uses the same memory whatever its length.
+    """
+    parts, size, sep = [b'['], 1, b''
+    for item in items:
+        encoded = dumps(item)
+        parts.append(sep)
+        parts.append(encoded)
+        size += len(encoded) + 1
+        sep = b','
+        if size >= chunk_size:
+            yield b''.join(parts)
+            parts, size = [], 0
+    parts.append(b']')
+    yield b''.join(parts)
+
+
+def iter_json_lines(items, chunk_size=CHUNK_SIZE):
+    """Encode items as JSON lines, yielded in chunks of about chunk_size bytes"""
+    parts, size = [], 0
+    for item in items:
+        encoded = dumps(item) + b'\n'
+        parts.append(encoded)
+        size += len(encoded)
+        if size >= chunk_size:
+            yield b''.join(parts)
+            parts, size = [], 0
+    if parts:
+        yield b''.join(parts)
+
+
+class JSONLWriter:
+    """Writes objects as JSON lines to a binary file as they arrive.
+
+    Lines are gathered up to buffer_size bytes before a write; flush=True
+    writes and flushes every line instead, for output read while it grows.
+    `count` is the number of lines written.
+    """
+
+    def __init__(self, f, flush=False, buffer_size=CHUNK_SIZE):
+        self.f = f
+        self.flush_each = flush
+        self.buffer_size = buffer_size
+        self.count = 0
+        self._parts = []
+        self._size = 0
+
+    def write(self, obj):
+        line = dumps(obj) + b'\n'
+        self.count += 1
+        if self.flush_each:
+            self.f.write(line)
+            self.f.flush()
+            return
+        self._parts.append(line)
+        self._size += len(line)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.f.write(b''.join(self._parts))
+            self._parts, self._size = [], 0
+        self.f.flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
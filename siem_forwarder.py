@@ -0,0 +1,389 @@
+# siem_forwarder.py - batched, retrying delivery of alerts to SIEM platforms
+import http.client
+import os
+import queue
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from serialization import dumps, loads
+
+# Delivery bookkeeping that is not part of the shipped event
+LOCAL_FIELDS = ('siem_sent', 'siem_platforms')
+
+
+class DeliveryError(Exception):
+    pass
+
+
+class SIEMTarget:
+    """An HTTP endpoint that accepts alerts in batches.
+
+    Subclasses build one request body per batch and split the response into
+    (sent, retry, failed) alerts.
+    """
+    name = 'SIEM'
+    path = '/'
+    content_type = 'application/json'
+
+    def __init__(self, url, headers=None):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.headers = {'Content-Type': self.content_type}
+        self.headers.update(headers or {})
+
+    def connect(self, timeout):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=timeout)
+
+    def encode(self, alerts):
+        raise NotImplementedError
+
+    def results(self, status, body, alerts):
+        if 200 <= status < 300:
+            return alerts, [], []
+        if status == 429 or status >= 500:
+            return [], alerts, []
+        raise DeliveryError(f'{self.name} rejected batch: HTTP {status} {body[:200]!r}')
+
+
+def event_fields(alert):
+    """The alert as shipped; an aggregate keeps its agg_key, which later events updating it share"""
+    return {k: v for k, v in alert.items() if k not in LOCAL_FIELDS and not (k == 'agg_key' and v is None)}
+
+
+class SplunkHEC(SIEMTarget):
+    """Splunk HTTP Event Collector: concatenated JSON events in one POST"""
+    name = 'Splunk'
+    path = '/services/collector/event'
+
+    def __init__(self, url, token, index=None, sourcetype='zock:alert'):
+        super().__init__(url, {'Authorization': f'Splunk {token}'})
+        self.index = index
+        self.sourcetype = sourcetype
+
+    def encode(self, alerts):
+        events = []
+        for alert in alerts:
+            event = {'sourcetype': self.sourcetype, 'source': 'zock', 'event': event_fields(alert)}
+            if self.index:
+                event['index'] = self.index
+            events.append(dumps(event))
+        return b'\n'.join(events)
+
+
+class ElasticsearchBulk(SIEMTarget):
+    """Elasticsearch _bulk API.
+
+    Alert ids become document ids, so retries never duplicate; an aggregate
+    is indexed by its agg_key, so each newer count replaces the document.
+    """
+    name = 'Elasticsearch'
+    path = '/_bulk'
+    content_type = 'application/x-ndjson'
+
+    def __init__(self, url, index='zock-alerts', api_key=None):
+        super().__init__(url, {'Authorization': f'ApiKey {api_key}'} if api_key else None)
+        self.index = index
+
+    def encode(self, alerts):
+        lines = []
+        for alert in alerts:
+            doc_id = alert.get('agg_key') or str(alert['id'])
+            lines.append(dumps({'index': {'_index': self.index, '_id': doc_id}}))
+            lines.append(dumps(event_fields(alert)))
+        return b'\n'.join(lines) + b'\n'
+
+    def results(self, status, body, alerts):
+        sent, retry, failed = super().results(status, body, alerts)
+        if not sent:
+            return sent, retry, failed
+        # A 200 can still carry per-document failures
+        response = loads(body)
+        if not response.get('errors'):
+            return alerts, [], []
+        sent, retry, failed = [], [], []
+        for alert, item in zip(alerts, response['items']):
+            item_status = next(iter(item.values())).get('status', 500)
+            if item_status < 300:
+                sent.append(alert)
+            elif item_status == 429 or item_status >= 500:
+                retry.append(alert)
+            else:
+                failed.append(alert)
+        return sent, retry, failed
+
+
+def targets_from_env(environ=os.environ):
+    """SIEM targets configured through ZOCK_SPLUNK_HEC_* and ZOCK_ELASTICSEARCH_*"""
+    targets = []
+    if environ.get('ZOCK_SPLUNK_HEC_URL'):
+        targets.append(SplunkHEC(environ['ZOCK_SPLUNK_HEC_URL'], environ.get('ZOCK_SPLUNK_HEC_TOKEN', ''),
+                                 index=environ.get('ZOCK_SPLUNK_INDEX')))
+    if environ.get('ZOCK_ELASTICSEARCH_URL'):
+        targets.append(ElasticsearchBulk(environ['ZOCK_ELASTICSEARCH_URL'],
+                                         index=environ.get('ZOCK_ELASTICSEARCH_INDEX', 'zock-alerts'),
+                                         api_key=environ.get('ZOCK_ELASTICSEARCH_API_KEY')))
+    return targets
+
+
+class SIEMForwarder:
+    """Background delivery of pending alerts to one SIEM.
+
+    A dispatcher thread pages pending alerts out of the database with
+    fetch(name, after_id, limit) into a bounded queue; when the queue is full
+    the dispatcher blocks, so a slow SIEM holds back reading, not ingestion.
+    `concurrency` sender threads each keep one persistent connection, drain
+    up to batch_size alerts per request and retry transient failures with
+    exponential backoff. Outcomes are reported through
+    record(name, alerts, status) with status 'sent' or 'failed'. An alert is
+    in flight from being queued until its outcome is recorded; a rescan skips
+    it instead of queueing it a second time.
+
+    Aggregates are updated in place after the cursor has passed them.
+    refresh(agg_keys) has the dispatcher fetch those still pending with
+    fetch_aggregates(name, agg_keys) and send them again; one that is in
+    flight is fetched again once its current delivery is over.
+
+    Other processes cannot call refresh() or retry_failed(). With
+    fetch_unsettled(name, after_id, limit) given, which returns alerts not yet
+    reported sent or failed, every sweep_interval seconds the dispatcher also
+    re-reads those behind its cursor: aggregates another process grew and
+    failures it cleared for a retry are sent again from the database alone.
+    """
+
+    def __init__(self, target, fetch, record, notifier=None, batch_size=500, queue_size=10000,
+                 concurrency=2, max_retries=5, backoff=0.5, max_backoff=30.0, timeout=10.0,
+                 poll_interval=5.0, fetch_aggregates=None, fetch_unsettled=None, sweep_interval=30.0):
+        self.target = target
+        self.name = target.name
+        self.fetch = fetch
+        self.record = record
+        self.fetch_aggregates = fetch_aggregates
+        self.fetch_unsettled = fetch_unsettled
+        self.sweep_interval = sweep_interval
+        self.notifier = notifier
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.requests = 0
+        self.last_error = None
+        self._cursor = 0
+        self._sweep_at = time.monotonic() + sweep_interval
+        self._in_flight = set()  # ids queued or being sent
+        self._refresh = set()  # agg_keys of aggregates updated since they were queued
+        self._queue = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._rescan = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._dispatch, name=f'siem-{self.name}-dispatch', daemon=True)]
+        self._threads += [threading.Thread(target=self._send_loop, name=f'siem-{self.name}-{i}', daemon=True)
+                          for i in range(concurrency)]
+        for t in self._threads:
+            t.start()
+
+    def retry_failed(self):
+        """Rescan from the first alert so earlier failures are offered again"""
+        self._rescan.set()
+        if self.notifier is not None:
+            self.notifier.publish('siem-retry')
+
+    def refresh(self, agg_keys):
+        """Send these aggregates again if their latest state is still pending"""
+        with self._lock:
+            self._refresh.update(agg_keys)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'platform': self.name,
+                'queue_depth': self._queue.qsize(),
+                'sent': self.sent,
+                'failed': self.failed,
+                'retries': self.retries,
+                'requests': self.requests,
+                'last_error': self.last_error,
+            }
+
+    def close(self, timeout=5.0):
+        self._stop.set()
+        if self.notifier is not None:
+            self.notifier.publish('siem-stop')
+        for t in self._threads:
+            t.join(timeout)
+
+    def _dispatch(self):
+        seq = self.notifier.seq if self.notifier is not None else 0
+        while not self._stop.is_set():
+            if self._rescan.is_set():
+                self._rescan.clear()
+                self._drain_queue()
+                self._cursor = 0
+            if self.fetch_aggregates is not None:
+                self._dispatch_refreshed()
+            if self.fetch_unsettled is not None and time.monotonic() >= self._sweep_at:
+                self._sweep()
+            try:
+                alerts = self.fetch(self.name, self._cursor, self.batch_size)
+            except Exception as e:
+                alerts = []
+                self._note_error(e)
+            for alert in alerts:
+                self._cursor = alert['id']
+                self._enqueue(alert)
+            if len(alerts) == self.batch_size:
+                continue
+            if self.notifier is not None:
+                seq, _ = self.notifier.wait(seq, self.poll_interval)
+            else:
+                self._stop.wait(self.poll_interval)
+
+    def _dispatch_refreshed(self):
+        with self._lock:
+            keys, self._refresh = self._refresh, set()
+        if not keys:
+            return
+        try:
+            alerts = self.fetch_aggregates(self.name, list(keys))
+        except Exception as e:
+            alerts = []
+            self._note_error(e)
+            with self._lock:
+                self._refresh |= keys
+        for alert in alerts:
+            if not self._enqueue(alert):
+                with self._lock:
+                    self._refresh.add(alert['agg_key'])
+
+    def _sweep(self):
+        """Queue unsettled alerts behind the cursor that are not in flight"""
+        self._sweep_at = time.monotonic() + self.sweep_interval
+        after_id = 0
+        while not self._stop.is_set():
+            try:
+                alerts = self.fetch_unsettled(self.name, after_id, self.batch_size)
+            except Exception as e:
+                self._note_error(e)
+                return
+            for alert in alerts:
+                if alert['id'] > self._cursor:
+                    return  # the cursor reaches the rest
+                after_id = alert['id']
+                self._enqueue(alert)
+            if len(alerts) < self.batch_size:
+                return
+
+    def _enqueue(self, alert):
+        """Queue alert unless it is in flight already; False if it was not queued"""
+        with self._lock:
+            if alert['id'] in self._in_flight:
+                return False
+            self._in_flight.add(alert['id'])
+        while not self._stop.is_set():
+            try:
+                self._queue.put(alert, timeout=0.5)
+                return True
+            except queue.Full:
+                if self._rescan.is_set():
+                    break
+        self._settled([alert])
+        return False
+
+    def _drain_queue(self):
+        while True:
+            try:
+                self._settled([self._queue.get_nowait()])
+            except queue.Empty:
+                return
+
+    def _settled(self, alerts):
+        """Alerts no longer queued or being sent; a later fetch may offer them again"""
+        with self._lock:
+            self._in_flight.difference_update(a['id'] for a in alerts)
+
+    def _send_loop(self):
+        conn = None
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                conn = self._deliver(conn, batch)
+            finally:
+                self._settled(batch)
+        if conn is not None:
+            conn.close()
+
+    def _deliver(self, conn, alerts):
+        """Send one batch, retrying what is retryable; returns the connection to reuse"""
+        attempt = 0
+        while alerts:
+            error = None
+            try:
+                if conn is None:
+                    conn = self.target.connect(self.timeout)
+                conn.request('POST', self.target.base_path + self.target.path,
+                             body=self.target.encode(alerts), headers=self.target.headers)
+                response = conn.getresponse()
+                body = response.read()  # always drain, or the connection cannot be reused
+                sent, retry, failed = self.target.results(response.status, body, alerts)
+                retry_after = response.getheader('Retry-After')
+            except DeliveryError as e:
+                sent, retry, failed, retry_after, error = [], [], alerts, None, e
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                if conn is not None:
+                    conn.close()
+                conn = None
+                sent, retry, failed, retry_after, error = [], alerts, [], None, e
+            if retry and attempt >= self.max_retries:
+                failed, retry = failed + retry, []
+            if retry and error is None:
+                error = f'{self.name} asked for a retry'
+            self._report(sent, failed, error)
+            alerts = retry
+            if alerts:
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                self._stop.wait(self._delay(attempt, retry_after))
+        return conn
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        # Full jitter keeps senders that failed together from retrying together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _report(self, sent, failed, error):
+        with self._lock:
+            self.requests += 1
+            self.sent += len(sent)
+            self.failed += len(failed)
+        if error is not None:
+            self._note_error(error)
+        for status, alerts in (('sent', sent), ('failed', failed)):
+            if alerts:
+                try:
+                    self.record(self.name, alerts, status)
+                except Exception as e:
+                    self._note_error(e)
+
+    def _note_error(self, error):
+        with self._lock:
+            self.last_error = str(error)
@@ -0,0 +1,264 @@
+# sketches.py - fixed-memory, mergeable summaries of alert sources (Count-Min heavy hitters, HyperLogLog distinct counts)
+import base64
+import heapq
+import json
+import math
+import zlib
+from array import array
+from functools import lru_cache
+from hashlib import blake2b
+
+from aggregation import iso_time
+from ingest import parse_ts
+
+MAX_DETECTIONS = 256  # detections tracked separately; the rest share OTHER
+OTHER = '(other)'
+
+
+@lru_cache(maxsize=1 << 16)  # the same sources and users come back again and again
+def hash64(key):
+    """64-bit hash of str(key) that is the same in every process, unlike hash()"""
+    return int.from_bytes(blake2b(str(key).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+@lru_cache(maxsize=4096)  # consecutive alerts mostly share their timestamp
+def epoch_time(ts):
+    """Epoch seconds of an ISO-8601 ts, None when it does not parse"""
+    try:
+        return parse_ts(ts).timestamp()
+    except Exception:
+        return None
+
+
+def _encode(data):
+    return base64.b64encode(bytes(data)).decode('ascii')
+
+
+class CountMinSketch:
+    """Approximate counts per key in width * depth counters; estimates never undercount.
+
+    With the default 2048 x 4 an estimate overshoots by at most about
+    total / 750 with 98% probability.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = array('q', bytes(8 * width * depth))
+        self.total = 0
+
+    def _cells(self, h):
+        # depth hashes from one 64-bit hash (Kirsch-Mitzenmacher)
+        h1, h2, w = h & 0xffffffff, (h >> 32) | 1, self.width
+        return [i * w + (h1 + i * h2) % w for i in range(self.depth)]
+
+    def add(self, key, n=1, h=None):
+        """Count key n more times; return its new estimate"""
+        table = self.table
+        estimate = None
+        for cell in self._cells(hash64(key) if h is None else h):
+            table[cell] += n
+            if estimate is None or table[cell] < estimate:
+                estimate = table[cell]
+        self.total += n
+        return estimate
+
+    def estimate(self, key, h=None):
+        return min(self.table[cell] for cell in self._cells(hash64(key) if h is None else h))
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError('can only merge sketches of the same width and depth')
+        table = self.table
+        for i, n in enumerate(other.table):
+            if n:
+                table[i] += n
+        self.total += other.total
+
+
+class HeavyHitters:
+    """The k keys with the highest Count-Min estimates"""
+
+    def __init__(self, k=20, width=2048, depth=4):
+        self.k = k
+        self.cms = CountMinSketch(width, depth)
+        self.top = {}  # key -> estimate
+        self._floor = 0  # lowest estimate in top, possibly stale (never above the real one)
+
+    def add(self, key, n=1, h=None):
+        estimate = self.cms.add(key, n, h)
+        top = self.top
+        if key in top or len(top) < self.k:
+            top[key] = estimate
+        elif estimate > self._floor:
+            lowest = min(top, key=top.get)
+            if estimate > top[lowest]:
+                del top[lowest]
+                top[key] = estimate
+                self._floor = min(top.values())
+            else:
+                self._floor = top[lowest]
+
+    def items(self):
+        """(key, estimate) from the highest estimate down"""
+        return sorted(self.top.items(), key=lambda item: (-item[1], str(item[0])))
+
+    def merge(self, other):
+        self.cms.merge(other.cms)
+        candidates = {key: self.cms.estimate(key) for key in (*self.top, *other.top)}
+        self.top = dict(heapq.nlargest(self.k, candidates.items(), key=lambda item: item[1]))
+        self._floor = min(self.top.values(), default=0)
+
+
+class HyperLogLog:
+    """Approximate number of distinct keys in 2**p one-byte registers (about 1.04 / sqrt(2**p) error)"""
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = bytearray(1 << p)
+        self._bits = 64 - p
+        self._mask = (1 << self._bits) - 1
+
+    def add(self, key, h=None):
+        h = hash64(key) if h is None else h
+        rank = self._bits - (h & self._mask).bit_length() + 1  # position of the first 1 bit after the index
+        index = h >> self._bits
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * m:
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return round(estimate)
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError('can only merge sketches of the same precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+
+class AlertSketches:
+    """Heavy-hitter alert sources, and distinct sources and users per detection and per time bucket.
+
+    Memory is fixed whatever the number of sources or users: one Count-Min
+    sketch for the top_k sources and two HyperLogLogs per detection (up to
+    MAX_DETECTIONS) plus one per bucket for the newest max_buckets buckets.
+    Sketches built in separate processes combine with merge() into the
+    sketches of the whole input; dumps() and loads() carry them between
+    processes or into storage.
+    """
+
+    def __init__(self, top_k=20, width=2048, depth=4, p=12, bucket_seconds=3600, max_buckets=24):
+        self.p = p
+        self.bucket_seconds = bucket_seconds
+        self.max_buckets = max_buckets
+        self.sources = HeavyHitters(top_k, width, depth)
+        self.detections = {}  # detection -> (sources, users) HyperLogLogs
+        self.buckets = {}  # bucket start (epoch seconds) -> sources HyperLogLog
+
+    def add(self, detection, source, user, ts, n=1):
+        """Count n alerts of detection from source (an IP) against user at epoch time ts; any may be None"""
+        h = hash64(source) if source else None
+        if h is not None:
+            self.sources.add(source, n, h)
+        if detection not in self.detections and len(self.detections) >= MAX_DETECTIONS:
+            detection = OTHER
+        distinct = self.detections.get(detection)
+        if distinct is None:
+            distinct = self.detections[detection] = (HyperLogLog(self.p), HyperLogLog(self.p))
+        if h is not None:
+            distinct[0].add(source, h)
+        if user:
+            distinct[1].add(user, hash64(user))
+        if h is not None and ts is not None:
+            hll = self._bucket(int(ts // self.bucket_seconds) * self.bucket_seconds)
+            if hll is not None:
+                hll.add(source, h)
+
+    def add_alert(self, alert):
+        """add() for a detector alert dict"""
+        evidence = alert.get('evidence') or {}
+        source = alert.get('source_ip') or evidence.get('src_ip')
+        ts = alert.get('ts')
+        # Only a user the evidence names: the entity of an IP-keyed detection is an address
+        self.add(alert.get('detection'), source, evidence.get('user'),
+                 epoch_time(ts) if isinstance(ts, str) else ts, alert.get('count') or 1)
+
+    def _bucket(self, start):
+        hll = self.buckets.get(start)
+        if hll is None:
+            if len(self.buckets) >= self.max_buckets:
+                oldest = min(self.buckets)
+                if start < oldest:
+                    return None  # older than every bucket kept
+                del self.buckets[oldest]
+            hll = self.buckets[start] = HyperLogLog(self.p)
+        return hll
+
+    def merge(self, other):
+        """Add other's alerts to these sketches; other shares state with them afterwards"""
+        self.sources.merge(other.sources)
+        for detection, (sources, users) in other.detections.items():
+            if detection not in self.detections and len(self.detections) >= MAX_DETECTIONS:
+                detection = OTHER
+            if detection in self.detections:
+                self.detections[detection][0].merge(sources)
+                self.detections[detection][1].merge(users)
+            else:
+                self.detections[detection] = (sources, users)
+        for start, hll in other.buckets.items():
+            if start in self.buckets:
+                self.buckets[start].merge(hll)
+            else:
+                self.buckets[start] = hll
+        for start in sorted(self.buckets)[:-self.max_buckets]:
+            del self.buckets[start]
+
+    def dumps(self):
+        """These sketches as compressed bytes, for loads()"""
+        cms = self.sources.cms
+        state = {
+            'p': self.p, 'bucket_seconds': self.bucket_seconds, 'max_buckets': self.max_buckets,
+            'top_k': self.sources.k, 'width': cms.width, 'depth': cms.depth,
+            'table': _encode(cms.table.tobytes()), 'total': cms.total, 'top': list(self.sources.top.items()),
+            'detections': {d: [_encode(s.registers), _encode(u.registers)]
+                           for d, (s, u) in self.detections.items()},
+            'buckets': [[start, _encode(hll.registers)] for start, hll in self.buckets.items()],
+        }
+        return zlib.compress(json.dumps(state).encode('utf-8'))
+
+    @classmethod
+    def loads(cls, data):
+        """Sketches from dumps() bytes"""
+        state = json.loads(zlib.decompress(data))
+        sketches = cls(state['top_k'], state['width'], state['depth'], state['p'], state['bucket_seconds'],
+                       state['max_buckets'])
+        cms = sketches.sources.cms
+        cms.table = array('q', base64.b64decode(state['table']))
+        cms.total = state['total']
+        sketches.sources.top = dict(state['top'])
+        sketches.sources._floor = min(sketches.sources.top.values(), default=0)
+
+        def hll(registers):
+            h = HyperLogLog(sketches.p)
+            h.registers = bytearray(base64.b64decode(registers))
+            return h
+
+        sketches.detections = {d: (hll(s), hll(u)) for d, (s, u) in state['detections'].items()}
+        sketches.buckets = {start: hll(registers) for start, registers in state['buckets']}
+        return sketches
+
+    def summary(self, top=10):
+        return {
+            'alerts_with_source': self.sources.cms.total,
+            'top_sources': [{'source_ip': key, 'alerts': n} for key, n in self.sources.items()[:top]],
+            'distinct_by_detection': {d: {'sources': s.count(), 'users': u.count()}
+                                      for d, (s, u) in sorted(self.detections.items())},
+            'distinct_sources_by_bucket': [{'start': iso_time(start), 'sources': hll.count()}
+                                           for start, hll in sorted(self.buckets.items())],
+            'bucket_seconds': self.bucket_seconds,
+        }
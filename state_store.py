@@ -0,0 +1,228 @@
+# state_store.py - per-entity detector state within a memory budget, with LRU/TTL eviction and disk spill
+import heapq
+import sqlite3
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 500000
+ENTRY_BYTES = 200  # rough memory of one entry: dict slot, key string, record list and value
+SPILL_BATCH = 1000  # evicted entries written to disk together
+
+
+def entries_for_budget(megabytes):
+    """How many entries fit in a memory budget of megabytes"""
+    return max(int(megabytes * (1 << 20) // ENTRY_BYTES), 1)
+
+
+class StateStore:
+    """Values per entity key (a string), the most recently used max_entries kept in memory.
+
+    Least recently used entries beyond max_entries are evicted: with spill
+    they move to an SQLite table (spill=True for a private temporary file,
+    or a path) and come back on their next use, otherwise they are dropped,
+    which suits state that is cheap to rebuild such as per-window counts.
+    With ttl, entries unused for ttl seconds of clock() are dropped instead.
+    on_drop(key, value) is called for every entry dropped either way.
+    Values are SQLite scalars (int, float, str, bytes). Every entry keeps the
+    order it was first stored in, which items() follows, so results built
+    from a store do not depend on what happened to be evicted.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=None, spill=False, clock=time.monotonic,
+                 on_drop=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.on_drop = on_drop
+        self._mem = OrderedDict()  # key -> [value, first-stored seq, last used], least recently used first
+        self._pending = {}  # evicted, not yet written to disk
+        self._seq = 0
+        self._disk = None
+        self._disk_len = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spilled = 0
+        self.expired = 0
+        if spill:
+            self._disk = sqlite3.connect('' if spill is True else spill)
+            self._disk.execute('PRAGMA journal_mode=OFF')
+            self._disk.execute('PRAGMA synchronous=OFF')
+            self._disk.execute('''
+                CREATE TABLE IF NOT EXISTS state (
+                    key TEXT PRIMARY KEY,
+                    value,
+                    seq INTEGER NOT NULL,
+                    used REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            self._disk.execute('CREATE INDEX IF NOT EXISTS idx_state_seq ON state(seq)')
+            self._disk_len, seq = self._disk.execute('SELECT COUNT(*), MAX(seq) FROM state').fetchone()
+            self._seq = seq or 0
+
+    def __len__(self):
+        return len(self._mem) + len(self._pending) + self._disk_len
+
+    def __contains__(self, key):
+        return self._record(key, count=False) is not None
+
+    def get(self, key, default=None):
+        record = self._record(key)
+        return default if record is None else record[0]
+
+    def set(self, key, value):
+        record = self._record(key, count=False)
+        if record is None:
+            self._insert(key, value)
+        else:
+            record[0] = value
+
+    def add(self, key, n=1):
+        """Add n to key's value (0 when absent) and return the result"""
+        record = self._record(key)
+        if record is None:
+            self._insert(key, n)
+            return n
+        record[0] += n
+        return record[0]
+
+    def clear(self):
+        self._mem.clear()
+        self._pending.clear()
+        if self._disk is not None:
+            self._disk.execute('DELETE FROM state')
+            self._disk_len = 0
+
+    def items(self):
+        """(key, value) of every entry in the order first stored, without changing recency"""
+        self.expire()
+        memory = sorted(((r[1], k, r[0]) for k, r in self._mem.items()), key=lambda e: e[0])
+        pending = sorted(((r[1], k, r[0]) for k, r in self._pending.items()), key=lambda e: e[0])
+        disk = self._disk.execute('SELECT seq, key, value FROM state ORDER BY seq') if self._disk_len else ()
+        for _, key, value in heapq.merge(memory, pending, disk, key=lambda e: e[0]):
+            yield key, value
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+    def expire(self):
+        """Drop the entries unused for ttl seconds; returns how many"""
+        if not self.ttl:
+            return 0
+        cutoff = self.clock() - self.ttl
+        dropped = 0
+        while self._mem:
+            key, record = next(iter(self._mem.items()))
+            if record[2] > cutoff:
+                break
+            del self._mem[key]
+            self._drop(key, record)
+            dropped += 1
+        for key in [k for k, r in self._pending.items() if r[2] <= cutoff]:
+            self._drop(key, self._pending.pop(key))
+            dropped += 1
+        if self._disk_len:
+            rows = self._disk.execute('DELETE FROM state WHERE used <= ? RETURNING key, value', (cutoff,)).fetchall()
+            self._disk_len -= len(rows)
+            for key, value in rows:
+                self._drop(key, [value])
+            dropped += len(rows)
+        return dropped
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self),
+            'entries_in_memory': len(self._mem),
+            'entries_on_disk': len(self._pending) + self._disk_len,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'spilled': self.spilled,
+            'expired': self.expired,
+        }
+
+    def flush(self):
+        """Write every entry to disk, e.g. to hand a spill file to another process"""
+        if self._disk is not None:
+            self._pending.update(self._mem)
+            self._mem.clear()
+            if self._pending:
+                self._spill()
+
+    def close(self):
+        if self._disk is not None:
+            if self._pending:
+                self._spill()
+            self._disk.commit()
+            self._disk.close()
+            self._disk = None
+
+    def _record(self, key, count=True):
+        """key's record, promoted to memory as most recently used; None when absent or expired"""
+        now = self.clock() if self.ttl else 0
+        record = self._mem.get(key)
+        if record is not None:
+            if self.ttl and now - record[2] >= self.ttl:
+                del self._mem[key]
+                self._drop(key, record)
+                record = None
+            else:
+                self._mem.move_to_end(key)
+                record[2] = now
+                self.hits += count
+                return record
+        if record is None and (self._pending or self._disk_len):
+            record = self._pending.pop(key, None)
+            if record is None and self._disk_len:
+                row = self._disk.execute('DELETE FROM state WHERE key = ? RETURNING value, seq, used',
+                                         (key,)).fetchone()
+                if row is not None:
+                    self._disk_len -= 1
+                    record = list(row)
+            if record is not None:
+                if self.ttl and now - record[2] >= self.ttl:
+                    self._drop(key, record)
+                    record = None
+                else:
+                    self.disk_hits += count
+                    record[2] = now
+                    self._mem[key] = record
+                    self._evict()
+                    return record
+        self.misses += count
+        return None
+
+    def _insert(self, key, value):
+        self._seq += 1
+        self._mem[key] = [value, self._seq, self.clock() if self.ttl else 0]
+        self._evict()
+
+    def _evict(self):
+        while len(self._mem) > self.max_entries:
+            key, record = self._mem.popitem(last=False)
+            self.evictions += 1
+            if self._disk is not None:
+                self._pending[key] = record
+            elif self.on_drop is not None:
+                self.on_drop(key, record[0])
+        if len(self._pending) >= SPILL_BATCH:
+            self._spill()
+
+    def _drop(self, key, record):
+        self.expired += 1
+        if self.on_drop is not None:
+            self.on_drop(key, record[0])
+
+    def _spill(self):
+        with self._disk:
+            self._disk.executemany('INSERT OR REPLACE INTO state (key, value, seq, used) VALUES (?, ?, ?, ?)',
+                                   [(k, r[0], r[1], r[2]) for k, r in self._pending.items()])
+        self.spilled += len(self._pending)
+        self._disk_len += len(self._pending)
+        self._pending.clear()
@@ -1,17 +1,20 @@
 # app.py - ZOCK WITH TRADING SIGNALS
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, request, jsonify
 import sqlite3
+import csv
+import io
 import json
 import random
+import zlib
+from collections import deque
 from datetime import datetime, timedelta
 import os
+import threading
+import uuid
 
 app = Flask(__name__)
 
-# Create templates folder
-os.makedirs('templates', exist_ok=True)
-
-# Create the dashboard HTML with trading signals
+# The dashboard with trading signals, served as it is from memory
 dashboard_html = '''<!doctype html>
 <html>
 <head>
@@ -135,46 +138,94 @@ let totalProfit = 0;
 const tradingSymbols = ['BTC/USD', 'ETH/USD', 'AAPL', 'TSLA', 'GOOGL', 'MSFT', 'AMZN', 'NVDA'];
 const currentPrices = {};
 
+let alerts = [];
+let lastAlertId = 0;
+let stream = null;
+
 async function fetchAlerts(){
   const r = await fetch('/api/alerts');
   return r.json();
 }
 
+function alertRow(a){
+  const tr = document.createElement('tr');
+  const severityClass = `severity-${a.severity?.toLowerCase() || 'medium'}`;
+  const statusClass = a.siem_sent ? 'status-sent' : 'status-pending';
+  tr.dataset.id = a.id;
+
+  tr.innerHTML = `
+    <td>${a.timestamp || ''}</td>
+    <td><strong>${a.threat_type || ''}</strong></td>
+    <td class="${severityClass}">${a.severity || 'Medium'}</td>
+    <td>${a.source_ip || ''}</td>
+    <td class="${statusClass}">${a.siem_sent ? '✅ Sent' : '⏳ Pending'}</td>
+  `;
+  return tr;
+}
+
+// Load once; the stream sends every change after that
+async function reloadAlerts(){
+  alerts = await fetchAlerts();
+  lastAlertId = alerts.reduce((m, a) => Math.max(m, a.id), 0);
+  const alertsTbody = document.querySelector("#alertsTable tbody");
+  alertsTbody.innerHTML = "";
+  alerts.slice().reverse().forEach(a => alertsTbody.appendChild(alertRow(a)));
+  alertsChanged();
+}
+
+function alertsChanged(){
+  document.getElementById('totalAlerts').innerText = alerts.length;
+  document.getElementById('siemAlerts').innerText = alerts.filter(a => a.siem_sent).length;
+  updateThreatChart(alerts);
+}
+
+// Rows already shown are patched in place when their status changes
+function markSent(ids){
+  const sent = new Set(ids);
+  alerts.forEach(a => { if (sent.has(a.id)) a.siem_sent = 1; });
+  document.querySelectorAll('#alertsTable tbody tr').forEach(tr => {
+    if (sent.has(Number(tr.dataset.id))) {
+      const cell = tr.lastElementChild;
+      cell.className = 'status-sent';
+      cell.innerText = '✅ Sent';
+    }
+  });
+  alertsChanged();
+}
+
+function connectStream(){
+  if (stream) stream.close();
+  stream = new EventSource(`/api/alerts/stream?last_id=${lastAlertId}`);
+  stream.addEventListener('alert', e => {
+    const a = JSON.parse(e.data);
+    if (a.id <= lastAlertId) return;
+    alerts.unshift(a);
+    lastAlertId = a.id;
+    document.querySelector("#alertsTable tbody").appendChild(alertRow(a));
+    alertsChanged();
+  });
+  stream.addEventListener('siem', e => markSent(JSON.parse(e.data).ids));
+  stream.addEventListener('clear', () => {
+    alerts = [];
+    document.querySelector("#alertsTable tbody").innerHTML = "";
+    alertsChanged();
+    refreshSignals();
+  });
+  stream.addEventListener('signals', refreshSignals);
+  stream.addEventListener('reload', () => { reloadAlerts(); refreshSignals(); });
+}
+
 async function fetchTradingSignals(){
   const r = await fetch('/api/trading-signals');
   return r.json();
 }
 
-async function refresh(){
-  const alerts = await fetchAlerts();
+async function refreshSignals(){
   const tradingSignals = await fetchTradingSignals();
   
-  // Update statistics
-  document.getElementById('totalAlerts').innerText = alerts.length;
-  const siemCount = alerts.filter(a => a.siem_sent).length;
-  document.getElementById('siemAlerts').innerText = siemCount;
   document.getElementById('tradingSignals').innerText = tradingSignals.length;
   document.getElementById('totalProfit').innerText = `$${totalProfit}`;
 
-  // Update security alerts table
-  const alertsTbody = document.querySelector("#alertsTable tbody");
-  alertsTbody.innerHTML = "";
-  
-  alerts.slice().reverse().forEach(a => {
-    const tr = document.createElement('tr');
-    const severityClass = `severity-${a.severity?.toLowerCase() || 'medium'}`;
-    const statusClass = a.siem_sent ? 'status-sent' : 'status-pending';
-    
-    tr.innerHTML = `
-      <td>${a.timestamp || ''}</td>
-      <td><strong>${a.threat_type || ''}</strong></td>
-      <td class="${severityClass}">${a.severity || 'Medium'}</td>
-      <td>${a.source_ip || ''}</td>
-      <td class="${statusClass}">${a.siem_sent ? '✅ Sent' : '⏳ Pending'}</td>
-    `;
-    alertsTbody.appendChild(tr);
-  });
-
   // Update trading signals table
   const tradingTbody = document.querySelector("#tradingTable tbody");
   tradingTbody.innerHTML = "";
@@ -195,8 +246,6 @@ async function refresh(){
     tradingTbody.appendChild(tr);
   });
 
-  // Update charts
-  updateThreatChart(alerts);
   updateTradingChart(tradingSignals);
 }
 
@@ -207,12 +256,14 @@ function updateThreatChart(alerts) {
     threatCounts[threat] = (threatCounts[threat] || 0) + 1; 
   });
 
-  const ctx = document.getElementById('threatChart').getContext('2d');
-  
   if (threatChart) {
-    threatChart.destroy();
+    threatChart.data.labels = Object.keys(threatCounts);
+    threatChart.data.datasets[0].data = Object.values(threatCounts);
+    threatChart.update('none');
+    return;
   }
 
+  const ctx = document.getElementById('threatChart').getContext('2d');
   threatChart = new Chart(ctx, {
     type: 'doughnut',
     data: {
@@ -244,7 +295,9 @@ function updateTradingChart(signals) {
   signals.forEach(s => signalCounts[s.signal]++);
 
   if (tradingChart) {
-    tradingChart.destroy();
+    tradingChart.data.datasets[0].data = [signalCounts.BUY, signalCounts.SELL, signalCounts.HOLD];
+    tradingChart.update('none');
+    return;
   }
 
   tradingChart = new Chart(ctx, {
@@ -283,14 +336,12 @@ async function generateAlerts(){
   const r = await fetch('/api/generate', { method:'POST' });
   const result = await r.json();
   alert(`✅ ${result.message}`);
-  await refresh();
 }
 
 async function testSIEM(){
   const r = await fetch('/api/test-siem', { method:'POST' });
   const result = await r.json();
   alert(`🔗 ${result.message}`);
-  await refresh();
 }
 
 async function generateTradingSignals(){
@@ -302,22 +353,19 @@ async function generateTradingSignals(){
   totalProfit += parseFloat(profit);
   
   alert(`📈 ${result.message}\nProfit: $${profit}`);
-  await refresh();
+  await refreshSignals();
 }
 
-async function downloadAlerts(){
-  const alerts = await fetchAlerts();
-  const signals = await fetchTradingSignals();
-  const data = { security_alerts: alerts, trading_signals: signals, total_profit: totalProfit };
-  
-  const blob = new Blob([JSON.stringify(data, null, 2)], {type:'application/json'});
-  const url = URL.createObjectURL(blob);
-  const a = document.createElement('a');
-  a.href = url; 
-  a.download = `zock_data_${new Date().toISOString().split('T')[0]}.json`;
-  document.body.appendChild(a); 
-  a.click(); 
-  a.remove();
+// Exports stream from the server straight to disk instead of through a Blob
+function downloadAlerts(){
+  ['alerts', 'trading_signals'].forEach(dataset => {
+    const a = document.createElement('a');
+    a.href = `/api/export?dataset=${dataset}&format=ndjson&compression=gzip`;
+    a.download = '';
+    document.body.appendChild(a);
+    a.click();
+    a.remove();
+  });
 }
 
 // Initialize trading prices
@@ -325,19 +373,21 @@ tradingSymbols.forEach(symbol => {
   currentPrices[symbol] = Math.random() * 1000 + 50;
 });
 
-// Start auto-refresh
-refresh();
-setInterval(refresh, 3000);
+// Load once, then apply what the server pushes
+reloadAlerts().then(connectStream);
+refreshSignals();
 </script>
 </body>
 </html>'''
 
-with open('templates/dashboard.html', 'w', encoding='utf-8') as f:
-    f.write(dashboard_html)
-
 class ZOCKEngine:
     def __init__(self):
         self.conn = sqlite3.connect('zock.db', check_same_thread=False)
+        self.seq = 0  # bumped on every write by this process
+        self._changed = threading.Condition()
+        self._events = deque(maxlen=256)  # (seq, kind, data) of recent writes, for streams
+        self.etag_token = uuid.uuid4().hex[:12]  # versions of another process never match
+        self.response_cache = {}  # request path -> (data_version, body)
         self.init_db()
     
     def init_db(self):
@@ -383,7 +433,7 @@ class ZOCKEngine:
         for i in range(count):
             threat = random.choice(threats)
             source_ip = f"192.168.1.{random.randint(1, 255)}"
-            timestamp = datetime.now().strftime("%H:%M:%S")
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
             cursor = self.conn.cursor()
             cursor.execute('''
@@ -397,6 +447,7 @@ class ZOCKEngine:
             ))
         
         self.conn.commit()
+        self._publish('insert')
         return count
     
     def generate_trading_signals(self, count=6):
@@ -413,7 +464,7 @@ class ZOCKEngine:
             price = round(random.uniform(50, 1500), 2)
             change = round(random.uniform(-5, 5), 2)
             confidence = random.randint(75, 95)
-            timestamp = datetime.now().strftime("%H:%M:%S")
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
             cursor.execute('''
                 INSERT INTO trading_signals (timestamp, symbol, signal, price, change, confidence)
@@ -421,11 +472,15 @@ class ZOCKEngine:
             ''', (timestamp, symbol, signal, price, change, confidence))
         
         self.conn.commit()
+        self._publish('signals')
         return count
     
-    def get_alerts(self):
+    def get_alerts(self, since_id=None):
         cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM alerts ORDER BY timestamp DESC')
+        if since_id is not None:
+            cursor.execute('SELECT * FROM alerts WHERE id > ? ORDER BY id', (since_id,))
+        else:
+            cursor.execute('SELECT * FROM alerts ORDER BY timestamp DESC')
         columns = [col[0] for col in cursor.description]
         return [dict(zip(columns, row)) for row in cursor.fetchall()]
     
@@ -437,49 +492,204 @@ class ZOCKEngine:
     
     def test_siem_integration(self):
         cursor = self.conn.cursor()
-        cursor.execute('UPDATE alerts SET siem_sent = 1 WHERE siem_sent = 0')
-        updated = cursor.rowcount
+        cursor.execute('UPDATE alerts SET siem_sent = 1 WHERE siem_sent = 0 RETURNING id')
+        ids = [row[0] for row in cursor.fetchall()]
         self.conn.commit()
-        return updated
+        self._publish('siem', {'ids': ids})
+        return len(ids)
     
     def clear_alerts(self):
         cursor = self.conn.cursor()
         cursor.execute('DELETE FROM alerts')
         cursor.execute('DELETE FROM trading_signals')
         self.conn.commit()
-
-zock = ZOCKEngine()
+        self._publish('clear')
+
+    def data_version(self):
+        """Changes on every write, from this process or another; drives ETags and the response cache"""
+        return f'{self.seq}.{self.external_version()}'
+
+    def external_version(self):
+        """SQLite's data_version: moves when another connection commits, not when this one does"""
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def _publish(self, kind, data=None):
+        """Record a committed write and wake the streams waiting for one"""
+        with self._changed:
+            self.seq += 1
+            self._events.append((self.seq, kind, data))
+            self._changed.notify_all()
+
+    def wait_for_change(self, seq, timeout):
+        """Block until a write by this process newer than seq; return (seq, [(kind, data), ...])"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.seq != seq, timeout)
+            return self.seq, [(kind, data) for s, kind, data in self._events if s > seq]
+
+EXPORT_DATASETS = ('alerts', 'trading_signals')
+EXPORT_CHUNK_ROWS = 1000
+
+def export_rows(dataset, fmt):
+    """Encode a table as NDJSON or CSV, fetched and yielded EXPORT_CHUNK_ROWS rows at a time"""
+    conn = sqlite3.connect('zock.db')  # its own connection: the export outlives the request
+    try:
+        cursor = conn.execute(f'SELECT * FROM {dataset} ORDER BY id')
+        columns = [col[0] for col in cursor.description]
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            if fmt == 'csv':
+                writer.writerows(rows)
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows).encode('utf-8')
+        if fmt == 'csv' and buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+    finally:
+        conn.close()
+
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_POLL_SECONDS = 2  # how soon streams see writes by other processes
+
+def sse(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # gzip framing
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+def engine():
+    """This process's ZOCKEngine, opened on first use.
+
+    Importing the app opens nothing, so every worker of a pre-forking server
+    gets its own connection instead of sharing one across fork.
+    """
+    global _engine, _engine_pid
+    if _engine_pid != os.getpid():
+        with _engine_lock:
+            if _engine_pid != os.getpid():
+                _engine = ZOCKEngine()
+                _engine_pid = os.getpid()
+    return _engine
+
+def versioned_json(build):
+    """Serve build() as JSON; 304 or a cached body until the data changes"""
+    zock = engine()
+    response_cache = zock.response_cache
+    version = zock.data_version()
+    etag = f'{zock.etag_token}-{version}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        cached = response_cache.get(request.full_path)
+        if cached is None or cached[0] != version:
+            if len(response_cache) > 256:
+                response_cache.clear()
+            cached = (version, jsonify(build()).get_data())
+            response_cache[request.full_path] = cached
+        response = Response(cached[1], mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/')
 def dashboard():
-    return render_template('dashboard.html')
+    return Response(dashboard_html, mimetype='text/html')
 
 @app.route('/api/alerts')
 def api_alerts():
-    return jsonify(zock.get_alerts())
+    return versioned_json(lambda: engine().get_alerts(request.args.get('since_id', type=int)))
+
+@app.route('/api/alerts/stream')
+def api_alert_stream():
+    """Server-Sent Events: new alerts after last_id, SIEM status changes, clears and new trading signals"""
+    zock = engine()  # the stream outlives the request context
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_id') or 0)
+    except ValueError:
+        return jsonify({'message': 'last_id must be an integer'}), 400
+
+    def stream(last_id):
+        seq = zock.seq
+        external = zock.external_version()
+        idle = 0
+        yield 'retry: 3000\n\n'
+        while True:
+            for alert in zock.get_alerts(last_id):
+                last_id = alert['id']
+                yield sse('alert', alert, last_id)
+            seq, events = zock.wait_for_change(seq, STREAM_POLL_SECONDS)
+            for kind, data in events:
+                if kind != 'insert':  # new alerts are read above
+                    yield sse(kind, data)
+            # Another process wrote: which rows it changed is unknown, so the dashboard reloads
+            previous, external = external, zock.external_version()
+            if external != previous:
+                yield sse('reload', None)
+            idle = 0 if events or external != previous else idle + STREAM_POLL_SECONDS
+            if idle >= STREAM_KEEPALIVE_SECONDS:
+                idle = 0
+                yield ': keep-alive\n\n'
+
+    return Response(stream(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/trading-signals')
 def api_trading_signals():
-    return jsonify(zock.get_trading_signals())
+    return versioned_json(engine().get_trading_signals)
 
 @app.route('/api/generate', methods=['POST'])
 def generate_alerts():
-    count = zock.generate_sample_alerts(5)
+    count = engine().generate_sample_alerts(5)
     return jsonify({'message': f'Generated {count} security threats', 'alerts_count': count})
 
 @app.route('/api/generate-trading', methods=['POST'])
 def generate_trading_signals():
-    count = zock.generate_trading_signals(6)
+    count = engine().generate_trading_signals(6)
     return jsonify({'message': f'Generated {count} trading signals', 'signals_count': count})
 
 @app.route('/api/test-siem', methods=['POST'])
 def test_siem():
-    count = zock.test_siem_integration()
+    count = engine().test_siem_integration()
     return jsonify({'message': f'Sent {count} alerts to SIEM platforms', 'alerts_sent': count})
 
+@app.route('/api/export')
+def export_data():
+    """Stream a table as a download: dataset, format (ndjson or csv), compression (none or gzip)"""
+    dataset = request.args.get('dataset', 'alerts')
+    fmt = request.args.get('format', 'ndjson')
+    compression = request.args.get('compression', 'none')
+    if dataset not in EXPORT_DATASETS or fmt not in ('ndjson', 'csv') or compression not in ('none', 'gzip'):
+        return jsonify({'message': 'dataset must be alerts or trading_signals, format ndjson or csv, '
+                                   'compression none or gzip'}), 400
+    chunks = export_rows(dataset, fmt)
+    name = f"zock_{dataset}_{datetime.now():%Y-%m-%d}.{fmt}"
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    if compression == 'gzip':
+        chunks, name, mimetype = gzip_chunks(chunks), name + '.gz', 'application/gzip'
+    return Response(chunks, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename="{name}"'})
+
 @app.route('/api/clear', methods=['POST'])
 def clear_alerts():
-    zock.clear_alerts()
+    engine().clear_alerts()
     return jsonify({'message': 'All data cleared'})
 
 if __name__ == '__main__':
@@ -0,0 +1,299 @@
+# storage.py - SQLite connection tuning and batched alert writes
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from metrics import Histogram
+
+# ts (event time, epoch seconds) and the aggregation columns come last: they
+# were added to existing tables with ALTER TABLE (see partitions.ADDED_COLUMNS)
+ALERT_COLUMNS = ('timestamp', 'threat_type', 'detection', 'severity', 'source_ip', 'entity',
+                 'owasp_category', 'log_data', 'ai_analysis', 'siem_sent', 'siem_platforms', 'ts',
+                 'count', 'last_ts', 'samples', 'agg_key')
+# Format with the partition table to insert into
+INSERT_ALERT_SQL = (f"INSERT INTO {{table}} ({', '.join(ALERT_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(ALERT_COLUMNS))})")
+# Writes an aggregate's current state; an older snapshot arriving late never
+# overwrites a newer one. A grown count makes the row pending for every SIEM
+# again, so the new count is forwarded.
+UPSERT_AGGREGATE_SQL = INSERT_ALERT_SQL + '''
+    ON CONFLICT(agg_key) WHERE agg_key IS NOT NULL DO UPDATE SET
+        count = max(count, excluded.count),
+        last_ts = max(last_ts, excluded.last_ts),
+        samples = CASE WHEN excluded.count > count THEN excluded.samples ELSE samples END,
+        siem_sent = CASE WHEN excluded.count > count THEN 0 ELSE siem_sent END,
+        siem_platforms = CASE WHEN excluded.count > count THEN 'Pending' ELSE siem_platforms END
+'''
+
+
+def connect(path, **kwargs):
+    conn = sqlite3.connect(path, check_same_thread=False, **kwargs)
+    tune(conn)
+    return conn
+
+
+def tune(conn):
+    # Only takes effect on a new database; lets dropped partitions be handed
+    # back to the filesystem with PRAGMA incremental_vacuum
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    # WAL lets readers run alongside the writer; with WAL, synchronous=NORMAL
+    # only fsyncs at checkpoints and stays durable against application crashes
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=5000')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-65536')  # 64 MiB
+
+
+def connect_readonly(path):
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+    conn.execute('PRAGMA busy_timeout=5000')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-16384')  # 16 MiB per reader
+    return conn
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """One writer connection and a bounded pool of read-only connections.
+
+    With WAL, readers see the last committed snapshot and never wait for the
+    writer, so dashboard reads keep scaling while ingestion is writing. All
+    writes go through the single writer connection: the group-commit writer
+    and write() share it under one lock. Reader connections are created on
+    demand up to max_readers and reused most-recently-used first.
+    """
+
+    def __init__(self, path, max_readers=8, timeout=5.0):
+        self.path = path
+        self.max_readers = max_readers
+        self.timeout = timeout
+        self._write_conn = connect(path)
+        self._write_lock = threading.Lock()
+        self.writer = GroupCommitWriter(self._write_conn, lock=self._write_lock)
+        self._version_conn = connect_readonly(path)
+        self._version_lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waited = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._writes = 0
+        self._write_wait_time = 0.0
+
+    @contextmanager
+    def reader(self):
+        """Read-only connection; everything read through it sees one snapshot"""
+        conn = self._acquire()
+        try:
+            conn.execute('BEGIN')
+            yield conn
+        finally:
+            conn.rollback()  # end any read transaction so the WAL can checkpoint
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(conn)
+
+    @contextmanager
+    def write(self, transaction=True):
+        """Writer connection inside a transaction, committed on success.
+
+        transaction=False only takes the write lock, for statements such as
+        VACUUM that cannot run inside a transaction.
+        """
+        start = time.perf_counter()
+        with self._write_lock:
+            self._write_wait_time += time.perf_counter() - start
+            self._writes += 1
+            if not transaction:
+                yield self._write_conn
+                return
+            with self._write_conn:
+                yield self._write_conn
+
+    def data_version(self):
+        """Changes whenever any other connection commits, including other processes"""
+        with self._version_lock:
+            return self._version_conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def close(self):
+        """Stop the group-commit writer and close every connection; readers in use are left alone"""
+        self.writer.close()
+        with self._write_lock:
+            self._write_conn.close()
+        with self._version_lock:
+            self._version_conn.close()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.max_readers:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = connect_readonly(self.path)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                start = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(f'no reader connection free after {self.timeout}s')
+                with self._lock:
+                    self._waited += 1
+                    self._wait_time += time.perf_counter() - start
+        with self._lock:
+            self._acquired += 1
+            self._in_use += 1
+        return conn
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'readers_max': self.max_readers,
+                'readers_open': self._created,
+                'readers_in_use': self._in_use,
+                'reader_acquisitions': self._acquired,
+                'reader_waits': self._waited,
+                'reader_wait_seconds': round(self._wait_time, 6),
+                'reader_timeouts': self._timeouts,
+                'writes': self._writes,
+                'write_wait_seconds': round(self._write_wait_time, 6),
+                'writer_queue_depth': self.writer.queue_depth(),
+                'group_commits': self.writer.commits,
+                'rows_written': self.writer.rows_written,
+            }
+
+
+class _Batch:
+    __slots__ = ('statements', 'size', 'done', 'error', 'queued')
+
+    def __init__(self, statements):
+        self.statements = statements
+        self.size = sum(len(rows) for _, rows in statements)
+        self.queued = time.perf_counter()
+        self.done = threading.Event()
+        self.error = None
+
+
+class GroupCommitWriter:
+    """Single writer thread that commits concurrently submitted batches together.
+
+    write() queues a batch and blocks until it is committed. The writer drains
+    everything queued while the previous transaction was running into the next
+    one, so concurrent producers share a single commit instead of paying for
+    one each. A batch that fails is retried on its own so it cannot take the
+    rest of its group down with it. commit_latency times each transaction and
+    write_latency each batch from submit() until its commit.
+    """
+
+    def __init__(self, conn, max_group_rows=100000, lock=None):
+        self.conn = conn
+        self.max_group_rows = max_group_rows
+        self.lock = lock or threading.Lock()
+        self.commits = 0
+        self.rows_written = 0
+        self.commit_latency = Histogram()
+        self.write_latency = Histogram()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='zock-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, rows, sql):
+        if not rows:
+            return 0
+        self.write_many([(sql, rows)])
+        return len(rows)
+
+    def write_many(self, statements):
+        """Run [(sql, rows), ...] with executemany, atomically, in the next group commit"""
+        self.wait(self.submit(statements))
+
+    def submit(self, statements):
+        """Queue statements without waiting; pass the result to wait()"""
+        batch = _Batch(statements)
+        self._queue.put(batch)
+        return batch
+
+    @staticmethod
+    def wait(batch):
+        batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            group, size = [batch], batch.size
+            while size < self.max_group_rows:
+                try:
+                    batch = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if batch is None:
+                    self._queue.put(None)  # finish this group, then stop
+                    break
+                group.append(batch)
+                size += batch.size
+            self._commit(group)
+
+    def _commit(self, group):
+        # Any exception, not only sqlite3.Error (an int too large for SQLite
+        # raises OverflowError), must reach the batch: the writer thread has to
+        # survive and every waiter has to be released
+        try:
+            self._execute(group)
+        except Exception:
+            for batch in group:
+                try:
+                    self._execute([batch])
+                except Exception as e:
+                    batch.error = e
+        finally:
+            now = time.perf_counter()
+            for batch in group:
+                self.write_latency.observe(now - batch.queued)
+                batch.done.set()
+
+    def _execute(self, group):
+        with self.lock:
+            start = time.perf_counter()
+            with self.conn:
+                for batch in group:
+                    for sql, rows in batch.statements:
+                        self.conn.executemany(sql, rows)
+            self.commit_latency.observe(time.perf_counter() - start)
+        self.commits += 1
+        self.rows_written += sum(b.size for b in group)
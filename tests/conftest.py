@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """A ZOCKEngine over a new database, with no SIEM targets, AI model or aggregation"""
+    pytest.importorskip('flask')
+    from app import ZOCKEngine
+
+    engine = ZOCKEngine(str(tmp_path / 'zock.db'), siem_targets=[], ai_model=False, aggregate_seconds=0,
+                        migrate=True)
+    yield engine
+    engine.close()
+
+
+@pytest.fixture
+def client(engine):
+    """Flask test client of an app serving engine"""
+    from app import create_app
+
+    return create_app(engine=engine).test_client()
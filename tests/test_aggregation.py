@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+import main
+from aggregation import AlertAggregator, aggregate_alerts
+
+
+def alert(ts, entity='10.0.0.1', detection='Injection pattern', evidence=None):
+    return {'ts': ts, 'detection': detection, 'entity': entity, 'evidence': evidence}
+
+
+def test_window_closes_when_its_key_or_the_stream_moves_on():
+    aggregator = AlertAggregator(window=60)
+    first, created = aggregator.add('a', 0, alert(0))
+    assert created
+    assert aggregator.add('a', 59, alert(59)) == (first, False)
+    other, _ = aggregator.add('b', 30, alert(30, entity='10.0.0.2'))
+    assert aggregator.expire() == []
+
+    later, created = aggregator.add('a', 61, alert(61))  # a's next window closes its first
+    assert created and later.seq > first.seq
+    assert aggregator.expire() == [first]
+    assert (first.count, first.first_ts, first.last_ts) == (2, 0, 59)
+
+    aggregator.add('a', 125, alert(125))  # two windows past b, which had no more alerts
+    assert aggregator.expire() == [later, other]
+    assert len(aggregator) == 1
+
+
+def test_aggregated_alerts_keep_count_times_and_distinct_samples():
+    alerts = [alert(f'2025-08-19T11:59:{s:02d}Z', evidence=f'id={s % 2}') for s in range(0, 30, 5)]
+    alerts.append(alert('2025-08-19T12:01:00Z'))
+    merged = list(aggregate_alerts(alerts, AlertAggregator(window=60, max_samples=5)))
+    assert [a['count'] for a in merged] == [6, 1]
+    assert merged[0]['first_seen'] == '2025-08-19T11:59:00+00:00'
+    assert merged[0]['last_seen'] == '2025-08-19T11:59:25+00:00'
+    assert merged[0]['samples'] == ['id=0', 'id=1']
+
+
+def test_open_windows_are_written_when_follow_is_interrupted(tmp_path, monkeypatch):
+    def interrupted(path, follow=False):
+        for s in range(3):
+            yield json.dumps({'ts': f'2025-08-19T11:59:{s:02d}Z', 'src_ip': '10.0.0.1',
+                              'msg': 'GET /item?id=1 OR 1=1'})
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(main, 'iter_lines', interrupted)
+    out = tmp_path / 'alerts.jsonl'
+    counts, _ = main.run('-', str(out), follow=True, aggregate=60)
+    written = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [(a['detection'], a['count']) for a in written] == [('Injection pattern', 3)]
+    assert counts == {'Injection pattern': 1}
+
+
+def test_stored_aggregate_is_updated_in_place(tmp_path):
+    pytest.importorskip('flask')
+    from app import ZOCKEngine
+
+    engine = ZOCKEngine(str(tmp_path / 'zock.db'), siem_targets=[], ai_model=False, aggregate_seconds=60,
+                        migrate=True, background=False)
+
+    def event(ts):
+        return json.dumps({'ts': ts, 'src_ip': '10.0.0.1', 'msg': 'GET /item?id=1 OR 1=1'})
+
+    try:
+        assert engine.ingest([event('2025-08-19T11:59:00Z'), event('2025-08-19T11:59:10Z')])['alerts_aggregated'] == 1
+        [stored] = engine.get_alerts(10)[0]
+        seq = engine.changes.seq
+        engine.ingest([event('2025-08-19T11:59:40Z')])  # a later batch, same window
+        [row] = engine.get_alerts(10)[0]
+        assert (row['id'], row['agg_key']) == (stored['id'], stored['agg_key'])
+        assert (row['count'], row['ts'], row['last_ts']) == (3, stored['ts'], stored['ts'] + 40)
+        _, changes = engine.changes.wait(seq, 0)
+        assert ('aggregate', [{'agg_key': row['agg_key'], 'count': 3, 'last_seen': '2025-08-19 11:59:40',
+                               'siem_sent': False, 'siem_platforms': 'Pending'}]) in changes
+
+        engine.ingest([event('2025-08-19T12:01:00Z')])  # the next window opens a new row
+        rows = engine.get_alerts(10)[0]
+        assert [r['count'] for r in rows] == [1, 3]
+        assert rows[0]['agg_key'] != row['agg_key']
+    finally:
+        engine.close()
@@ -0,0 +1,226 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ai_analysis import AIAnalyzer, ChatModel, VerdictCache, fingerprint
+from storage import ConnectionPool
+
+
+class StubModel:
+    """Local stand-in for an OpenAI-compatible chat completions server.
+
+    Every numbered alert line in a request gets the verdict
+    "verdict: <detection>". Requests are answered with the next status from
+    failures first, then normally; while hold is clear they wait for it.
+    """
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.requests = []
+        self.hold = threading.Event()
+        self.hold.set()
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                lines = body['messages'][-1]['content'].splitlines()
+                with stub.lock:
+                    stub.requests.append(lines)
+                    status = stub.failures.pop(0) if stub.failures else 200
+                stub.hold.wait(10)
+                if status == 200:
+                    verdicts = [{'n': n, 'verdict': 'verdict: ' + line.split('] ', 1)[1].split(' from ')[0]}
+                                for n, line in enumerate(lines, 1)]
+                    payload = json.dumps({'choices': [{'message': {'content': json.dumps(verdicts)}}]})
+                else:
+                    payload = '{"error": "unavailable"}'
+                payload = payload.encode()
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.hold.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Store:
+    """Alerts in memory, with the fetch/record callbacks AIAnalyzer takes"""
+
+    def __init__(self):
+        self.alerts = []
+        self.analysis = {}
+        self.recorded = []
+        self.fetched_after = []
+        self.lock = threading.Lock()
+
+    def add(self, detection, log_data, source_ip='10.0.0.1'):
+        with self.lock:
+            self.alerts.append({'id': len(self.alerts) + 1, 'detection': detection, 'severity': 'High',
+                                'source_ip': source_ip, 'log_data': log_data})
+
+    def fetch(self, after_id, limit):
+        with self.lock:
+            self.fetched_after.append(after_id)
+            return [dict(a) for a in self.alerts
+                    if a['id'] > after_id and a['id'] not in self.analysis][:limit]
+
+    def record(self, ids, text):
+        with self.lock:
+            self.recorded.append(list(ids))
+            for i in ids:
+                self.analysis.setdefault(i, text)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'zock.db'), max_readers=2)
+    cache = VerdictCache(pool)
+    cache.init_db()
+    yield cache
+    pool.close()
+
+
+@pytest.fixture
+def model():
+    stub = StubModel()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def analyzers(model, cache):
+    started = []
+
+    def start(store, **options):
+        options = {'backoff': 0.01, 'max_backoff': 0.05, 'poll_interval': 0.05, **options}
+        analyzer = AIAnalyzer(ChatModel(model.url, 'stub'), cache, store.fetch, store.record, **options)
+        started.append(analyzer)
+        return analyzer
+
+    yield start
+    for analyzer in started:
+        analyzer.close()
+
+
+def test_identical_alerts_share_one_model_call(model, analyzers):
+    store = Store()
+    for i in range(5):
+        store.add('SQL Injection', f"GET /item?id={i} OR 1=1 from 10.0.0.{i}", source_ip=f'10.0.0.{i}')
+    analyzer = analyzers(store)
+    wait_for(lambda: len(store.analysis) == 5)
+    assert len(model.requests) == 1
+    assert len(model.requests[0]) == 1
+    assert set(store.analysis.values()) == {'verdict: SQL Injection'}
+    metrics = analyzer.metrics()
+    assert metrics['model_calls'] == 1
+    assert metrics['deduplicated'] == 4
+    assert metrics['analyzed'] == 5
+
+
+def test_cached_verdict_skips_the_model(model, cache, analyzers):
+    store = Store()
+    store.add('XSS Attack', '<script>alert(1)</script>')
+    cache.put_many({fingerprint(store.alerts[0]): 'cached verdict'})
+    analyzer = analyzers(store)
+    wait_for(lambda: len(store.analysis) == 1)
+    assert store.analysis[1] == 'cached verdict'
+    assert model.requests == []
+    assert analyzer.metrics()['cache_hits'] == 1
+
+
+def test_verdicts_are_cached_for_later_alerts(model, analyzers):
+    store = Store()
+    store.add('Path Traversal', 'GET /../../etc/passwd')
+    analyzers(store)
+    wait_for(lambda: len(store.analysis) == 1)
+    store.add('Path Traversal', 'GET /../../etc/passwd')
+    analyzer = analyzers(store)
+    wait_for(lambda: len(store.analysis) == 2)
+    assert len(model.requests) == 1
+    assert analyzer.metrics()['cache_hits'] == 1
+
+
+def test_distinct_alerts_are_batched_into_one_request(model, analyzers):
+    store = Store()
+    store.add('Brute Force', 'failed password for root')
+    model.hold.clear()  # keep the only worker busy while more alerts queue up
+    analyzer = analyzers(store, concurrency=1)
+    wait_for(lambda: len(model.requests) == 1)
+    for detection, log in [('SQL Injection', "' OR 1=1 --"), ('XSS Attack', '<script>'),
+                           ('Command Injection', '; cat /etc/passwd')]:
+        store.add(detection, log)
+    wait_for(lambda: analyzer.metrics()['queue_depth'] == 3)
+    model.hold.set()
+    wait_for(lambda: len(store.analysis) == 4)
+    assert [len(lines) for lines in model.requests] == [1, 3]
+    assert store.analysis[3] == 'verdict: XSS Attack'
+
+
+def test_transient_failure_is_retried_with_backoff(model, analyzers):
+    model.failures = [503, 429]
+    store = Store()
+    store.add('Malware', 'beacon to c2.example')
+    analyzer = analyzers(store)
+    wait_for(lambda: len(store.analysis) == 1)
+    assert len(model.requests) == 3
+    assert analyzer.metrics()['failed'] == 0
+
+
+def test_failed_alerts_are_offered_again_without_rescanning(model, analyzers):
+    model.failures = [500]
+    store = Store()
+    store.add('Data Exfiltration', 'POST 80MB to paste.example')
+    analyzer = analyzers(store, max_retries=0, retry_interval=0.2)
+    wait_for(lambda: analyzer.metrics()['failed'] == 1)
+    assert store.analysis == {}
+    wait_for(lambda: len(store.analysis) == 1)
+    assert store.analysis[1] == 'verdict: Data Exfiltration'
+    assert len(model.requests) == 2
+    assert store.recorded == [[1]]
+    # The cursor stays past alerts already offered
+    first = store.fetched_after.index(1)
+    assert set(store.fetched_after[first:]) == {1}
+
+
+def test_alerts_whose_verdict_was_not_recorded_are_offered_again(model, analyzers):
+    store = Store()
+    store.add('SQL Injection', "GET /item?id=1 UNION SELECT password FROM users")
+    record, failures = store.record, [OSError('database is locked')]
+
+    def flaky_record(ids, text):
+        if failures:
+            raise failures.pop()
+        record(ids, text)
+
+    store.record = flaky_record
+    analyzer = analyzers(store, retry_interval=0.2)
+    wait_for(lambda: len(store.analysis) == 1)
+    assert store.analysis[1] == 'verdict: SQL Injection'
+    assert len(model.requests) == 1  # the retry found the verdict in the cache
+    metrics = analyzer.metrics()
+    assert metrics['cache_hits'] == 1 and metrics['analyzed'] == 1
+    assert metrics['last_error'] == 'database is locked'
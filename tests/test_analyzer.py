@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+import analyzer
+from bench import generate_events, write_events
+
+
+@pytest.fixture
+def sample_logs(tmp_path):
+    path = tmp_path / 'sample_logs.jsonl'
+    write_events(path, generate_events(3000, seed=7, attackers=4, hosts=50))
+    return path
+
+
+def alert_tuples(path):
+    with open(path, encoding='utf-8') as f:
+        alerts = [json.loads(line) for line in f]
+    return sorted((a['ts'] or '', a['detection'], a['entity'], a['severity'], json.dumps(a['evidence'], sort_keys=True))
+                  for a in alerts)
+
+
+@pytest.mark.parametrize('workers, batch', [(2, False), (1, True), (3, True)])
+def test_sharded_and_batched_runs_match_one_process(sample_logs, tmp_path, monkeypatch, workers, batch):
+    monkeypatch.setattr(analyzer, 'MIN_SHARD_BYTES', 0)  # shard even this small file
+    single = analyzer.analyze_logs(str(sample_logs), str(tmp_path / 'single.jsonl'), z_threshold=1.5)
+    other = analyzer.analyze_logs(str(sample_logs), str(tmp_path / 'other.jsonl'), z_threshold=1.5,
+                                  workers=workers, batch=batch)
+    assert single['alerts_count'] > 0 and 'Behavioral anomaly' in single['counts_by_detection']
+    assert other['counts_by_detection'] == single['counts_by_detection']
+    assert alert_tuples(tmp_path / 'other.jsonl') == alert_tuples(tmp_path / 'single.jsonl')
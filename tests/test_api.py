@@ -0,0 +1,119 @@
+import json
+
+import pytest
+
+import partitions
+
+
+def ndjson(alerts):
+    return '\n'.join(json.dumps(a) for a in alerts)
+
+
+def alert(ts, n):
+    return {'detection': 'SQL Injection', 'severity': 'High', 'source_ip': f'10.0.0.{n}', 'timestamp': ts}
+
+
+@pytest.fixture
+def yesterday(monkeypatch):
+    """Partitions are created for yesterday until the test calls the result"""
+    day = partitions.today()
+    monkeypatch.setattr(partitions, 'today', lambda: day - 1)
+    return lambda: monkeypatch.setattr(partitions, 'today', lambda: day)
+
+
+def test_pages_cover_tied_timestamps_across_partitions(yesterday, client, engine):
+    older = [alert('2025-08-19 12:00:00', n) for n in range(3)] + [alert('2025-08-19 11:59:50', n) for n in range(4)]
+    assert client.post('/api/ingest', data=ndjson(older)).status_code == 200
+    yesterday()
+    newer = [alert('2025-08-19 12:00:00', n) for n in range(4)] + [alert('2025-08-19 12:00:05', n) for n in range(2)]
+    assert client.post('/api/ingest', data=ndjson(newer)).status_code == 200
+    with engine.pool.reader() as conn:
+        assert len(engine.partitions.list(conn)) == 2
+
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/alerts', query_string={'limit': 4, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200
+        seen += [(a['ts'], a['id']) for a in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert len(seen) == 13
+    assert seen == sorted(set(seen), reverse=True)
+
+
+def test_ingest_rejects_a_body_of_malformed_lines(client, engine):
+    response = client.post('/api/ingest', data='not json\n[1, 2]\n{"detection": "XSS", "count": -1}\n')
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['status'] == 'error' and body['rejected'] == 3
+    assert engine.get_stats()['total_alerts'] == 0
+
+
+def test_ingest_stores_the_valid_lines_of_a_partial_batch(client, engine, monkeypatch):
+    import app as zock_app
+
+    monkeypatch.setattr(zock_app, 'INGEST_BATCH_ROWS', 2)  # several batches, the last one partial
+    lines = [json.dumps(alert('2025-08-19 12:00:00', n)) for n in range(5)]
+    lines[1] = '{"detection": '
+    lines[3] = json.dumps({'detection': 'XSS', 'evidence': 'not an object'})
+    lines.append(json.dumps({'ts': '2025-08-19T12:00:00Z', 'src_ip': '10.0.0.9', 'msg': 'GET /../../etc/passwd'}))
+    response = client.post('/api/ingest', data='\n'.join(lines) + '\n\n')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['rejected'] == 2 and body['events'] == 1
+    assert body['alerts_ingested'] == 4
+    assert sorted(a['source_ip'] for a in engine.get_alerts_since(0)) == ['10.0.0.0', '10.0.0.2', '10.0.0.4',
+                                                                            '10.0.0.9']
+
+
+@pytest.fixture
+def version3(tmp_path):
+    """A schema-3 database at the engine fixture's path, holding one alert stored before full-text search"""
+    from storage import ConnectionPool
+
+    pool = ConnectionPool(str(tmp_path / 'zock.db'), max_readers=1)
+    store = partitions.AlertPartitions(pool)
+    store.init_db()
+    name = store.current()
+    with pool.write() as conn:
+        conn.execute(f'''
+            INSERT INTO {name} (timestamp, threat_type, detection, severity, source_ip, log_data, ts, last_ts)
+            VALUES ('2025-08-19 12:00:00', 'Path Traversal', 'Path Traversal', 'High', '10.0.0.1',
+                    'GET /static/../../etc/shadow', 1755604800, 1755604800)
+        ''')
+        conn.execute('UPDATE partitions SET min_ts = 1755604800, max_ts = 1755604800 WHERE name = ?', (name,))
+        conn.execute(f'DROP TRIGGER {name}_fts_delete')
+        conn.execute(f'DROP TRIGGER {name}_fts_update')
+        conn.execute(f'DROP TABLE {name}_fts')
+        conn.execute("DELETE FROM partition_meta WHERE name LIKE 'fts:%'")
+        conn.execute('DROP TABLE alert_sketches')
+        conn.execute('PRAGMA user_version = 3')
+    pool.close()
+
+
+def test_migration_indexes_alerts_stored_before_search(version3, client):
+    response = client.get('/api/search', query_string={'q': 'shadow'})
+    assert response.status_code == 200
+    found = response.get_json()
+    assert [a['log_data'] for a in found] == ['GET /static/../../etc/shadow']
+    assert found[0]['snippet'] == 'GET /static/../../etc/[shadow]'
+
+
+def test_search_finds_ingested_evidence(client):
+    lines = [{'ts': '2025-08-19T12:00:00Z', 'src_ip': '10.0.0.9', 'msg': 'GET /../../etc/passwd'},
+             dict(alert('2025-08-19 12:00:05', 1), evidence={'log_line': "id=1' UNION SELECT password FROM users"})]
+    assert client.post('/api/ingest', data=ndjson(lines)).status_code == 200
+
+    found = client.get('/api/search', query_string={'q': 'pass*', 'order': 'time'}).get_json()
+    assert len(found) == 2 and found[0]['ts'] > found[1]['ts']
+    found = client.get('/api/search', query_string={'q': 'pass*', 'source_ip': '10.0.0.1'}).get_json()
+    assert [a['ts'] for a in found] == [1755604805]
+    assert client.get('/api/search', query_string={'q': 'union'}).get_json()[0]['detection'] == 'SQL Injection'
+
+
+def test_search_rejects_a_malformed_query(client):
+    assert client.post('/api/ingest', data=ndjson([alert('2025-08-19 12:00:00', 1)])).status_code == 200
+    assert client.get('/api/search').status_code == 400
+    assert client.get('/api/search', query_string={'q': '"unbalanced'}).status_code == 400
+    assert client.get('/api/search', query_string={'q': 'x', 'order': 'oldest'}).status_code == 400
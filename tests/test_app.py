@@ -0,0 +1,113 @@
+import sqlite3
+import threading
+
+import pytest
+
+pytest.importorskip('flask')
+
+import app as zock_app
+from app import ZOCKEngine, create_app
+from partitions import LEGACY_TABLE
+from siem_forwarder import SplunkHEC
+from test_siem_forwarder import Receiver, splunk_events, splunk_ok, wait_for
+
+
+def test_app_workers_serve_requests_only(tmp_path):
+    path = str(tmp_path / 'zock.db')
+    zock_app.migrate(path)
+    app = create_app(path=path, siem_targets=[SplunkHEC('http://127.0.0.1:9', 'token')], ai_model=False)
+    engine = app.extensions['zock'].get()
+    try:
+        assert not engine.background
+        assert engine.forwarders == [] and engine.analyzer is None
+        assert engine.siem_platforms == ['Splunk']
+    finally:
+        engine.close()
+
+
+def test_one_engine_per_database_runs_the_background_stages(tmp_path):
+    path = str(tmp_path / 'zock.db')
+    first = ZOCKEngine(path, siem_targets=[], ai_model=False, migrate=True)
+    second = ZOCKEngine(path, siem_targets=[], ai_model=False)
+    try:
+        assert first.background and not second.background
+        first.close()
+        third = ZOCKEngine(path, siem_targets=[], ai_model=False)
+        assert third.background
+        third.close()
+    finally:
+        second.close()
+
+
+def test_retry_from_a_request_worker_reaches_the_background_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(zock_app, 'SIEM_SWEEP_SECONDS', 0.1)
+    hec = Receiver(splunk_ok, [(400, '{"text":"Invalid token"}')])
+    path = str(tmp_path / 'zock.db')
+    background = ZOCKEngine(path, siem_targets=[SplunkHEC(hec.url, 'token')], ai_model=False, migrate=True)
+    worker = ZOCKEngine(path, siem_targets=[SplunkHEC(hec.url, 'token')], ai_model=False, background=False)
+    try:
+        worker.generate_sample_alerts(1)
+        wait_for(lambda: worker.get_alerts_since(0)[0]['siem_platforms'] == '{"Splunk":"failed"}')
+        worker.test_siem_integration()
+        wait_for(lambda: worker.get_alerts_since(0)[0]['siem_sent'])
+        assert len(splunk_events(hec)) == 2
+    finally:
+        worker.close()
+        background.close()
+        hec.close()
+
+
+def test_stats_sketches_cover_every_process(tmp_path):
+    path = str(tmp_path / 'zock.db')
+    first = ZOCKEngine(path, siem_targets=[], ai_model=False, migrate=True)
+    second = ZOCKEngine(path, siem_targets=[], ai_model=False, background=False)
+    try:
+        first.generate_sample_alerts(3)
+        second.generate_sample_alerts(4)
+        for engine in (first, second):
+            assert engine.get_stats()['sketches']['alerts_with_source'] == 7
+    finally:
+        second.close()
+        first.close()
+    restarted = ZOCKEngine(path, siem_targets=[], ai_model=False)
+    try:
+        assert restarted.get_stats()['sketches']['alerts_with_source'] == 7
+        restarted.clear_alerts()
+        assert restarted.get_stats()['sketches']['alerts_with_source'] == 0
+    finally:
+        restarted.close()
+
+
+def test_retention_keeps_the_alerts_of_a_pre_partitioning_database(tmp_path):
+    path = str(tmp_path / 'zock.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, threat_type TEXT, detection TEXT, severity TEXT,
+            source_ip TEXT, entity TEXT, owasp_category TEXT, log_data TEXT, ai_analysis TEXT,
+            siem_sent BOOLEAN DEFAULT 0, siem_platforms TEXT
+        )
+    ''')
+    conn.executemany("INSERT INTO alerts (timestamp, threat_type, severity) VALUES (?, 'XSS', 'Medium')",
+                     [('2024-01-01 10:00:00',), ('2024-01-02 10:00:00',)])
+    conn.commit()
+    conn.close()
+    assert zock_app.migrate(path, retention_days=30) == 2
+    assert zock_app.migrate(path, retention_days=0) == 0
+
+    engine = ZOCKEngine(path, siem_targets=[], ai_model=False, retention_days=30, background=False)
+    try:
+        assert engine.partitions.expire() == []
+        assert engine.get_stats()['total_alerts'] == 2
+        engine.partitions.purge_legacy = True
+        assert engine.partitions.expire() == [LEGACY_TABLE]
+        assert engine.get_stats()['total_alerts'] == 0
+    finally:
+        engine.close()
+
+
+def test_stream_forwards_purges(client, engine):
+    chunks = iter(client.get('/api/alerts/stream', query_string={'last_id': 0}).response)
+    assert next(chunks).startswith(b'retry:')
+    threading.Timer(0.1, engine.changes.publish, ('purge', ['alerts_20240101'])).start()
+    assert next(chunks) == b'event: purge\ndata: ["alerts_20240101"]\n\n'
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from detectors import Rule, RuleSet, compile_pack
+from rulepack import RulePackError
+
+
+def write_pack(tmp_path, patterns):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({'name': 'test', 'rules': [
+        {'name': 'Quoted', 'patterns': [r"(['\"])select"]},
+        {'name': 'Repeated word', 'patterns': patterns},
+    ]}))
+    return str(path)
+
+
+@pytest.mark.parametrize('pattern', [r'\b(\w+) \1\b', r'(a)?(?(1)b|c)'])
+def test_numbered_group_references_are_rejected(tmp_path, pattern):
+    with pytest.raises(RulePackError, match='by number'):
+        compile_pack(write_pack(tmp_path, [pattern]))
+
+
+def test_named_backreference_survives_combining(tmp_path):
+    ruleset = compile_pack(write_pack(tmp_path, [r'\b(?P<word>\w+) (?P=word)\b'])).ruleset
+    assert [r.name for r in ruleset.match('GET /a b')] == []
+    assert [r.name for r in ruleset.match('GET /admin admin')] == ['Repeated word']
+    assert [r.name for r in ruleset.match("q='select select")] == ['Quoted', 'Repeated word']
+
+
+def test_octal_escapes_and_classes_are_not_references(tmp_path):
+    compile_pack(write_pack(tmp_path, [r'\0', r'\101', r'[\1]']))
+
+
+def test_combined_matcher_agrees_with_each_rule():
+    rules = [Rule('a', (r'(x)y',), 'low'), Rule('b', (r'x(?P<n>y)z',), 'low'), Rule('c', (r'yz$',), 'low')]
+    assert [r.name for r in RuleSet(rules).match('--xyz')] == ['a', 'b', 'c']
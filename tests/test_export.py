@@ -0,0 +1,79 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from export import EXPORT_COLUMNS, ExportError, export_chunks
+
+ALERTS = [
+    {'id': 2, 'timestamp': '2025-08-19 12:00:05', 'threat_type': 'SQL Injection', 'detection': 'SQL Injection',
+     'severity': 'High', 'source_ip': '10.0.0.2', 'entity': '10.0.0.2', 'owasp_category': 'A03',
+     'log_data': "GET /item?id=1 OR 1=1, \"quoted\"\nsecond line", 'ai_analysis': None, 'siem_sent': True,
+     'siem_platforms': '{"Splunk":"sent"}', 'ts': 1755604805, 'count': 3, 'last_ts': 1755604810,
+     'samples': ['a', 'b'], 'agg_key': 'token-1'},
+    {'id': 1, 'timestamp': '2025-08-19 12:00:00', 'threat_type': 'XSS', 'detection': 'XSS', 'severity': 'Medium',
+     'source_ip': None, 'entity': 'alice', 'owasp_category': None, 'log_data': '<script>é</script>',
+     'ai_analysis': 'benign', 'siem_sent': False, 'siem_platforms': 'Pending', 'ts': 1755604800, 'count': 1,
+     'last_ts': 1755604800, 'samples': [], 'agg_key': None},
+]
+
+
+def exported(alert):
+    """What an export keeps of an alert"""
+    return {c: alert[c] for c in EXPORT_COLUMNS}
+
+
+def decompress(data, compression):
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'zstd':
+        return pytest.importorskip('zstandard').ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def export(fmt, compression):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    return b''.join(export_chunks(iter(ALERTS), fmt, compression))
+
+
+@pytest.mark.parametrize('compression', ['none', 'gzip', 'zstd'])
+def test_ndjson_round_trip(compression):
+    text = decompress(export('ndjson', compression), compression).decode('utf-8')
+    assert [exported(json.loads(line)) for line in text.splitlines()] == [exported(a) for a in ALERTS]
+
+
+@pytest.mark.parametrize('compression', ['none', 'gzip', 'zstd'])
+def test_csv_round_trip(compression):
+    text = decompress(export('csv', compression), compression).decode('utf-8')
+    rows = list(csv.DictReader(io.StringIO(text, newline='')))
+    assert list(rows[0]) == list(EXPORT_COLUMNS)
+    assert [row['log_data'] for row in rows] == [a['log_data'] for a in ALERTS]
+    assert [row['siem_sent'] for row in rows] == ['1', '0']
+    assert [json.loads(row['samples']) for row in rows] == [['a', 'b'], []]
+    assert rows[1]['source_ip'] == ''
+
+
+@pytest.mark.parametrize('compression', ['none', 'gzip', 'zstd'])
+def test_parquet_round_trip(compression):
+    pq = pytest.importorskip('pyarrow.parquet')
+    table = pq.read_table(io.BytesIO(export('parquet', compression)))
+    rows = table.to_pylist()
+    expected = [dict(exported(a), samples=json.dumps(a['samples'], separators=(',', ':'))) for a in ALERTS]
+    assert rows == expected
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ExportError):
+        export_chunks(iter(ALERTS), 'xml')
+
+
+def test_api_export_streams_the_stored_alerts(client, engine):
+    engine.generate_sample_alerts(3)
+    response = client.get('/api/export', query_string={'format': 'ndjson', 'compression': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'].endswith('.ndjson.gz"')
+    ids = [json.loads(line)['id'] for line in gzip.decompress(response.get_data()).splitlines()]
+    assert ids == [a['id'] for a in engine.get_alerts(10)[0]]
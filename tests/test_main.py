@@ -0,0 +1,39 @@
+import json
+from datetime import datetime
+
+from anomaly import ANOMALY, WindowedZScore
+from main import detect, line_event
+
+
+def failure(ts, ip):
+    return json.dumps({'ts': ts, 'src_ip': ip, 'user': 'bob', 'msg': 'failed password for bob', 'service': 'ssh'})
+
+
+def test_replayed_log_is_scored_in_event_time_windows():
+    lines = []
+    for minute in range(3):  # three closed windows of ordinary failures build the baseline
+        for host in range(15):
+            for _ in range(1 + host % 2):
+                lines.append(failure(f'2025-08-19T11:{minute:02d}:{host:02d}Z', f'10.0.0.{host}'))
+    lines += [failure(f'2025-08-19T11:03:{s:02d}Z', '198.51.100.14') for s in range(12)]
+    anomalies = [a for a in detect(lines, WindowedZScore(window_seconds=60)) if a['detection'] == ANOMALY]
+    assert [(a['entity'], a['evidence']['login_count']) for a in anomalies] == [('198.51.100.14', 10)]
+    assert anomalies[0]['ts'] == '2025-08-19T11:03:09Z'
+
+
+def test_plain_lines_keep_the_time_they_record():
+    assert line_event('2025-08-19 11:59:00 sshd: failed password for user=bob from 10.0.0.1')['ts'] \
+        == '2025-08-19T11:59:00'
+    evt = line_event('Aug 19 11:59:00 host sshd[42]: invalid user from 10.0.0.1')
+    assert evt['ts'] == f'{datetime.now().year}-08-19T11:59:00'
+    assert evt['src_ip'] == '10.0.0.1'
+    before = datetime.now()
+    assert datetime.fromisoformat(line_event('failed password for root')['ts']) >= before.replace(microsecond=0)
+
+
+def test_rules_only_see_the_message_of_a_json_line():
+    line = json.dumps({'ts': '2025-08-19T11:59:00Z', 'src_ip': '10.0.0.1', 'user': "admin' OR 1=1 --",
+                       'service': 'select * from users', 'msg': 'session opened'})
+    assert list(detect([line], WindowedZScore())) == []
+    hit = json.dumps({'ts': '2025-08-19T11:59:00Z', 'src_ip': '10.0.0.1', 'msg': "GET /item?id=1 OR 1=1"})
+    assert [a['detection'] for a in detect([hit], WindowedZScore())] == ['Injection pattern']
@@ -0,0 +1,35 @@
+import pytest
+
+from partitions import AlertPartitions
+from storage import ConnectionPool
+
+
+@pytest.fixture
+def pools(tmp_path):
+    opened = []
+
+    def open_pool():
+        pool = ConnectionPool(str(tmp_path / 'zock.db'), max_readers=2)
+        opened.append(pool)
+        return pool
+
+    yield open_pool
+    for pool in opened:
+        pool.close()
+
+
+def test_current_recreates_a_partition_dropped_by_another_process(pools):
+    ours, theirs = AlertPartitions(pools()), AlertPartitions(pools())
+    ours.init_db()
+    dropped = []
+    ours.start_maintenance(3600, on_purge=dropped.append)
+    name = ours.current()
+    with theirs.pool.write() as conn:
+        theirs.drop(conn, [p.name for p in theirs.list(conn)])
+    assert ours.current() == name
+    assert dropped == [[name]]
+    with ours.pool.write() as conn:
+        conn.execute(f"INSERT INTO {ours.current()} (timestamp) VALUES ('2026-10-17 12:00:00')")
+        assert [p.name for p in ours.list(conn)] == [name]
+    ours.close()
+
@@ -0,0 +1,296 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from siem_forwarder import ElasticsearchBulk, SIEMForwarder, SplunkHEC
+
+
+class Receiver:
+    """Local stand-in for a SIEM ingestion endpoint.
+
+    Each POST is recorded and answered with the next (status, body) from
+    responses, then with ok(). While hold is clear, requests wait for it
+    before answering.
+    """
+
+    def __init__(self, ok, responses=()):
+        self.ok = ok
+        self.responses = list(responses)
+        self.requests = []
+        self.hold = threading.Event()
+        self.hold.set()
+        self.lock = threading.Lock()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                with receiver.lock:
+                    receiver.requests.append((self.path, body))
+                    response = receiver.responses.pop(0) if receiver.responses else None
+                receiver.hold.wait(10)
+                status, payload = response or (200, receiver.ok(body))
+                payload = payload.encode()
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.hold.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def splunk_ok(body):
+    return '{"text":"Success","code":0}'
+
+
+def bulk_ok(body):
+    n = len(body.splitlines()) // 2
+    return json.dumps({'errors': False, 'items': [{'index': {'status': 201}}] * n})
+
+
+def splunk_events(receiver):
+    return [json.loads(line)['event'] for _, body in receiver.requests for line in body.splitlines()]
+
+
+def bulk_documents(receiver):
+    return [json.loads(line) for _, body in receiver.requests for line in body.splitlines()[1::2]]
+
+
+class Store:
+    """Pending alerts in memory, with the fetch/record callbacks SIEMForwarder takes"""
+
+    def __init__(self, n):
+        self.alerts = [{'id': i, 'detection': 'SQL Injection', 'count': 1, 'agg_key': None, 'siem_sent': False}
+                       for i in range(1, n + 1)]
+        self.status = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, platform, after_id, limit):
+        with self.lock:
+            return [dict(a) for a in self.alerts
+                    if a['id'] > after_id and self.status.get(a['id']) != 'sent'][:limit]
+
+    def fetch_aggregates(self, platform, agg_keys):
+        with self.lock:
+            return [dict(a) for a in self.alerts
+                    if a.get('agg_key') in agg_keys and self.status.get(a['id']) != 'sent']
+
+    def record(self, platform, alerts, status):
+        with self.lock:
+            counts = {a['id']: a['count'] for a in self.alerts}
+            for alert in alerts:
+                if alert['count'] == counts[alert['id']]:  # like the engine, never for a stale count
+                    self.status[alert['id']] = status
+
+    def grow(self, alert_id, count):
+        """An aggregate's count grew: its row is pending again"""
+        with self.lock:
+            self.alerts[alert_id - 1]['count'] = count
+            self.status.pop(alert_id, None)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def forwarders():
+    started = []
+
+    def start(target, store, **options):
+        options = {'backoff': 0.01, 'max_backoff': 0.05, 'poll_interval': 0.05, **options}
+        forwarder = SIEMForwarder(target, store.fetch, store.record, fetch_aggregates=store.fetch_aggregates,
+                                  **options)
+        started.append(forwarder)
+        return forwarder
+
+    yield start
+    for forwarder in started:
+        forwarder.close()
+
+
+@pytest.fixture
+def receivers():
+    started = []
+
+    def start(ok, responses=()):
+        receiver = Receiver(ok, responses)
+        started.append(receiver)
+        return receiver
+
+    yield start
+    for receiver in started:
+        receiver.close()
+
+
+def test_splunk_delivery_records_sent(receivers, forwarders):
+    hec = receivers(splunk_ok)
+    store = Store(3)
+    forwarders(SplunkHEC(hec.url, 'token'), store)
+    wait_for(lambda: len(store.status) == 3)
+    assert set(store.status.values()) == {'sent'}
+    assert all(path == '/services/collector/event' for path, _ in hec.requests)
+    events = splunk_events(hec)
+    assert sorted(e['id'] for e in events) == [1, 2, 3]
+    assert all('siem_sent' not in e and 'agg_key' not in e for e in events)
+
+
+def test_elasticsearch_uses_alert_ids_as_document_ids(receivers, forwarders):
+    es = receivers(bulk_ok)
+    store = Store(2)
+    forwarders(ElasticsearchBulk(es.url), store)
+    wait_for(lambda: len(store.status) == 2)
+    actions = [json.loads(line) for _, body in es.requests for line in body.splitlines()[::2]]
+    assert [a['index']['_id'] for a in actions] == ['1', '2']
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_transient_errors_are_retried(receivers, forwarders, status):
+    hec = receivers(splunk_ok, [(status, '{"text":"busy"}')] * 2)
+    store = Store(2)
+    forwarder = forwarders(SplunkHEC(hec.url, 'token'), store)
+    wait_for(lambda: len(store.status) == 2)
+    assert set(store.status.values()) == {'sent'}
+    assert len(hec.requests) == 3
+    assert forwarder.metrics()['retries'] == 2
+
+
+def test_retries_give_up_after_max_retries(receivers, forwarders):
+    hec = receivers(splunk_ok, [(503, '{}')] * 10)
+    store = Store(1)
+    forwarders(SplunkHEC(hec.url, 'token'), store, max_retries=2)
+    wait_for(lambda: store.status.get(1) == 'failed')
+    assert len(hec.requests) == 3
+
+
+def test_rejected_batch_is_failed_without_retry(receivers, forwarders):
+    hec = receivers(splunk_ok, [(400, '{"text":"Invalid token"}')])
+    store = Store(2)
+    forwarder = forwarders(SplunkHEC(hec.url, 'token'), store)
+    wait_for(lambda: len(store.status) == 2)
+    assert set(store.status.values()) == {'failed'}
+    assert len(hec.requests) == 1
+    assert 'Invalid token' in forwarder.metrics()['last_error']
+
+
+def test_bulk_item_errors_fail_only_their_documents(receivers, forwarders):
+    items = [{'index': {'status': 201}}, {'index': {'status': 400, 'error': {'type': 'mapper_parsing_exception'}}},
+             {'index': {'status': 201}}, {'index': {'status': 429}}]
+    es = receivers(bulk_ok, [(200, json.dumps({'errors': True, 'items': items}))])
+    store = Store(4)
+    forwarders(ElasticsearchBulk(es.url), store)
+    wait_for(lambda: len(store.status) == 4 and store.status[4] == 'sent')
+    assert store.status == {1: 'sent', 2: 'failed', 3: 'sent', 4: 'sent'}
+    # Only the throttled document is sent again
+    assert [d['id'] for d in bulk_documents(es)] == [1, 2, 3, 4, 4]
+
+
+def test_rescan_skips_alerts_in_flight(receivers, forwarders):
+    hec = receivers(splunk_ok)
+    hec.hold.clear()
+    store = Store(3)
+    forwarder = forwarders(SplunkHEC(hec.url, 'token'), store, concurrency=1)
+    wait_for(lambda: len(hec.requests) == 1)
+    forwarder.retry_failed()
+    time.sleep(0.3)  # several dispatcher passes while the first batch is still unanswered
+    hec.hold.set()
+    wait_for(lambda: len(store.status) == 3)
+    time.sleep(0.2)
+    assert sorted(e['id'] for e in splunk_events(hec)) == [1, 2, 3]
+
+
+def test_rescan_offers_failed_alerts_again(receivers, forwarders):
+    hec = receivers(splunk_ok, [(400, '{}')])
+    store = Store(1)
+    forwarder = forwarders(SplunkHEC(hec.url, 'token'), store)
+    wait_for(lambda: store.status.get(1) == 'failed')
+    forwarder.retry_failed()
+    wait_for(lambda: store.status.get(1) == 'sent')
+    assert len(hec.requests) == 2
+
+
+def test_grown_aggregate_is_sent_again(receivers, forwarders):
+    es = receivers(bulk_ok)
+    store = Store(2)
+    store.alerts[1]['agg_key'] = 'token-7'
+    forwarder = forwarders(ElasticsearchBulk(es.url), store)
+    wait_for(lambda: len(store.status) == 2)
+    store.grow(2, 40)
+    forwarder.refresh(['token-7'])
+    wait_for(lambda: store.status.get(2) == 'sent')
+    actions = [json.loads(line)['index']['_id'] for _, body in es.requests for line in body.splitlines()[::2]]
+    assert actions == ['1', 'token-7', 'token-7']
+    assert [d['count'] for d in bulk_documents(es)] == [1, 1, 40]
+
+
+def test_aggregate_growing_in_flight_is_sent_again(receivers, forwarders):
+    hec = receivers(splunk_ok)
+    hec.hold.clear()
+    store = Store(1)
+    store.alerts[0]['agg_key'] = 'token-1'
+    forwarder = forwarders(SplunkHEC(hec.url, 'token'), store, concurrency=1)
+    wait_for(lambda: len(hec.requests) == 1)
+    store.grow(1, 5)
+    forwarder.refresh(['token-1'])
+    hec.hold.set()
+    wait_for(lambda: store.status.get(1) == 'sent')
+    events = splunk_events(hec)
+    assert [(e['agg_key'], e['count']) for e in events] == [('token-1', 1), ('token-1', 5)]
+
+
+def test_engine_flips_siem_sent_once_every_platform_has_it(receivers, tmp_path):
+    pytest.importorskip('flask')
+    from app import ZOCKEngine
+
+    hec, es = receivers(splunk_ok), receivers(bulk_ok)
+    engine = ZOCKEngine(str(tmp_path / 'zock.db'), siem_targets=[SplunkHEC(hec.url, 'token'),
+                                                                  ElasticsearchBulk(es.url)],
+                        ai_model=False, migrate=True)
+    try:
+        engine.generate_sample_alerts(3)
+        wait_for(lambda: all(a['siem_sent'] for a in engine.get_alerts_since(0)))
+        alerts = engine.get_alerts_since(0)
+        assert len(alerts) == 3
+        assert all(json.loads(a['siem_platforms']) == {'Splunk': 'sent', 'Elasticsearch': 'sent'}
+                   for a in alerts)
+        assert engine.get_stats()['siem_alerts'] == 3
+    finally:
+        engine.close()
+
+
+def test_sweep_sends_aggregates_another_process_grew(receivers):
+    hec = receivers(splunk_ok)
+    store = Store(2)
+    store.alerts[0]['agg_key'] = 'token-1'
+
+    def unsettled(platform, after_id, limit):
+        with store.lock:
+            return [dict(a) for a in store.alerts if a['id'] > after_id and a['id'] not in store.status][:limit]
+
+    forwarder = SIEMForwarder(SplunkHEC(hec.url, 'token'), store.fetch, store.record, fetch_unsettled=unsettled,
+                              poll_interval=0.05, sweep_interval=0.1)
+    try:
+        wait_for(lambda: len(store.status) == 2)
+        store.grow(1, 9)  # no refresh(): the growth is only in the store
+        wait_for(lambda: store.status.get(1) == 'sent')
+        assert [(e['id'], e['count']) for e in splunk_events(hec)] == [(1, 1), (2, 1), (1, 9)]
+    finally:
+        forwarder.close()
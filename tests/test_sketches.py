@@ -0,0 +1,22 @@
+from sketches import AlertSketches
+
+
+def test_users_are_only_counted_from_evidence():
+    sketches = AlertSketches()
+    sketches.add_alert({'detection': 'Injection pattern', 'entity': '10.0.0.5', 'ts': 1760700000,
+                        'evidence': {'src_ip': '10.0.0.5', 'user': None}})
+    sketches.add_alert({'detection': 'Brute force', 'entity': 'alice', 'ts': 1760700000,
+                        'evidence': {'src_ip': '10.0.0.6', 'user': 'alice'}})
+    distinct = sketches.summary()['distinct_by_detection']
+    assert distinct['Injection pattern'] == {'sources': 1, 'users': 0}
+    assert distinct['Brute force'] == {'sources': 1, 'users': 1}
+
+
+def test_dumps_round_trip():
+    sketches = AlertSketches()
+    for i in range(50):
+        sketches.add('Brute force', f'10.0.0.{i % 7}', f'user{i % 5}', 1760700000 + i * 600)
+    loaded = AlertSketches.loads(sketches.dumps())
+    assert loaded.summary() == sketches.summary()
+    loaded.add('Brute force', '10.0.0.99', 'user99', 1760700000)
+    assert loaded.summary()['distinct_by_detection']['Brute force'] == {'sources': 8, 'users': 6}
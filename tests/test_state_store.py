@@ -0,0 +1,70 @@
+from anomaly import WindowedZScore
+from state_store import StateStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    dropped = []
+    store = StateStore(3, on_drop=lambda key, value: dropped.append((key, value)))
+    for key in 'abc':
+        store.set(key, 1)
+    store.get('a')  # b is now the least recently used
+    store.add('d')
+    store.add('e')
+    assert dropped == [('b', 1), ('c', 1)]
+    assert list(store.items()) == [('a', 1), ('d', 1), ('e', 1)]
+    assert store.stats()['evictions'] == 2
+
+
+def test_entries_unused_for_ttl_expire():
+    clock, dropped = Clock(), []
+    store = StateStore(10, ttl=60, clock=clock, on_drop=lambda key, value: dropped.append(key))
+    store.add('old', 5)
+    clock.now += 30
+    store.add('new')
+    clock.now += 20
+    store.get('old')  # refreshed, so it outlives new
+    clock.now += 45
+    assert store.expire() == 1
+    assert dropped == ['new']
+    clock.now += 30
+    assert store.get('old') is None
+    assert dropped == ['new', 'old']
+    assert len(store) == 0 and store.stats()['expired'] == 2
+
+
+def test_spilled_entries_come_back_with_their_value_and_order(tmp_path):
+    path = str(tmp_path / 'state.db')
+    store = StateStore(2, spill=path)
+    for key in 'abcd':
+        store.add(key, ord(key))
+    store.flush()
+    assert store.stats()['entries_on_disk'] == 4
+    assert store.add('a') == ord('a') + 1
+    assert store.stats()['disk_hits'] == 1
+    store.flush()
+    store.close()
+
+    reopened = StateStore(2, spill=path)
+    assert len(reopened) == 4
+    reopened.add('e')
+    assert list(reopened.items()) == [('a', 98), ('b', 98), ('c', 99), ('d', 100), ('e', 1)]
+    reopened.close()
+
+
+def test_spilling_keeps_the_anomaly_baseline_intact():
+    events = [(f'10.0.{i % 7}.{i % 5}', i) for i in range(600)]
+    bounded = WindowedZScore(window_seconds=100, min_samples=3, max_entities=3, spill=True)
+    unbounded = WindowedZScore(window_seconds=100, min_samples=3)
+    for entity, ts in events:
+        assert bounded.observe(entity, ts) == unbounded.observe(entity, ts)
+    assert bounded.counts.stats()['disk_hits'] > 0
+    assert (bounded.n, bounded.mean, bounded.m2) == (unbounded.n, unbounded.mean, unbounded.m2)
+    assert dict(bounded.counts.items()) == dict(unbounded.counts.items())